@@ -0,0 +1,503 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from BinaryProtocol import (ENCODINGS, FRAME_ENCODERS, ProtocolError, decode_message, encoding_reply,
+                            requested_encoding)
+from BankrollLog import BankrollLog, open_log
+from BatchProtocol import handle_batch
+from CardRNG import table_seed
+from DeltaProtocol import UPDATES, DeltaEncoder, requested_updates, snapshot_message, updates_reply
+from Framing import RECV_SIZE, FrameDecoder, FrameError, encode_message
+from Heartbeat import HEARTBEAT_TYPES, MAX_OUTBOUND, PONG, Reaper
+from Metrics import Metrics, message_type, start_metrics_server
+from Serializer import error_message
+from SessionRecorder import CLOSED, RESUMED, SPECTATING, SessionRecorder
+from SmartServer import HOST, INVALID_FORMAT, PORT, SERVER_ERROR, BlackjackTable, new_history, new_shoe
+from Spectators import Broadcast
+
+# Errors only this server sends
+NO_RECOVERED_TABLE = error_message("No recovered table with that id")
+NO_OPEN_TABLE = error_message("No open table with that id")
+NO_TABLE_IDS = error_message("No table ids left on this server")
+
+# Table ids are 32-bit in the bankroll log, round history and session recordings
+MAX_TABLE_ID = 2 ** 32 - 1
+
+# Seconds between checks for round history staged too long on a quiet server
+HISTORY_FLUSH_INTERVAL = 0.25
+
+# Benchmark defaults
+BENCH_TABLES = 1000
+BENCH_ROUNDS = 20
+
+class ServerStats(Metrics):
+    """Counters shared by every table on the event loop"""
+
+    def __init__(self):
+        super().__init__()
+        self.next_table_id = 1  # Starts past any table recovered from the bankroll log
+        self.table_id_step = 1  # Worker processes sharing a port interleave their table ids
+        self.last_table_id = MAX_TABLE_ID  # Past it, clients are turned away instead of reusing an id
+        self.out_of_table_ids = False      # Set once a client was turned away for that
+
+    def summary(self):
+        """One-line summary of the server's activity"""
+        elapsed = time.perf_counter() - self.started
+        return (f"{self.tables_opened} tables served, {self.active_tables} active, "
+                f"{self.hands_played} hands in {elapsed:.1f}s")
+
+class Connection:
+    """One client's stream together with its framing and encoding state"""
+
+    def __init__(self, reader, writer, metrics=None):
+        self.reader = reader
+        self.writer = writer
+        self.decoder = FrameDecoder()
+        self.encode = encode_message  # Swapped once an encoding is negotiated
+        self.delta = None  # DeltaEncoder once the client asks for delta updates
+        self.watching = None  # Broadcast of the table this connection spectates, if it does
+        self.recording = None  # SessionRecorder.Recording of this session, if it is recorded
+        self.heartbeat = None  # Heartbeat.Heartbeat of its deadlines, once a Reaper watches it
+        self.metrics = metrics  # Counts bytes in and out, if given
+
+    async def send_message(self, message):
+        """Frame a message and send it to the client"""
+        frame = self.encode(message)
+        self.writer.write(frame)
+        if self.recording:
+            self.recording.sent(frame)
+        if self.metrics:
+            self.metrics.bytes_sent += len(frame)
+        heartbeat = self.heartbeat
+        if heartbeat and self.writer.transport.get_write_buffer_size() > MAX_OUTBOUND:
+            # Wait for the client to read, without reading its next messages meanwhile
+            heartbeat.blocked_since = time.monotonic()
+            try:
+                await self.writer.drain()
+            finally:
+                heartbeat.blocked_since = None
+        else:
+            await self.writer.drain()
+
+    async def read_payloads(self):
+        """Wait for data and return the frame payloads it completes ([] means keep reading)"""
+        data = await self.reader.read(RECV_SIZE)
+        if not data:
+            raise ConnectionResetError("Client disconnected")
+        if self.metrics:
+            self.metrics.bytes_received += len(data)
+        payloads = self.decoder.feed(data)
+        if self.heartbeat:
+            self.heartbeat.received(time.monotonic(), self.decoder.pending())
+        return payloads
+
+    def close(self):
+        self.writer.close()
+
+async def resume_table(table, client_message, connection, recovered):
+    """Hand a table recovered from the bankroll log to the client that asks for it by id"""
+    resumed = None
+    if recovered and table.hands_played == 0 and not table.in_turn():
+        resumed = recovered.pop(client_message.get("table"), None)
+    if resumed is None:
+        await connection.send_message(NO_RECOVERED_TABLE)
+        return table
+
+    if table.log:
+        table.log.close_table(table)  # The fresh table was never played
+    await connection.send_message(resumed.welcome_message())
+    return resumed
+
+async def spectate_table(table, client_message, connection, stats, tables):
+    """Turn a fresh connection into a spectator of another open table"""
+    watched = tables.get(client_message.get("table"))
+    if watched is None or watched is table or table.hands_played or table.in_turn():
+        await connection.send_message(NO_OPEN_TABLE)
+        return False
+
+    if table.log:
+        table.log.close_table(table)  # The fresh table was never played
+    if watched.spectators is None:
+        watched.spectators = Broadcast(watched, stats)
+    watched.spectators.add(connection)
+    connection.watching = watched.spectators
+    return True
+
+async def handle_payload(table, payload, connection, stats, recovered=None, tables=None):
+    """Decode one client message, apply it to the table and send the replies
+
+    Returns the table the connection plays on from now on, which only changes
+    when the client resumes a recovered table. A client that asks to spectate
+    gets connection.watching set instead.
+    """
+    start = time.perf_counter_ns()
+    kind = "error"
+    try:
+        client_message = decode_message(payload)
+
+        # Answer a ping; a pong only had to arrive, which read_payloads() noted
+        if client_message.get("type") in HEARTBEAT_TYPES:
+            if client_message["type"] == "ping":
+                await connection.send_message(PONG)
+            kind = client_message["type"]
+            return table
+        if connection.heartbeat:
+            connection.heartbeat.active = connection.heartbeat.heard
+
+        # Switch encodings after acknowledging in the current one
+        encoding = requested_encoding(client_message)
+        if encoding:
+            await connection.send_message(encoding_reply(encoding))
+            connection.encode = FRAME_ENCODERS[encoding]
+            kind = "encoding"
+            return table
+
+        updates = requested_updates(client_message)
+        if updates:
+            connection.delta = DeltaEncoder(table) if updates == "delta" else None
+            await connection.send_message(updates_reply(updates))
+            kind = "updates"
+            return table
+
+        if client_message.get("type") == "sync":
+            await connection.send_message(snapshot_message(table, connection.delta.seq if connection.delta else 0))
+            kind = "sync"
+            return table
+
+        if client_message.get("type") == "spectate":
+            kind = "spectate" if await spectate_table(table, client_message, connection, stats, tables or {}) \
+                else "error"
+            return table
+
+        if client_message.get("type") == "resume":
+            resumed = await resume_table(table, client_message, connection, recovered)
+            kind = "resume" if resumed is not table else "error"
+            if connection.delta:
+                connection.delta.watch(resumed)  # The client got its full state in the welcome
+            return resumed
+
+        hands_before = table.hands_played
+        if client_message.get("type") == "batch":
+            # Every message in the batch, answered in one frame
+            replies = [handle_batch(table, client_message, connection.delta)]
+        else:
+            replies = table.handle_message(client_message)
+            if connection.delta:
+                replies = [connection.delta.encode(reply) for reply in replies]
+        if table.log:
+            # Tables waiting here at the same time share one fsync
+            await table.log.wait_async(table.logged)
+        for reply in replies:
+            await connection.send_message(reply)
+        if table.spectators:
+            table.spectators.flush()  # Only once durable, like the player's replies
+        stats.hands_played += table.hands_played - hands_before
+        kind = message_type(client_message, replies)
+
+    except (json.JSONDecodeError, ProtocolError):
+        stats.error("decode")
+        await connection.send_message(INVALID_FORMAT)
+
+    except ConnectionError:
+        kind = None  # Nobody was waiting for a reply
+        raise
+
+    except Exception as e:
+        print(f"Error on table {table.table_id}: {e}")
+        stats.error("server")
+        await connection.send_message(SERVER_ERROR)
+
+    finally:
+        if kind:
+            stats.observe(kind, time.perf_counter_ns() - start)
+    return table
+
+def stop_recording(connection, reason=CLOSED):
+    """Finish the connection's recording, if it has one; a resumed or spectated table can't be replayed"""
+    if connection.recording:
+        connection.recording.stop(reason)
+        connection.recording = None
+
+async def handle_client(reader, writer, stats, decks=0, log=None, recovered=None, history=None, tables=None,
+                        seed=None, recorder=None, reaper=None):
+    """Run one table for one connected client, or let it spectate another table
+
+    tables maps the id of every open table to it, so spectators can find them.
+    The table's cards are seeded from seed and its id, if a seed is given.
+    With a SessionRecorder, the session is recorded for replay. With a
+    Reaper, a client that goes quiet, idle or stops reading is disconnected.
+    """
+    tables = {} if tables is None else tables
+    stats.connections += 1
+    if stats.next_table_id > stats.last_table_id:
+        # A reused id would mix two tables in the logs; a supervised worker is restarted with new ones
+        stats.out_of_table_ids = True
+        writer.write(encode_message(NO_TABLE_IDS))
+        writer.close()
+        return
+    stats.tables_opened += 1
+    stats.active_tables += 1
+    table_id = stats.next_table_id
+    cards_seed = table_seed(seed, table_id)
+    table = BlackjackTable(table_id=table_id, shoe=new_shoe(decks, cards_seed) if decks else None, log=log,
+                           history=history, seed=cards_seed)
+    stats.next_table_id += stats.table_id_step
+    if log:
+        log.open_table(table)
+    tables[table.table_id] = table
+    connection = Connection(reader, writer, stats)
+    if recorder:
+        connection.recording = recorder.start(table, decks)
+    if reaper:
+        reaper.add(connection)
+    shutting_down = False
+
+    try:
+        await connection.send_message(table.welcome_message())
+
+        while not table.is_finished() and not connection.watching:
+            # Wait for the next messages from client, possibly several in one read
+            for payload in await connection.read_payloads():
+                if connection.recording:
+                    connection.recording.received(payload)
+                played = table
+                table = await handle_payload(table, payload, connection, stats, recovered, tables)
+                if table is not played:
+                    # Resumed: spectators find it under its own id
+                    tables.pop(played.table_id, None)
+                    tables[table.table_id] = table
+                    stop_recording(connection, RESUMED)
+                if connection.watching:
+                    stop_recording(connection, SPECTATING)
+                if table.is_finished() or connection.watching:
+                    break
+
+        if connection.watching:
+            # A spectator has no table of its own, and may watch without a word
+            if connection.heartbeat:
+                connection.heartbeat.idle_allowed = True
+            tables.pop(table.table_id, None)
+            stats.active_tables -= 1
+            await connection.watching.watch(connection)
+        else:
+            # Game over - a player is out of money
+            game_over = table.game_over_message()
+            if table.spectators:
+                table.spectators.publish([game_over])
+            await connection.send_message(game_over)
+
+    except FrameError:
+        stats.error("framing")
+
+    except ConnectionError:
+        pass
+
+    except asyncio.CancelledError:
+        shutting_down = True  # stop_server() ends the session; the table stays open in the log
+        raise
+
+    finally:
+        if not connection.watching:
+            # A table that ends with its client is done; only a crash or shutdown leaves it open for recovery
+            tables.pop(table.table_id, None)
+            if table.spectators and not shutting_down:
+                table.spectators.close()
+            if table.log and not shutting_down:
+                table.log.close_table(table)
+            stats.active_tables -= 1
+        stop_recording(connection)
+        if reaper:
+            reaper.remove(connection)
+        connection.close()
+
+async def serve(host=HOST, port=PORT, stats=None, decks=0, log=None, recovered=None, history=None,
+                reuse_port=False, seed=None, recorder=None):
+    """Start the multi-table server and return the asyncio server object
+
+    recovered maps table ids to tables rebuilt from the bankroll log, which
+    clients can take back with a {"type": "resume", "table": id} message.
+    Every table appends its settled hands to history, if given. A client
+    can watch any open table with {"type": "spectate", "table": id}. With
+    reuse_port, several processes can listen on the same port and the kernel
+    spreads new connections across them. With a seed, table N deals the
+    same cards whenever the server runs. With a SessionRecorder, every
+    session is recorded for SessionRecorder.replay(). Every connection is
+    pinged when quiet and reaped once stuck (Heartbeat.py).
+    """
+    stats = stats or ServerStats()
+    tables = {}  # Table id -> open table, for spectators
+    reaper = Reaper(stats)
+    if recovered:
+        stats.next_table_id = max(stats.next_table_id, max(recovered) + 1)
+        for table in recovered.values():
+            table.history = history
+    handlers = set()  # Running handle_client tasks, for stop_server()
+
+    async def handle(reader, writer):
+        task = asyncio.current_task()
+        handlers.add(task)
+        try:
+            await handle_client(reader, writer, stats, decks, log, recovered, history, tables, seed, recorder, reaper)
+        except asyncio.CancelledError:
+            pass  # Ended by stop_server(); asyncio would otherwise log the cancelled session as an error
+        finally:
+            handlers.discard(task)
+
+    server = await asyncio.start_server(handle, host, port, backlog=4096, reuse_port=reuse_port or None)
+    server.handlers = handlers
+    server.history_flusher = asyncio.get_running_loop().create_task(flush_history(history)) if history else None
+    return server
+
+async def flush_history(history):
+    """Publish staged round history once it is old enough, as hands stop coming on a quiet server"""
+    while True:
+        await asyncio.sleep(HISTORY_FLUSH_INTERVAL)
+        history.flush_due()
+
+async def stop_server(server):
+    """Stop accepting clients and end every session, so each one's last records are written
+
+    Call it before closing the bankroll log, round history or recorder the
+    server was given: the handlers still write to them as they finish.
+    """
+    server.close()
+    for task in list(server.handlers):
+        task.cancel()
+    await asyncio.gather(*server.handlers, return_exceptions=True)
+    if server.history_flusher:
+        server.history_flusher.cancel()
+    await server.wait_closed()
+
+async def main(host=HOST, port=PORT, decks=0, log_path=None, history_dir=None, metrics_port=None, seed=None,
+               record_path=None, record_replies=False):
+    """Run the multi-table server until interrupted"""
+    stats = ServerStats()
+    if metrics_port is not None:
+        start_metrics_server(stats, port=metrics_port)
+    log, recovered = None, None
+    if log_path:
+        log, recovery = open_log(log_path, decks=decks, seed=seed)
+        recovered = recovery.tables
+        print(recovery.report())
+    history = new_history(history_dir, decks) if history_dir else None
+    recorder = SessionRecorder(record_path, record_replies) if record_path else None
+    server = await serve(host, port, stats, decks, log, recovered, history, seed=seed, recorder=recorder)
+    print(f"Async server running on {host}:{port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await stop_server(server)
+        print(stats.summary())
+        if log:
+            log.close()
+        if history:
+            history.close()
+        if recorder:
+            recorder.close()
+
+async def bench_table(host, port, rounds, encoding, updates="full"):
+    """Play a fixed number of rounds on one table, always standing"""
+    connection = Connection(*await asyncio.open_connection(host, port))
+    received = []
+
+    async def receive():
+        while not received:
+            received.extend(await connection.read_payloads())
+        return decode_message(received.pop(0))
+
+    welcome = await receive()
+    money = [welcome["player1_money"], welcome["player2_money"]]
+    if encoding != "json":
+        await connection.send_message({"type": "encoding", "encoding": encoding})
+        await receive()
+        connection.encode = FRAME_ENCODERS[encoding]
+    if updates != "full":
+        await connection.send_message({"type": "updates", "mode": updates})
+        await receive()
+
+    hands = 0
+    for _ in range(rounds):
+        for player in (1, 2):
+            await connection.send_message({"type": "bet", "amount": 25, "player": player})
+            await receive()  # Game state
+            await connection.send_message({"action": "stand", "player": player})
+            reply = await receive()
+            hands += 1
+        if "changes" in reply:
+            money = [before + change for before, change in zip(money, reply["changes"])]  # Delta settlement
+        else:
+            money = [reply["player1_money"], reply["player2_money"]]
+        if min(money) <= 0:
+            break
+    connection.close()
+    return hands
+
+async def bench(tables=BENCH_TABLES, rounds=BENCH_ROUNDS, encoding="json", decks=0, host=HOST, port=0,
+                log_path=None, history_dir=None, updates="full", record_path=None, record_replies=False):
+    """Measure concurrent tables and hands/second with in-process clients"""
+    stats = ServerStats()
+    log = BankrollLog(log_path) if log_path else None
+    history = new_history(history_dir, decks) if history_dir else None
+    recorder = SessionRecorder(record_path, record_replies) if record_path else None
+    server = await serve(host, port, stats, decks, log, history=history, recorder=recorder)
+    port = server.sockets[0].getsockname()[1]
+
+    start = time.perf_counter()
+    hands = await asyncio.gather(*(bench_table(host, port, rounds, encoding, updates) for _ in range(tables)))
+    elapsed = time.perf_counter() - start
+
+    server.close()
+    await server.wait_closed()
+    total = sum(hands)
+    print(f"{tables} concurrent {encoding} tables ({updates} updates), {total} hands in {elapsed:.2f}s: "
+          f"{total / elapsed:.0f} hands/s (server and clients on one event loop), "
+          f"{stats.bytes_sent / max(total, 1):.0f} bytes sent per hand")
+    if history:
+        history.close()
+        print(f"Round history: {history.count:,} hands recorded in {history_dir}")
+    if recorder:
+        while stats.active_tables:
+            await asyncio.sleep(0.01)  # Let every session finish its recording
+        recorder.close()
+        print(f"Session recording: {recorder.sessions:,} sessions, {recorder.records:,} records, "
+              f"{os.path.getsize(record_path) / max(total, 1):.0f} bytes per hand in {record_path}")
+    if log:
+        while stats.active_tables:
+            await asyncio.sleep(0.01)  # Let every table log its close
+        log.close()
+        print(f"Bankroll log: {log.appended} records, {log.fsyncs} fsyncs "
+              f"({log.appended / max(log.fsyncs, 1):.1f} records per fsync)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-table asyncio blackjack server")
+    parser.add_argument("--decks", type=int, default=0, help="deal from an N-deck shoe (default: infinite deck)")
+    parser.add_argument("--bench", action="store_true", help="benchmark with in-process clients and exit")
+    parser.add_argument("--tables", type=int, default=BENCH_TABLES, help="concurrent tables for --bench")
+    parser.add_argument("--rounds", type=int, default=BENCH_ROUNDS, help="rounds per table for --bench")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json", help="encoding for --bench")
+    parser.add_argument("--updates", choices=UPDATES, default="full", help="update mode for --bench")
+    parser.add_argument("--log", metavar="PATH", help="bankroll log to recover from and write to")
+    parser.add_argument("--history", metavar="DIR", help="append every settled hand to this round history")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--seed", type=int, help="seed every table's cards from this and its id (default: random)")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record every session to PATH, for python SessionRecorder.py PATH to replay")
+    parser.add_argument("--record-replies", action="store_true",
+                        help="keep the reply bytes in the recording, so replay can show where replies differ")
+    args = parser.parse_args()
+
+    if args.bench:
+        asyncio.run(bench(args.tables, args.rounds, args.encoding, args.decks, log_path=args.log,
+                          history_dir=args.history, updates=args.updates, record_path=args.record,
+                          record_replies=args.record_replies))
+    else:
+        try:
+            asyncio.run(main(decks=args.decks, log_path=args.log, history_dir=args.history,
+                             metrics_port=args.metrics_port, seed=args.seed, record_path=args.record,
+                             record_replies=args.record_replies))
+        except KeyboardInterrupt:
+            print("\nServer shutdown by user")
@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+
+from CardRNG import table_seed
+from SmartServer import BlackjackTable, new_shoe
+
+# Default location of the log, next to this file
+LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bankroll.log")
+
+# Seconds the flusher waits for more records before each fsync (0: batch whatever piled up during the last one)
+GROUP_DELAY = 0.0
+
+# Every record is framed with a checksum so a write torn by a crash is detected on replay
+FRAME = struct.Struct("<IH")                  # CRC32 of the body, body length
+OPEN_RECORD = struct.Struct("<BIqq")          # kind, table, player 1 money, player 2 money
+MESSAGE_RECORD = struct.Struct("<BIBBiqq")    # kind, table, action, player, bet, money afterwards; cards follow
+CLOSE_RECORD = struct.Struct("<BI")           # kind, table
+
+# Record kinds
+OPEN = 1
+MESSAGE = 2
+CLOSE = 3
+
+# Message actions
+ACTIONS = {"bet": 1, "hit": 2, "stand": 3}
+ACTION_NAMES = {code: name for name, code in ACTIONS.items()}
+
+def frame(body, header=FRAME):
+    """Checksummed record as written to the log"""
+    return header.pack(zlib.crc32(body), len(body)) + body
+
+def open_record(table):
+    """Record of a table starting out with its current bankrolls"""
+    return OPEN_RECORD.pack(OPEN, table.table_id, table.player1_money, table.player2_money)
+
+def message_record(table, action, player, amount=0):
+    """Record of one accepted bet/hit/stand, the cards it dealt and the bankrolls afterwards"""
+    body = MESSAGE_RECORD.pack(MESSAGE, table.table_id, ACTIONS[action], 1 if player == 1 else 2, amount,
+                               table.player1_money, table.player2_money) + bytes(table.dealt)
+    table.dealt.clear()
+    return body
+
+def replay_message(action, player, amount):
+    """The client message a record was written for"""
+    if action == "bet":
+        return {"type": "bet", "amount": amount, "player": player}
+    return {"action": action, "player": player}
+
+class BankrollLog:
+    """Append-only write-ahead log of every table's bets, cards and bankrolls
+
+    Tables append records as they handle messages; a flusher thread writes
+    whatever has piled up and makes it durable with one fsync, so many
+    tables waiting at once share a single fsync (group commit). Callers wait
+    for their record's sequence number before replying to the client.
+    """
+
+    def __init__(self, path=LOG_PATH, group_delay=GROUP_DELAY):
+        self.path = path
+        self.group_delay = group_delay
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.pending = bytearray()
+        self.appended = 0   # Sequence number of the last record appended
+        self.durable = 0    # Sequence number of the last record known to be on disk
+        self.fsyncs = 0
+        self.waiters = []   # (sequence number, event loop, future) of asyncio callers
+        self.closed = False
+        self.condition = threading.Condition()
+        self.flusher = threading.Thread(target=self.flush_loop, name="bankroll-log", daemon=True)
+        self.flusher.start()
+
+    def append(self, body):
+        """Queue a record for the next group commit and return its sequence number"""
+        with self.condition:
+            self.pending += frame(body)
+            self.appended += 1
+            self.condition.notify_all()
+            return self.appended
+
+    def open_table(self, table):
+        return self.append(open_record(table))
+
+    def close_table(self, table):
+        return self.append(CLOSE_RECORD.pack(CLOSE, table.table_id))
+
+    def record(self, table, action, player, amount=0):
+        """Log a message the table accepted (called by BlackjackTable)"""
+        return self.append(message_record(table, action, player, amount))
+
+    def wait(self, sequence):
+        """Block until the record with this sequence number is durable"""
+        with self.condition:
+            while self.durable < sequence:
+                self.condition.wait()
+
+    async def wait_async(self, sequence):
+        """Wait on the event loop until the record with this sequence number is durable"""
+        if self.durable >= sequence:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.condition:
+            if self.durable >= sequence:
+                return
+            self.waiters.append((sequence, loop, future))
+        await future
+
+    def flush_loop(self):
+        """Flusher thread: write and fsync everything appended since the last commit"""
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return  # Closed with nothing left to write
+            if self.group_delay:
+                time.sleep(self.group_delay)  # Let more records join this commit
+
+            with self.condition:
+                data = bytes(self.pending)
+                self.pending.clear()
+                sequence = self.appended
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self.fd, view):]
+            fsync(self.fd)
+
+            with self.condition:
+                self.durable = sequence
+                self.fsyncs += 1
+                ready = [waiter for waiter in self.waiters if waiter[0] <= sequence]
+                self.waiters = [waiter for waiter in self.waiters if waiter[0] > sequence]
+                self.condition.notify_all()
+            for _, loop, future in ready:
+                loop.call_soon_threadsafe(resolve, future)
+
+    def close(self):
+        """Commit anything still pending and close the file"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.flusher.join()
+        os.close(self.fd)
+
+def fsync(fd):
+    """Make written data durable, skipping metadata-only updates where the OS allows"""
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+def resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+def read_records(path, header=FRAME):
+    """Yield (end offset, body) for every intact record, stopping at the first torn or corrupt one
+
+    header is the checksum and length struct the records were framed with.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    offset = 0
+    while offset + header.size <= len(data):
+        checksum, length = header.unpack_from(data, offset)
+        body = data[offset + header.size:offset + header.size + length]
+        if len(body) < length or zlib.crc32(body) != checksum:
+            return
+        offset += header.size + length
+        yield offset, body
+
+class Recovery:
+    """Tables rebuilt from a log, with what it took to rebuild them"""
+
+    def __init__(self):
+        self.tables = {}        # Table id -> BlackjackTable, including any hand in play
+        self.round_start = {}   # Table id -> open record with the bankrolls before the current round
+        self.round_records = {} # Table id -> message records of the current round
+        self.records = 0
+        self.valid_bytes = 0
+        self.torn_bytes = 0
+        self.mismatches = 0     # Records whose logged bankrolls differed from the replayed ones
+        self.seconds = 0.0
+
+    def report(self):
+        in_play = sum(table.in_turn() for table in self.tables.values())
+        return (f"Replayed {self.records:,} records ({self.valid_bytes / 1024 / 1024:.2f} MB) in "
+                f"{self.seconds * 1000:.1f} ms: {len(self.tables)} tables, {in_play} with a hand in play, "
+                f"{self.torn_bytes} torn bytes dropped, {self.mismatches} bankroll mismatches")
+
+def recover(path=LOG_PATH, seed=None):
+    """Rebuild every open table by replaying its logged messages with the logged cards
+
+    Each table then deals from its own stream seeded from seed and its id,
+    like a new table on a server started with that seed.
+    """
+    start = time.perf_counter()
+    recovery = Recovery()
+    tables = recovery.tables
+
+    for offset, body in read_records(path):
+        kind = body[0]
+        if kind == OPEN:
+            _, table_id, money1, money2 = OPEN_RECORD.unpack(body)
+            table = BlackjackTable(table_id, seed=table_seed(seed, table_id))
+            table.player1_money, table.player2_money = money1, money2
+            tables[table_id] = table
+            recovery.round_start[table_id] = body
+            recovery.round_records[table_id] = []
+
+        elif kind == MESSAGE:
+            _, table_id, action, player, amount, money1, money2 = MESSAGE_RECORD.unpack_from(body)
+            table = tables[table_id]
+            action = ACTION_NAMES[action]
+
+            # A new round starts with player 1's bet; compaction keeps only the current round
+            if action == "bet" and player == 1:
+                recovery.round_start[table_id] = open_record(table)
+                recovery.round_records[table_id] = []
+            recovery.round_records[table_id].append(body)
+
+            # Same message, same cards, same result
+            table.deal = iter(body[MESSAGE_RECORD.size:]).__next__
+            table.handle_message(replay_message(action, player, amount))
+            if (table.player1_money, table.player2_money) != (money1, money2):
+                recovery.mismatches += 1
+                table.player1_money, table.player2_money = money1, money2
+
+        elif kind == CLOSE:
+            _, table_id = CLOSE_RECORD.unpack(body)
+            tables.pop(table_id, None)
+            recovery.round_start.pop(table_id, None)
+            recovery.round_records.pop(table_id, None)
+
+        recovery.records += 1
+        recovery.valid_bytes = offset
+
+    for table in tables.values():
+        table.deal = table.cards.deal  # Back to the table's own cards
+    if os.path.exists(path):
+        recovery.torn_bytes = os.path.getsize(path) - recovery.valid_bytes
+    recovery.seconds = time.perf_counter() - start
+    return recovery
+
+def compact(path, recovery):
+    """Rewrite the log as just the open tables' current rounds, replacing the file atomically"""
+    temporary = path + ".compact"
+    with open(temporary, "wb") as f:
+        for table_id, start in recovery.round_start.items():
+            f.write(frame(start))
+            for body in recovery.round_records[table_id]:
+                f.write(frame(body))
+        f.flush()
+        fsync(f.fileno())
+    os.replace(temporary, path)
+
+    # Make the rename itself durable
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+def open_log(path=LOG_PATH, group_delay=GROUP_DELAY, decks=0, seed=None):
+    """Recover the tables in a log, compact it and reopen it for appending
+
+    Returns (log, recovery); the recovered tables already write to the new log
+    and deal from a fresh shoe if decks is given (shoe order isn't logged),
+    shuffled with the same seed as their cards.
+    """
+    recovery = recover(path, seed)
+    if os.path.exists(path):
+        compact(path, recovery)
+    log = BankrollLog(path, group_delay)
+    for table in recovery.tables.values():
+        table.log = log
+        if decks:
+            table.shoe = new_shoe(decks, table.cards.seed)
+            table.deal = table.shoe.deal
+    return log, recovery
+
+def play_random_rounds(log, tables, rounds, seed=0):
+    """Fill a log with random rounds on many tables, as the server would"""
+    rng = random.Random(seed)
+    live = [BlackjackTable(table_id, log=log) for table_id in range(1, tables + 1)]
+    for table in live:
+        log.open_table(table)
+    for _ in range(rounds):
+        for table in live:
+            if table.is_finished():
+                continue
+            for player in (1, 2):
+                money = table.player1_money if player == 1 else table.player2_money
+                table.handle_message({"type": "bet", "amount": min(5, money), "player": player})
+                while table.in_turn():
+                    action = "hit" if table.player_hand.value < rng.choice((12, 15, 17)) else "stand"
+                    table.handle_message({"action": action, "player": player})
+    # Leave one hand in play so recovery has something in flight
+    in_play = next((table for table in live if not table.is_finished()), None)
+    if in_play:
+        in_play.handle_message({"type": "bet", "amount": 1, "player": 1})
+    return live, in_play
+
+def bench_recovery(path, sizes, tables=100):
+    """Time recovery against log size, checking the rebuilt bankrolls against the live tables"""
+    print(f"{'records':>10}{'MB':>8}{'replay ms':>11}{'records/s':>13}{'compacted KB':>14}")
+    for rounds in sizes:
+        if os.path.exists(path):
+            os.remove(path)
+        log = BankrollLog(path)
+        live, in_play = play_random_rounds(log, tables, rounds)
+        log.close()
+
+        recovery = recover(path)
+        for table in live:
+            rebuilt = recovery.tables[table.table_id]
+            if (rebuilt.player1_money, rebuilt.player2_money) != (table.player1_money, table.player2_money):
+                raise AssertionError(f"Table {table.table_id} recovered with the wrong bankrolls")
+        if in_play and not recovery.tables[in_play.table_id].in_turn():
+            raise AssertionError("The hand in play was not recovered")
+
+        compact(path, recovery)
+        print(f"{recovery.records:>10,}{recovery.valid_bytes / 1024 / 1024:>8.2f}{recovery.seconds * 1000:>11.1f}"
+              f"{recovery.records / recovery.seconds:>13,.0f}{os.path.getsize(path) / 1024:>14.1f}")
+    os.remove(path)
+
+async def bench_commit(path, writers, records):
+    """Records/s and fsyncs when writers each wait for durability before their next record"""
+    if os.path.exists(path):
+        os.remove(path)
+    log = BankrollLog(path)
+    table = BlackjackTable()
+
+    async def writer():
+        for _ in range(records):
+            await log.wait_async(log.open_table(table))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(writers)))
+    elapsed = time.perf_counter() - start
+    log.close()
+    os.remove(path)
+    total = writers * records
+    print(f"{writers:>8} writers: {total / elapsed:>10,.0f} durable records/s, "
+          f"{log.fsyncs:>6} fsyncs ({total / log.fsyncs:.1f} records per fsync)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or benchmark the bankroll write-ahead log")
+    parser.add_argument("path", nargs="?", default=LOG_PATH)
+    parser.add_argument("--bench", action="store_true", help="benchmark group commit and recovery time")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench_path = args.path + ".bench"
+        for writers in (1, 10, 100, 1000):
+            asyncio.run(bench_commit(bench_path, writers, max(20, 2000 // writers)))
+        print()
+        bench_recovery(bench_path, (10, 100, 1000, 4000))
+    else:
+        recovery = recover(args.path)
+        print(recovery.report())
+        for table_id, table in sorted(recovery.tables.items()):
+            state = f", player {table.player_num} in play" if table.in_turn() else ""
+            print(f"  table {table_id}: ${table.player1_money} / ${table.player2_money}{state}")
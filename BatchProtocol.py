@@ -0,0 +1,92 @@
+from Serializer import error_message
+
+# A batch is at most this many messages; a full round of both seats is four
+MAX_BATCH = 64
+
+# Strategies a "play" message can ask the server to play a hand with
+STRATEGIES = ["stand", "threshold", "basic"]
+STAND_ON = 17  # Stand value for the threshold strategy
+
+# Errors a batch can stop at
+BATCH_SIZE_ERROR = error_message(f"A batch needs 1-{MAX_BATCH} messages")
+INVALID_IN_BATCH = error_message("Invalid message in batch")
+UNKNOWN_STRATEGY = error_message(f"Unknown strategy. Use one of {', '.join(STRATEGIES)}.")
+NO_HAND_IN_PLAY = error_message("No hand in play for that player")
+
+def choose_action(strategy, hand_value, hand, upcard, stand_on=STAND_ON):
+    """Decide hit or stand for an automated player"""
+    if strategy == "stand":
+        return "stand"
+    if strategy == "threshold":
+        return "hit" if hand_value < stand_on else "stand"
+    from StrategyTable import get_table  # Only loaded when the basic strategy is used
+    return get_table().advise(hand, upcard)
+
+def batch_message(messages):
+    """Several messages in one frame, in either direction"""
+    return {"type": "batch", "messages": messages}
+
+def play_message(player, strategy="basic", stand_on=STAND_ON):
+    """Ask the server to hit or stand for a seat until its hand is over"""
+    return {"type": "play", "player": player, "strategy": strategy, "stand_on": stand_on}
+
+def round_messages(bets, strategy="basic", stand_on=STAND_ON):
+    """A whole round as one batch: each seat bets, then plays its hand with the strategy"""
+    messages = []
+    for player, amount in zip((1, 2), bets):
+        messages.append({"type": "bet", "amount": amount, "player": player})
+        messages.append(play_message(player, strategy, stand_on))
+    return messages
+
+def frozen(reply):
+    """A reply with its own copies of the hands
+
+    Hands go out as the table's own lists (Hand.to_list), which later
+    messages in the same batch keep adding cards to.
+    """
+    return {key: list(value) if isinstance(value, list) else value for key, value in reply.items()}
+
+def play_hand(table, message):
+    """Hit or stand with the message's strategy until the hand in turn is over"""
+    strategy = message.get("strategy", "basic")
+    stand_on = message.get("stand_on", STAND_ON)
+    if strategy not in STRATEGIES or not isinstance(stand_on, int):
+        return [UNKNOWN_STRATEGY]
+    if not table.in_turn() or message.get("player", table.player_num) != table.player_num:
+        return [NO_HAND_IN_PLAY]
+
+    replies = []
+    while table.in_turn():
+        hand = table.player_hand
+        action = choose_action(strategy, hand.value, hand.to_list(), table.dealer_hand[0], stand_on)
+        replies.extend(frozen(reply)
+                       for reply in table.handle_message({"action": action, "player": table.player_num}))
+    return replies
+
+def handle_batch(table, batch, delta=None):
+    """Apply a batch's messages to the table in order and return one combined reply
+
+    Each message gets the replies it would get on its own, and "play"
+    messages get one per action the server took. The batch stops at the
+    first error, since the rest were meant for a table in another state,
+    and once the table is finished. With a DeltaEncoder the replies are
+    numbered deltas, encoded as they happen.
+    """
+    messages = batch.get("messages")
+    if not isinstance(messages, list) or not 0 < len(messages) <= MAX_BATCH:
+        return BATCH_SIZE_ERROR
+
+    replies = []
+    for message in messages:
+        if not isinstance(message, dict) or message.get("type") == "batch":
+            step = [INVALID_IN_BATCH]
+        elif message.get("type") == "play":
+            step = play_hand(table, message)
+        else:
+            step = [frozen(reply) for reply in table.handle_message(message)]
+        if delta:
+            step = [delta.encode(reply) for reply in step]
+        replies.extend(step)
+        if table.is_finished() or any(reply.get("type") == "error" for reply in step):
+            break
+    return batch_message(replies)
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import json
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import timeit
+
+import AsyncServer
+import BinaryProtocol
+import Framing
+from Hand import Hand
+from Metrics import Metrics
+from SmartServer import BlackjackTable, HOST, INVALID_BET, calculate_hand_value, deal_card, run_server
+
+# Benchmark settings
+REPEATS = 7              # Timing runs per benchmark; the minimum is the headline number
+MIN_RUN_TIME = 0.2       # Seconds each timing run should last at least
+LOOPBACK_ROUNDS = 300    # Rounds per timing run of the end-to-end benchmarks
+REGRESSION_LIMIT = 1.10  # Slowdown ratio --compare reports as a regression
+OUTPUT_PATH = "bench_results.json"
+
+# Representative messages, as run_server produces them
+GAME_STATE = {"type": "game_state", "player_hand": [10, 6], "player_value": 16, "dealer_visible": [9], "bet": 100}
+FINAL_RESULT = {"type": "result", "player1_hand": [10, 9], "player1_value": 19, "player2_hand": [11, 7],
+                "player2_value": 18, "dealer_hand": [9, 8], "dealer_value": 17, "player1_result": "win",
+                "player2_result": "win", "player1_money": 2100, "player2_money": 2100,
+                "message": "Dealer: 17, Player 1 wins!, Player 2 wins!"}
+
+def free_port():
+    """An unused local port for a benchmark server"""
+    with socket.socket() as probe:
+        probe.bind((HOST, 0))
+        return probe.getsockname()[1]
+
+def time_micro(function):
+    """Nanoseconds per call: each run is sized to MIN_RUN_TIME, then repeated"""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(number, int(number * MIN_RUN_TIME / 0.2))
+    runs = timer.repeat(repeat=REPEATS, number=number)
+    return [run / number * 1e9 for run in runs], number
+
+def micro_benchmarks():
+    """Benchmarks of the hot-path functions in isolation"""
+    random.seed(1)
+    hands = {
+        "calculate_hand_value/2 cards": [10, 7],
+        "calculate_hand_value/soft 5 cards": [11, 2, 3, 11, 4],
+    }
+    json_frame = Framing.encode_message(FINAL_RESULT)
+    binary_frame = BinaryProtocol.encode_message(FINAL_RESULT)
+    many_frames = json_frame * 32
+    json_payload = json_frame[Framing.HEADER.size:]
+    binary_payload = binary_frame[Framing.HEADER.size:]
+
+    def play_table_round():
+        table = BlackjackTable()
+        for player in (1, 2):
+            table.handle_message({"type": "bet", "amount": 25, "player": player})
+            table.handle_message({"action": "hit", "player": player})
+            if table.in_turn():
+                table.handle_message({"action": "stand", "player": player})
+
+    def build_hand():
+        hand = Hand()
+        for card in (11, 2, 3, 11, 4):
+            hand.add(card)
+        return hand.value
+
+    metrics = Metrics()
+    benchmarks = {name: (lambda hand=hand: calculate_hand_value(hand)) for name, hand in hands.items()}
+    benchmarks.update({
+        "hand/add + value soft 5 cards": build_hand,
+        "deal_card": deal_card,
+        "encode/json game_state": lambda: Framing.encode_message(GAME_STATE),
+        "encode/json result": lambda: Framing.encode_message(FINAL_RESULT),
+        "encode/json static error": lambda: Framing.encode_message(INVALID_BET),
+        "encode/binary game_state": lambda: BinaryProtocol.encode_message(GAME_STATE),
+        "encode/binary result": lambda: BinaryProtocol.encode_message(FINAL_RESULT),
+        "decode/json result": lambda: BinaryProtocol.decode_message(json_payload),
+        "decode/binary result": lambda: BinaryProtocol.decode_message(binary_payload),
+        "framing/feed 32 frames": lambda: Framing.FrameDecoder().feed(many_frames),
+        "table/round in process": play_table_round,
+        "metrics/observe": lambda: metrics.observe("hit", 48_000),
+    })
+    return benchmarks
+
+def play_rounds(connection, rounds):
+    """Play bet -> hit -> stand for both seats, as a blocking client"""
+    for _ in range(rounds):
+        for player in (1, 2):
+            connection.send_message({"type": "bet", "amount": 1, "player": player})
+            connection.receive_message()
+            connection.send_message({"action": "hit", "player": player})
+            if connection.receive_message().get("type") == "hit_result":
+                connection.send_message({"action": "stand", "player": player})
+                connection.receive_message()
+
+def time_loopback(connection):
+    """Nanoseconds per full round over a connected client"""
+    play_rounds(connection, 20)  # Warm up
+    runs = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        play_rounds(connection, LOOPBACK_ROUNDS)
+        runs.append((time.perf_counter() - start) / LOOPBACK_ROUNDS * 1e9)
+    return runs, LOOPBACK_ROUNDS
+
+def connect(port):
+    """Connect a framed blocking client, retrying while the server starts"""
+    for _ in range(100):
+        try:
+            sock = socket.create_connection((HOST, port))
+            break
+        except ConnectionRefusedError:
+            time.sleep(0.02)
+    connection = Framing.FrameSocket(sock, decode=BinaryProtocol.decode_message)
+    connection.receive_message()  # Welcome message
+    return connection
+
+def loopback_run_server(metrics=None):
+    """Full rounds through the blocking run_server over loopback TCP"""
+    port = free_port()
+    threading.Thread(target=run_server, kwargs={"port": port, "metrics": metrics}, daemon=True).start()
+    connection = connect(port)
+    try:
+        return time_loopback(connection)
+    finally:
+        connection.socket.close()
+
+def loopback_async_server():
+    """Full rounds through the asyncio server over loopback TCP"""
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(AsyncServer.serve(HOST, port))
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait()
+    connection = connect(port)
+    try:
+        return time_loopback(connection)
+    finally:
+        connection.socket.close()
+        # Let the table's handler see the disconnect before stopping the loop
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+def macro_benchmarks():
+    """End-to-end benchmarks of a bet/hit/stand round through each server"""
+    return {
+        "loopback/run_server round": loopback_run_server,
+        "loopback/run_server round +metrics": lambda: loopback_run_server(Metrics()),
+        "loopback/async server round": loopback_async_server,
+    }
+
+def summarize(runs, number):
+    """Machine-readable result of one benchmark"""
+    ordered = sorted(runs)
+    return {"min_ns": ordered[0], "median_ns": ordered[len(ordered) // 2], "runs_ns": runs, "iterations": number}
+
+def git_commit():
+    """Current commit, if this is a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(selected=None):
+    """Run every benchmark whose name contains one of the selected strings"""
+    results = {}
+    for name, function in micro_benchmarks().items():
+        if not selected or any(s in name for s in selected):
+            results[name] = summarize(*time_micro(function))
+            print(f"{name:<36}{results[name]['min_ns']:>14,.0f} ns")
+    for name, benchmark in macro_benchmarks().items():
+        if not selected or any(s in name for s in selected):
+            results[name] = summarize(*benchmark())
+            print(f"{name:<36}{results[name]['min_ns']:>14,.0f} ns")
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+def compare(baseline, current, limit=REGRESSION_LIMIT):
+    """Print the change of each benchmark against a baseline and return the regressed names"""
+    regressions = []
+    print(f"\n{'benchmark':<36}{'baseline ns':>14}{'current ns':>14}{'ratio':>8}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["min_ns"]
+        ratio = result["min_ns"] / before
+        flag = "  REGRESSION" if ratio > limit else ""
+        print(f"{name:<36}{before:>14,.0f}{result['min_ns']:>14,.0f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro and end-to-end benchmarks")
+    parser.add_argument("names", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--limit", type=float, default=REGRESSION_LIMIT,
+                        help="slowdown ratio reported as a regression (default %(default)s)")
+    args = parser.parse_args()
+
+    report = run(args.names)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.limit)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+import json
+import struct
+import timeit
+
+import Framing
+import Serializer
+from Framing import encode_frame
+from Serializer import StaticMessage
+
+# Encodings a peer can ask for in reply to the welcome message
+ENCODINGS = ["json", "binary"]
+
+# JSON payloads always start with "{", binary payloads with a message-type byte
+JSON_START = ord("{")
+
+# Message-type bytes
+BET = 1
+HIT = 2
+STAND = 3
+GAME_STATE = 4
+HIT_RESULT = 5
+BUST_RESULT = 6
+PLAYER1_DONE = 7
+FINAL_RESULT = 8
+DEAL = 9            # Delta updates (DeltaProtocol.py)
+CARD = 10
+BUST_DELTA = 11
+TURN = 12
+SETTLE = 13
+BATCH = 14          # Several payloads in one frame (BatchProtocol.py)
+
+# Result strings packed as one byte each
+RESULTS = ["win", "lose", "tie", "bust"]
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+
+# Fixed-size heads, followed by the card lists as one byte per card
+BET_FORMAT = struct.Struct(">BBi")               # type, player, amount
+ACTION_FORMAT = struct.Struct(">BB")             # type, player
+GAME_STATE_FORMAT = struct.Struct(">BiBBB")      # type, bet, value, hand size, visible size
+HIT_RESULT_FORMAT = struct.Struct(">BBBB")       # type, card, value, hand size
+BUST_RESULT_FORMAT = struct.Struct(">BiBB")      # type, money, value, hand size
+PLAYER1_DONE_FORMAT = struct.Struct(">BBB")      # type, value, hand size
+FINAL_RESULT_FORMAT = struct.Struct(">BiiBBBBBBBB")  # type, money x2, values x3, results x2, sizes x3
+DEAL_FORMAT = struct.Struct(">BIBiBBB")          # type, seq, player, bet, dealer up card, two cards
+CARD_FORMAT = struct.Struct(">BIB")              # type, seq, card
+BUST_DELTA_FORMAT = struct.Struct(">BIBi")       # type, seq, card, money change
+TURN_FORMAT = struct.Struct(">BI")               # type, seq
+SETTLE_FORMAT = struct.Struct(">BIBBiiB")        # type, seq, results x2, money changes x2, dealer cards size
+BATCH_FORMAT = struct.Struct(">BB")              # type, message count, then each as a length and a payload
+BATCH_ITEM = struct.Struct(">H")
+
+BUST_MESSAGE = "Bust! You lose."
+FINAL_RESULT_KEYS = {"type", "player1_hand", "player1_value", "player2_hand", "player2_value",
+                     "dealer_hand", "dealer_value", "player1_result", "player2_result",
+                     "player1_money", "player2_money", "message"}
+
+class ProtocolError(ValueError):
+    """Raised when a binary payload cannot be decoded"""
+
+def player_message(player_num, result, dealer_value):
+    """Rebuild the per-player text the server puts in a final result"""
+    if result == "bust":
+        return f"Player {player_num} busted"
+    elif result == "win" and dealer_value > 21:
+        return f"Player {player_num} wins! Dealer busted"
+    elif result == "win":
+        return f"Player {player_num} wins!"
+    elif result == "lose":
+        return f"Player {player_num} loses"
+    return f"Player {player_num} ties"
+
+def final_message(message):
+    """Rebuild the text of a final result from its packed fields"""
+    dealer_value = message["dealer_value"]
+    player1_message = player_message(1, message["player1_result"], dealer_value)
+    player2_message = player_message(2, message["player2_result"], dealer_value)
+    return f"Dealer: {dealer_value}, {player1_message}, {player2_message}"
+
+def pack(message):
+    """Pack a message into its binary form, or None if it has no binary form"""
+    message_type = message.get("type")
+    keys = message.keys()
+
+    if message_type == "bet" and keys == {"type", "amount", "player"}:
+        return BET_FORMAT.pack(BET, message["player"], message["amount"])
+
+    if message_type is None and keys == {"action", "player"}:
+        action = message["action"]
+        if action == "hit":
+            return ACTION_FORMAT.pack(HIT, message["player"])
+        if action == "stand":
+            return ACTION_FORMAT.pack(STAND, message["player"])
+        return None
+
+    if message_type == "game_state" and keys == {"type", "player_hand", "player_value", "dealer_visible", "bet"}:
+        hand = message["player_hand"]
+        visible = message["dealer_visible"]
+        return (GAME_STATE_FORMAT.pack(GAME_STATE, message["bet"], message["player_value"], len(hand), len(visible))
+                + bytes(hand) + bytes(visible))
+
+    if message_type == "hit_result" and keys == {"type", "card", "player_hand", "player_value"}:
+        hand = message["player_hand"]
+        return HIT_RESULT_FORMAT.pack(HIT_RESULT, message["card"], message["player_value"], len(hand)) + bytes(hand)
+
+    if message_type == "player1_done" and keys == {"type", "player1_hand", "player1_value"}:
+        hand = message["player1_hand"]
+        return PLAYER1_DONE_FORMAT.pack(PLAYER1_DONE, message["player1_value"], len(hand)) + bytes(hand)
+
+    if message_type == "result" and message.get("result") == "bust" and message.get("message") == BUST_MESSAGE \
+            and keys == {"type", "player_hand", "player_value", "money", "result", "message"}:
+        hand = message["player_hand"]
+        return BUST_RESULT_FORMAT.pack(BUST_RESULT, message["money"], message["player_value"], len(hand)) + bytes(hand)
+
+    if message_type == "result" and keys == FINAL_RESULT_KEYS and message["message"] == final_message(message):
+        hand1 = message["player1_hand"]
+        hand2 = message["player2_hand"]
+        dealer = message["dealer_hand"]
+        return (FINAL_RESULT_FORMAT.pack(
+                    FINAL_RESULT, message["player1_money"], message["player2_money"],
+                    message["player1_value"], message["player2_value"], message["dealer_value"],
+                    RESULT_CODES[message["player1_result"]], RESULT_CODES[message["player2_result"]],
+                    len(hand1), len(hand2), len(dealer))
+                + bytes(hand1) + bytes(hand2) + bytes(dealer))
+
+    if message_type == "card" and keys == {"type", "seq", "card"}:
+        return CARD_FORMAT.pack(CARD, message["seq"], message["card"])
+
+    if message_type == "deal" and keys == {"type", "seq", "player", "cards", "dealer", "bet"}:
+        return DEAL_FORMAT.pack(DEAL, message["seq"], message["player"], message["bet"], message["dealer"],
+                                *message["cards"])
+
+    if message_type == "bust" and keys == {"type", "seq", "card", "change"}:
+        return BUST_DELTA_FORMAT.pack(BUST_DELTA, message["seq"], message["card"], message["change"])
+
+    if message_type == "turn" and keys == {"type", "seq"}:
+        return TURN_FORMAT.pack(TURN, message["seq"])
+
+    if message_type == "settle" and keys == {"type", "seq", "dealer", "results", "changes"}:
+        dealer = message["dealer"]
+        results = message["results"]
+        changes = message["changes"]
+        return (SETTLE_FORMAT.pack(SETTLE, message["seq"], RESULT_CODES[results[0]], RESULT_CODES[results[1]],
+                                   changes[0], changes[1], len(dealer))
+                + bytes(dealer))
+
+    if message_type == "batch" and keys == {"type", "messages"}:
+        # Each message in its own encoding, so ones without a binary form can be in a binary batch
+        parts = [BATCH_FORMAT.pack(BATCH, len(message["messages"]))]
+        for item in message["messages"]:
+            payload = encode_payload(item)
+            parts.append(BATCH_ITEM.pack(len(payload)))
+            parts.append(payload)
+        return b"".join(parts)
+
+    return None
+
+def unpack(payload):
+    """Unpack a binary payload into the same dict the JSON form would give"""
+    message_type = payload[0]
+
+    if message_type == BET:
+        _, player, amount = BET_FORMAT.unpack(payload)
+        return {"type": "bet", "amount": amount, "player": player}
+
+    if message_type == HIT or message_type == STAND:
+        _, player = ACTION_FORMAT.unpack(payload)
+        return {"action": "hit" if message_type == HIT else "stand", "player": player}
+
+    if message_type == GAME_STATE:
+        _, bet, value, hand_size, visible_size = GAME_STATE_FORMAT.unpack_from(payload)
+        start = GAME_STATE_FORMAT.size
+        return {
+            "type": "game_state",
+            "player_hand": list(payload[start:start + hand_size]),
+            "player_value": value,
+            "dealer_visible": list(payload[start + hand_size:start + hand_size + visible_size]),
+            "bet": bet
+        }
+
+    if message_type == HIT_RESULT:
+        _, card, value, hand_size = HIT_RESULT_FORMAT.unpack_from(payload)
+        start = HIT_RESULT_FORMAT.size
+        return {
+            "type": "hit_result",
+            "card": card,
+            "player_hand": list(payload[start:start + hand_size]),
+            "player_value": value
+        }
+
+    if message_type == PLAYER1_DONE:
+        _, value, hand_size = PLAYER1_DONE_FORMAT.unpack_from(payload)
+        start = PLAYER1_DONE_FORMAT.size
+        return {
+            "type": "player1_done",
+            "player1_hand": list(payload[start:start + hand_size]),
+            "player1_value": value
+        }
+
+    if message_type == BUST_RESULT:
+        _, money, value, hand_size = BUST_RESULT_FORMAT.unpack_from(payload)
+        start = BUST_RESULT_FORMAT.size
+        return {
+            "type": "result",
+            "player_hand": list(payload[start:start + hand_size]),
+            "player_value": value,
+            "money": money,
+            "result": "bust",
+            "message": BUST_MESSAGE
+        }
+
+    if message_type == FINAL_RESULT:
+        (_, player1_money, player2_money, player1_value, player2_value, dealer_value,
+         player1_code, player2_code, size1, size2, dealer_size) = FINAL_RESULT_FORMAT.unpack_from(payload)
+        start = FINAL_RESULT_FORMAT.size
+        message = {
+            "type": "result",
+            "player1_hand": list(payload[start:start + size1]),
+            "player1_value": player1_value,
+            "player2_hand": list(payload[start + size1:start + size1 + size2]),
+            "player2_value": player2_value,
+            "dealer_hand": list(payload[start + size1 + size2:start + size1 + size2 + dealer_size]),
+            "dealer_value": dealer_value,
+            "player1_result": RESULTS[player1_code],
+            "player2_result": RESULTS[player2_code],
+            "player1_money": player1_money,
+            "player2_money": player2_money,
+        }
+        message["message"] = final_message(message)
+        return message
+
+    if message_type == CARD:
+        _, seq, card = CARD_FORMAT.unpack(payload)
+        return {"type": "card", "seq": seq, "card": card}
+
+    if message_type == DEAL:
+        _, seq, player, bet, dealer, card1, card2 = DEAL_FORMAT.unpack(payload)
+        return {"type": "deal", "seq": seq, "player": player, "cards": [card1, card2], "dealer": dealer, "bet": bet}
+
+    if message_type == BUST_DELTA:
+        _, seq, card, change = BUST_DELTA_FORMAT.unpack(payload)
+        return {"type": "bust", "seq": seq, "card": card, "change": change}
+
+    if message_type == TURN:
+        _, seq = TURN_FORMAT.unpack(payload)
+        return {"type": "turn", "seq": seq}
+
+    if message_type == SETTLE:
+        _, seq, code1, code2, change1, change2, dealer_size = SETTLE_FORMAT.unpack_from(payload)
+        start = SETTLE_FORMAT.size
+        return {
+            "type": "settle",
+            "seq": seq,
+            "dealer": list(payload[start:start + dealer_size]),
+            "results": [RESULTS[code1], RESULTS[code2]],
+            "changes": [change1, change2]
+        }
+
+    if message_type == BATCH:
+        _, count = BATCH_FORMAT.unpack_from(payload)
+        position = BATCH_FORMAT.size
+        messages = []
+        for _ in range(count):
+            (size,) = BATCH_ITEM.unpack_from(payload, position)
+            position += BATCH_ITEM.size
+            item = payload[position:position + size]
+            if len(item) < size:
+                raise ProtocolError("Truncated batch")
+            messages.append(decode_message(item))
+            position += size
+        return {"type": "batch", "messages": messages}
+
+    raise ProtocolError(f"Unknown message type byte {message_type}")
+
+def encode_payload(message):
+    """Encode a message in binary when it has a binary form, otherwise as JSON"""
+    try:
+        payload = pack(message)
+    except (struct.error, TypeError, ValueError, KeyError, IndexError):
+        payload = None  # Out-of-range or non-integer fields fall back to JSON
+    if payload is None:
+        return Serializer.dumps(message)
+    return payload
+
+def encode_message(message):
+    """Encode a message as a ready-to-send binary (or JSON fallback) frame"""
+    if type(message) is StaticMessage:
+        return message.frame(encode_message)
+    return encode_frame(encode_payload(message))
+
+# Frame encoder to use for each negotiated encoding
+FRAME_ENCODERS = {"json": Framing.encode_message, "binary": encode_message}
+
+def decode_message(payload):
+    """Decode a payload in either encoding"""
+    if not payload:
+        raise ProtocolError("Empty payload")
+    try:
+        if payload[0] == JSON_START:
+            return Serializer.loads(payload)
+        return unpack(payload)
+    except (struct.error, IndexError) as e:
+        raise ProtocolError(f"Truncated binary message: {e}")
+    except UnicodeDecodeError as e:
+        raise ProtocolError(f"Text is not UTF-8: {e}")  # A bad message from the client, not a server error
+
+def requested_encoding(message):
+    """Return the encoding a client asked for, or None if this is not an encoding request"""
+    if message.get("type") != "encoding":
+        return None
+    encoding = message.get("encoding")
+    return encoding if encoding in ENCODINGS else "json"
+
+# Acknowledgement sent (still as JSON) before switching to each encoding
+ENCODING_REPLIES = {encoding: StaticMessage(type="encoding", encoding=encoding) for encoding in ENCODINGS}
+
+def encoding_reply(encoding):
+    """Acknowledgement sent (still as JSON) before switching encodings"""
+    return ENCODING_REPLIES[encoding]
+
+def compare():
+    """Print bytes and encode/decode cost per message type for both encodings"""
+    samples = {
+        "bet": {"type": "bet", "amount": 100, "player": 1},
+        "hit": {"action": "hit", "player": 2},
+        "game_state": {"type": "game_state", "player_hand": [10, 6], "player_value": 16,
+                       "dealer_visible": [9], "bet": 100},
+        "hit_result": {"type": "hit_result", "card": 4, "player_hand": [10, 6, 4], "player_value": 20},
+        "bust": {"type": "result", "player_hand": [10, 6, 8], "player_value": 24, "money": 1900,
+                 "result": "bust", "message": BUST_MESSAGE},
+        "result": {"type": "result", "player1_hand": [10, 9], "player1_value": 19,
+                   "player2_hand": [11, 7], "player2_value": 18, "dealer_hand": [9, 8],
+                   "dealer_value": 17, "player1_result": "win", "player2_result": "win",
+                   "player1_money": 2100, "player2_money": 2100,
+                   "message": "Dealer: 17, Player 1 wins!, Player 2 wins!"},
+    }
+    print(f"{'message':<12}{'json B':>8}{'bin B':>8}{'json enc us':>13}{'bin enc us':>12}"
+          f"{'json dec us':>13}{'bin dec us':>12}")
+    for name, message in samples.items():
+        json_payload = json.dumps(message).encode('utf-8')
+        binary_payload = encode_payload(message)
+        assert decode_message(binary_payload) == message
+        number = 20000
+        timings = [
+            timeit.timeit(lambda: json.dumps(message).encode('utf-8'), number=number),
+            timeit.timeit(lambda: encode_payload(message), number=number),
+            timeit.timeit(lambda: json.loads(json_payload), number=number),
+            timeit.timeit(lambda: decode_message(binary_payload), number=number),
+        ]
+        micros = [t / number * 1e6 for t in timings]
+        print(f"{name:<12}{len(json_payload):>8}{len(binary_payload):>8}{micros[0]:>13.2f}{micros[1]:>12.2f}"
+              f"{micros[2]:>13.2f}{micros[3]:>12.2f}")
+
+if __name__ == "__main__":
+    compare()
@@ -0,0 +1,538 @@
+import socket
+import sys
+import threading
+from collections import deque
+
+from BatchProtocol import STAND_ON, batch_message, round_messages
+from BinaryProtocol import FRAME_ENCODERS, decode_message
+from DeltaProtocol import DELTA_TYPES, expand
+from Framing import RECV_SIZE, FrameDecoder, FrameSocket
+
+# Client defaults, the same as the servers'
+HOST = '127.0.0.1'
+PORT = 65432
+CONNECT_TIMEOUT = 10  # Seconds to wait for the server to accept
+ENCODING = "binary"   # Asked for after the welcome when the server offers it
+UPDATES = "full"      # "delta" asks for numbered deltas instead of whole hands and balances
+KEEPALIVE_INTERVAL = 20.0  # Seconds between unsolicited pongs while not reading, under the servers' ping interval
+
+# The answer to the server's pings; sent unprompted, it just says the client is still there
+PONG = {"type": "pong"}
+
+def bet_message(amount, player):
+    return {"type": "bet", "amount": amount, "player": player}
+
+def action_message(action, player):
+    return {"action": action, "player": player}
+
+class TableState:
+    """What a client knows about its table, kept up to date from the server's messages
+
+    This is the protocol's result handling in one place: the GUI, bots and
+    load tests all read hands, money and whose turn it is from here.
+    """
+
+    def __init__(self):
+        self.table = None
+        self.encodings = ["json"]
+        self.updates = ["full"]   # Update modes the server offers
+        self.seq = 0              # Number of the last delta applied
+        self.resyncs = 0          # Snapshots asked for after a missed delta
+        self.player1_money = 0
+        self.player2_money = 0
+        self.current_player = 1   # Seat whose turn it is to bet or play (1 or 2)
+        self.in_hand = False      # A hand is waiting for hit or stand
+        self.bet = 0
+        self.player1_hand = []
+        self.player2_hand = []
+        self.dealer_visible = []
+        self.dealer_hand = []     # Only known once the round is settled
+        self.last_result = None   # The last "result" message
+        self.game_over = False
+
+    def hand(self, player=None):
+        """Cards of a seat (default: the one in turn)"""
+        return self.player1_hand if (player or self.current_player) == 1 else self.player2_hand
+
+    def money(self, player=None):
+        """Money of a seat (default: the one in turn)"""
+        return self.player1_money if (player or self.current_player) == 1 else self.player2_money
+
+    def set_hand(self, player, hand):
+        if player == 1:
+            self.player1_hand = hand
+        else:
+            self.player2_hand = hand
+
+    def set_money(self, player, money):
+        if player == 1:
+            self.player1_money = money
+        else:
+            self.player2_money = money
+
+    def is_finished(self):
+        """True once the game is over or a player is out of money"""
+        return self.game_over or self.player1_money <= 0 or self.player2_money <= 0
+
+    def apply(self, message):
+        """Update the state from one server message and return its type"""
+        message_type = message.get("type")
+
+        if message_type == "welcome":
+            self.table = message.get("table")
+            self.encodings = message.get("encodings", ["json"])
+            self.updates = message.get("updates", ["full"])
+            # A table recovered after a server restart reports each player's money
+            self.player1_money = message.get("player1_money", message.get("money", 0))
+            self.player2_money = message.get("player2_money", message.get("money", 0))
+            in_play = message.get("in_play")
+            if in_play:
+                # A hand recovered where it was left
+                self.current_player = in_play.get("player", 1)
+                self.set_hand(self.current_player, in_play.get("player_hand", []))
+                self.dealer_visible = in_play.get("dealer_visible", [])
+                self.bet = in_play.get("bet", 0)
+                self.in_hand = True
+            else:
+                self.current_player = 1
+
+        elif message_type == "game_state":
+            self.set_hand(self.current_player, message.get("player_hand", []))
+            self.dealer_visible = message.get("dealer_visible", [])
+            self.dealer_hand = []  # Will be populated later
+            self.bet = message.get("bet", self.bet)
+            self.in_hand = True
+
+        elif message_type == "hit_result":
+            self.set_hand(self.current_player, message.get("player_hand", []))
+
+        elif message_type == "player1_done":
+            # Player 1 stands, so Player 2 bets next
+            self.in_hand = False
+            self.current_player = 2
+
+        elif message_type == "result":
+            self.last_result = message
+            self.in_hand = False
+            if "player1_hand" in message:
+                # Settlement after Player 2: both hands, the dealer's hand and both players' money
+                self.player1_hand = message.get("player1_hand", [])
+                self.player2_hand = message.get("player2_hand", [])
+                self.dealer_hand = message.get("dealer_hand", [])
+                self.dealer_visible = []  # The full hand is shown now
+                self.player1_money = message.get("player1_money", self.player1_money)
+                self.player2_money = message.get("player2_money", self.player2_money)
+                self.current_player = 1
+            else:
+                # The player in turn busted
+                self.set_hand(self.current_player, message.get("player_hand", []))
+                self.set_money(self.current_player, message.get("money", self.money()))
+                self.current_player = 2 if self.current_player == 1 else 1
+
+        elif message_type == "game_over":
+            self.game_over = True
+
+        elif message_type == "updates":
+            self.seq = message.get("seq", 0)
+
+        elif message_type == "snapshot":
+            # Everything about the table, after a resync
+            self.seq = message.get("seq", self.seq)
+            self.player1_money = message.get("player1_money", self.player1_money)
+            self.player2_money = message.get("player2_money", self.player2_money)
+            self.current_player = message.get("player", 1)
+            self.player1_hand = message.get("player1_hand", self.player1_hand)
+            in_play = message.get("in_play")
+            self.in_hand = bool(in_play)
+            if in_play:
+                self.set_hand(self.current_player, in_play.get("player_hand", []))
+                self.dealer_visible = in_play.get("dealer_visible", [])
+                self.bet = in_play.get("bet", 0)
+
+        return message_type
+
+    def update(self, message):
+        """Apply a message in either update mode and return it as a full message
+
+        A delta is expanded against the state first, so callers see the same
+        messages whichever mode is on, and a batch has each of its replies
+        applied in order. Returns None for a delta that does not follow the
+        last one; the caller should then ask for a snapshot.
+        """
+        message_type = message.get("type")
+        if message_type == "batch":
+            # Replies to a batch, in order
+            replies = []
+            for reply in message.get("messages", []):
+                full = self.update(reply)
+                if full is None:
+                    return None
+                replies.append(full)
+            return batch_message(replies)
+        if message_type not in DELTA_TYPES:
+            self.apply(message)
+            return message
+        if message["seq"] != self.seq + 1:
+            return None
+        if "player" in message:
+            self.current_player = message["player"]  # A deal says whose hand it is
+        full = expand(message, self)
+        self.apply(full)
+        self.seq = message["seq"]
+        return full
+
+class BlackjackClient:
+    """Blocking client for one table (both seats), usable without a display
+
+    connect() reads the welcome and switches to the binary encoding when
+    the server offers it. bet(), hit() and stand() send a request and return
+    the reply, with self.state already updated from it. With
+    updates="delta" the server sends numbered deltas, which come back
+    expanded to the same full messages.
+    """
+
+    def __init__(self, host=HOST, port=PORT, encoding=ENCODING, updates=UPDATES):
+        self.host = host
+        self.port = port
+        self.encoding = encoding
+        self.updates = updates
+        self.state = TableState()
+        self.socket = None
+        self.connection = None
+        self.sending = threading.Lock()  # Pongs can go out from another thread than the requests
+        self.stop_keepalive = threading.Event()
+
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        """Connect, negotiate the encoding and return the welcome message"""
+        self.socket = socket.create_connection((self.host, self.port), timeout=timeout)
+        self.socket.settimeout(None)  # Waiting on the players is normal once connected
+        self.connection = FrameSocket(self.socket, decode=decode_message)
+        welcome = self.receive()
+        if welcome is None:
+            raise ConnectionError("Server closed the connection before the welcome")
+        if self.encoding != "json" and self.encoding in self.state.encodings:
+            reply = self.request({"type": "encoding", "encoding": self.encoding})
+            if reply and reply.get("type") == "encoding":
+                self.connection.encode = FRAME_ENCODERS[reply.get("encoding", "json")]
+        if self.updates != "full" and self.updates in self.state.updates:
+            self.request({"type": "updates", "mode": self.updates})
+        return welcome
+
+    def send(self, message):
+        with self.sending:
+            self.connection.send_message(message)
+
+    def receive_message(self):
+        """Next message without touching the state, or None once the server disconnects
+
+        Pings from the server are answered here and never returned.
+        """
+        message = self.connection.receive_message()
+        while message is not None and message.get("type") == "ping":
+            self.send(PONG)
+            message = self.connection.receive_message()
+        return message
+
+    def keep_alive(self, interval=KEEPALIVE_INTERVAL):
+        """Send a pong every interval seconds from a daemon thread until close()
+
+        For callers that stop reading for a long time, like the terminal
+        client waiting on a player: a ping sitting unread would get the
+        connection reaped as dead, but the server never pings a client it
+        keeps hearing from.
+        """
+        def run():
+            while not self.stop_keepalive.wait(interval):
+                try:
+                    self.send(PONG)
+                except OSError:
+                    return
+
+        threading.Thread(target=run, name="keepalive", daemon=True).start()
+
+    def receive(self):
+        """Next message, applied to the state, or None once the server disconnects
+
+        Deltas come back expanded to full messages. After a missed delta the
+        state is rebuilt from a snapshot, which is returned instead.
+        """
+        message = self.receive_message()
+        if message is None:
+            return None
+        full = self.state.update(message)
+        return full if full is not None else self.resync()
+
+    def resync(self):
+        """Ask for a snapshot of the table and skip the deltas it replaces"""
+        self.send({"type": "sync"})
+        message = self.receive_message()
+        while message is not None and message.get("type") != "snapshot":
+            message = self.receive_message()
+        if message is not None:
+            self.state.apply(message)
+            self.state.resyncs += 1
+        return message
+
+    def request(self, message):
+        """Send a message and return the reply"""
+        self.send(message)
+        return self.receive()
+
+    def bet(self, amount, player=None):
+        return self.request(bet_message(amount, player or self.state.current_player))
+
+    def hit(self, player=None):
+        return self.request(action_message("hit", player or self.state.current_player))
+
+    def stand(self, player=None):
+        return self.request(action_message("stand", player or self.state.current_player))
+
+    def play_hand(self, amount, decide):
+        """Bet, then hit or stand as decide(state) says until the turn ends; returns the last reply"""
+        reply = self.bet(amount)
+        while reply and self.state.in_hand:
+            reply = self.request(action_message(decide(self.state), self.state.current_player))
+        return reply
+
+    def batch(self, messages):
+        """Send several messages in one frame and return all their replies, in one round trip
+
+        An error about the batch itself, or a snapshot after a missed
+        delta, comes back as the only reply.
+        """
+        reply = self.request(batch_message(messages))
+        if reply is None:
+            return []
+        return reply["messages"] if reply.get("type") == "batch" else [reply]
+
+    def play_round(self, bets, strategy="basic", stand_on=STAND_ON):
+        """Bet both seats and let the server play their hands with a strategy, in one round trip"""
+        return self.batch(round_messages(bets, strategy, stand_on))
+
+    def spectate(self, table):
+        """Watch another table instead of playing: returns its snapshot (or an error reply)
+
+        From then on receive() returns the watched table's updates, with
+        self.state following that table.
+        """
+        return self.request({"type": "spectate", "table": table})
+
+    def close(self):
+        self.stop_keepalive.set()
+        if self.socket:
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)  # Wakes a thread blocked in receive
+            except OSError:
+                pass
+            self.socket.close()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class AsyncBlackjackClient:
+    """The same client for asyncio: every method that talks to the server is a coroutine"""
+
+    def __init__(self, host=HOST, port=PORT, encoding=ENCODING, updates=UPDATES):
+        self.host = host
+        self.port = port
+        self.encoding = encoding
+        self.updates = updates
+        self.state = TableState()
+        self.reader = None
+        self.writer = None
+        self.decoder = FrameDecoder()
+        self.messages = deque()
+        self.encode = FRAME_ENCODERS["json"]
+
+    async def connect(self, timeout=CONNECT_TIMEOUT):
+        """Connect, negotiate the encoding and return the welcome message"""
+        import asyncio  # Only the asyncio client pays for importing it
+
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout)
+        welcome = await self.receive()
+        if welcome is None:
+            raise ConnectionError("Server closed the connection before the welcome")
+        if self.encoding != "json" and self.encoding in self.state.encodings:
+            reply = await self.request({"type": "encoding", "encoding": self.encoding})
+            if reply and reply.get("type") == "encoding":
+                self.encode = FRAME_ENCODERS[reply.get("encoding", "json")]
+        if self.updates != "full" and self.updates in self.state.updates:
+            await self.request({"type": "updates", "mode": self.updates})
+        return welcome
+
+    async def send(self, message):
+        self.writer.write(self.encode(message))
+        await self.writer.drain()
+
+    async def receive_message(self):
+        """Next message without touching the state, or None once the server disconnects; pings are answered"""
+        while True:
+            while not self.messages:
+                data = await self.reader.read(RECV_SIZE)
+                if not data:
+                    return None
+                self.messages.extend(self.decoder.feed(data))
+            message = decode_message(self.messages.popleft())
+            if message.get("type") != "ping":
+                return message
+            await self.send(PONG)
+
+    async def receive(self):
+        """Next message, applied to the state, or None once the server disconnects"""
+        message = await self.receive_message()
+        if message is None:
+            return None
+        full = self.state.update(message)
+        return full if full is not None else await self.resync()
+
+    async def resync(self):
+        """Ask for a snapshot of the table and skip the deltas it replaces"""
+        await self.send({"type": "sync"})
+        message = await self.receive_message()
+        while message is not None and message.get("type") != "snapshot":
+            message = await self.receive_message()
+        if message is not None:
+            self.state.apply(message)
+            self.state.resyncs += 1
+        return message
+
+    async def request(self, message):
+        """Send a message and return the reply"""
+        await self.send(message)
+        return await self.receive()
+
+    async def bet(self, amount, player=None):
+        return await self.request(bet_message(amount, player or self.state.current_player))
+
+    async def hit(self, player=None):
+        return await self.request(action_message("hit", player or self.state.current_player))
+
+    async def stand(self, player=None):
+        return await self.request(action_message("stand", player or self.state.current_player))
+
+    async def play_hand(self, amount, decide):
+        """Bet, then hit or stand as decide(state) says until the turn ends; returns the last reply"""
+        reply = await self.bet(amount)
+        while reply and self.state.in_hand:
+            reply = await self.request(action_message(decide(self.state), self.state.current_player))
+        return reply
+
+    async def batch(self, messages):
+        """Send several messages in one frame and return all their replies, in one round trip"""
+        reply = await self.request(batch_message(messages))
+        if reply is None:
+            return []
+        return reply["messages"] if reply.get("type") == "batch" else [reply]
+
+    async def play_round(self, bets, strategy="basic", stand_on=STAND_ON):
+        """Bet both seats and let the server play their hands with a strategy, in one round trip"""
+        return await self.batch(round_messages(bets, strategy, stand_on))
+
+    async def spectate(self, table):
+        """Watch another table instead of playing: returns its snapshot (or an error reply)"""
+        return await self.request({"type": "spectate", "table": table})
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+def basic_strategy(state):
+    """Hit or stand from the precomputed strategy table"""
+    from StrategyTable import get_table  # Loaded on first use; it is the slowest import here
+    return get_table().advise(state.hand(), state.dealer_visible[0])
+
+def ask_player(state):
+    """Hit or stand from the terminal"""
+    while True:
+        answer = input(f"Player {state.current_player}: {state.hand()} against {state.dealer_visible} "
+                       f"- (h)it or (s)tand? ").strip().lower()
+        if answer in ("h", "hit"):
+            return "hit"
+        if answer in ("s", "stand"):
+            return "stand"
+
+def play(host=HOST, port=PORT, bet=25, rounds=0, bot=False, updates=UPDATES):
+    """Play both seats from the terminal, or let the basic strategy play them"""
+    decide = basic_strategy if bot else ask_player
+    with BlackjackClient(host, port, updates=updates) as client:
+        if not bot:
+            client.keep_alive()  # Nothing reads while the player thinks
+        state = client.state
+        played = 0
+        while not state.is_finished() and (not rounds or played < rounds):
+            for _ in (1, 2):
+                reply = client.play_hand(min(bet, state.money()), decide)
+                if reply is None:
+                    print("Server closed the connection")
+                    return
+                if reply.get("type") == "error":
+                    print(f"Error: {reply.get('message')}")
+                    return
+                if reply.get("type") == "result" and "player1_hand" in reply:
+                    print(reply.get("message"))
+                elif reply.get("type") == "result":
+                    print(f"Bust with {reply.get('player_hand')}")
+            played += 1
+            print(f"Round {played}: Player 1 ${state.player1_money}, Player 2 ${state.player2_money}")
+
+def watch(host=HOST, port=PORT, table=1):
+    """Print another table's play as it happens"""
+    with BlackjackClient(host, port) as client:
+        state = client.state
+        reply = client.spectate(table)
+        if reply is None or reply.get("type") == "error":
+            print(f"Error: {reply.get('message') if reply else 'server closed the connection'}")
+            return
+        print(f"Watching table {table}: Player 1 ${state.player1_money}, Player 2 ${state.player2_money}")
+        while True:
+            message = client.receive()
+            if message is None or message.get("type") == "game_over":
+                print("Table closed")
+                return
+            message_type = message.get("type")
+            if message_type == "game_state":
+                print(f"Player {state.current_player} bets ${state.bet}: {state.hand()} "
+                      f"against {state.dealer_visible}")
+            elif message_type == "hit_result":
+                print(f"Player {state.current_player} hits: {state.hand()}")
+            elif message_type == "result" and "player1_hand" in message:
+                print(f"{message.get('message')} - Player 1 ${state.player1_money}, "
+                      f"Player 2 ${state.player2_money}")
+            elif message_type == "result":
+                print(f"Bust with {message.get('player_hand')}")
+
+if __name__ == "__main__":
+    import argparse  # Not at the top: importing the library should stay cheap
+
+    parser = argparse.ArgumentParser(description="Play blackjack in the terminal, no display needed")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--bet", type=int, default=25)
+    parser.add_argument("--rounds", type=int, default=0, help="stop after this many rounds (default: until broke)")
+    parser.add_argument("--bot", action="store_true", help="let the basic strategy play both seats")
+    parser.add_argument("--updates", choices=["full", "delta"], default=UPDATES,
+                        help="ask the server for numbered deltas instead of full messages")
+    parser.add_argument("--watch", type=int, metavar="TABLE", help="spectate a table on the server instead")
+    args = parser.parse_args()
+    try:
+        if args.watch is not None:
+            watch(args.host, args.port, args.watch)
+        else:
+            play(args.host, args.port, args.bet, args.rounds, args.bot, args.updates)
+    except (ConnectionRefusedError, socket.timeout) as e:
+        print(f"Could not connect to {args.host}:{args.port}: {e}")
+        sys.exit(1)
+    except (KeyboardInterrupt, EOFError):
+        print()
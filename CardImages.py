@@ -0,0 +1,148 @@
+import sys
+
+# Card image size, matching the client's card layout (the border is drawn inside the image)
+CARD_WIDTH = 65
+CARD_HEIGHT = 85
+BORDER = 3
+
+# Colors
+CARD_COLOR = "#ffffff"
+BORDER_COLOR = "#000000"
+TEXT_COLOR = "#000000"
+BACK_COLOR = "#ff0000"
+BACK_TEXT_COLOR = "#ffffff"
+
+# Glyph scales: the big value in the middle and the small one in the top-left corner
+CENTER_SCALE = 3
+CORNER_SCALE = 2
+CORNER_POSITION = (5, 5)
+
+# Every text a card face can show
+FACES = ["2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A"]
+HIDDEN = "?"  # The dealer's face-down card
+
+# 5x7 bitmap font, one string per row
+FONT = {
+    "0": ["01110", "10001", "10011", "10101", "11001", "10001", "01110"],
+    "1": ["00100", "01100", "00100", "00100", "00100", "00100", "01110"],
+    "2": ["01110", "10001", "00001", "00010", "00100", "01000", "11111"],
+    "3": ["11111", "00010", "00100", "00010", "00001", "10001", "01110"],
+    "4": ["00010", "00110", "01010", "10010", "11111", "00010", "00010"],
+    "5": ["11111", "10000", "11110", "00001", "00001", "10001", "01110"],
+    "6": ["00110", "01000", "10000", "11110", "10001", "10001", "01110"],
+    "7": ["11111", "00001", "00010", "00100", "01000", "01000", "01000"],
+    "8": ["01110", "10001", "10001", "01110", "10001", "10001", "01110"],
+    "9": ["01110", "10001", "10001", "01111", "00001", "00010", "01100"],
+    "A": ["01110", "10001", "10001", "11111", "10001", "10001", "10001"],
+    "J": ["00111", "00010", "00010", "00010", "00010", "10010", "01100"],
+    "Q": ["01110", "10001", "10001", "10001", "10101", "10010", "01101"],
+    "K": ["10001", "10010", "10100", "11000", "10100", "10010", "10001"],
+    "?": ["01110", "10001", "00001", "00010", "00100", "00000", "00100"],
+}
+GLYPH_WIDTH = 5
+GLYPH_HEIGHT = 7
+
+def text_size(text, scale):
+    """Width and height of text drawn at a scale, with one scaled column between glyphs"""
+    return len(text) * (GLYPH_WIDTH + 1) * scale - scale, GLYPH_HEIGHT * scale
+
+def text_rects(text, x, y, scale):
+    """Filled rectangles (x1, y1, x2, y2) that draw text with its top-left corner at x, y
+
+    Runs of set pixels in a glyph row become one rectangle, so a glyph is a
+    handful of fills rather than one per pixel.
+    """
+    rects = []
+    for glyph in text:
+        for row, bits in enumerate(FONT[glyph]):
+            column = 0
+            while column < GLYPH_WIDTH:
+                if bits[column] == "1":
+                    end = column
+                    while end < GLYPH_WIDTH and bits[end] == "1":
+                        end += 1
+                    top = y + row * scale
+                    rects.append((x + column * scale, top, x + end * scale, top + scale))
+                    column = end
+                else:
+                    column += 1
+        x += (GLYPH_WIDTH + 1) * scale
+    return rects
+
+def card_fills(text, hidden=False):
+    """(color, rectangle) fills, in drawing order, that paint a card face or the card back"""
+    fills = [
+        (BORDER_COLOR, (0, 0, CARD_WIDTH, CARD_HEIGHT)),
+        (CARD_COLOR, (BORDER, BORDER, CARD_WIDTH - BORDER, CARD_HEIGHT - BORDER)),
+    ]
+    text_color = TEXT_COLOR
+    if hidden:
+        # Card back
+        text = HIDDEN
+        text_color = BACK_TEXT_COLOR
+        fills.append((BACK_COLOR, (5, 5, CARD_WIDTH - 5, CARD_HEIGHT - 5)))
+
+    # Main card value, centered
+    width, height = text_size(text, CENTER_SCALE)
+    x = (CARD_WIDTH - width) // 2
+    y = (CARD_HEIGHT - height) // 2
+    fills.extend((text_color, rect) for rect in text_rects(text, x, y, CENTER_SCALE))
+
+    # Card corner value - only in top left to save space
+    if not hidden:
+        fills.extend((text_color, rect) for rect in text_rects(text, *CORNER_POSITION, CORNER_SCALE))
+    return fills
+
+class CardImageCache:
+    """One PhotoImage per distinct card face, painted the first time it is needed
+
+    Drawing a card is then a single canvas image item instead of two
+    rectangles and two font-rendered texts, and changing a card is just
+    pointing that item at another cached image.
+    """
+
+    def __init__(self, master):
+        self.master = master  # Any widget; images belong to its Tk interpreter
+        self.images = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text, hidden=False):
+        """The image for a card showing text (or the card back)"""
+        key = HIDDEN if hidden else text
+        image = self.images.get(key)
+        if image is not None:
+            self.hits += 1
+            return image
+        self.misses += 1
+        image = self.images[key] = self.render(text, hidden)
+        return image
+
+    def render(self, text, hidden):
+        import tkinter as tk  # Only the GUI needs Tk; card_fills works without it
+
+        image = tk.PhotoImage(master=self.master, width=CARD_WIDTH, height=CARD_HEIGHT)
+        for color, rect in card_fills(text, hidden):
+            image.put(color, to=rect)
+        return image
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+def preview(text, hidden=False):
+    """A card face as text, to check the font and layout without a display"""
+    pixels = [[" "] * CARD_WIDTH for _ in range(CARD_HEIGHT)]
+    marks = {BORDER_COLOR: "#", TEXT_COLOR: "#", CARD_COLOR: " ", BACK_TEXT_COLOR: " ", BACK_COLOR: "."}
+    for color, (x1, y1, x2, y2) in card_fills(text, hidden):
+        for y in range(y1, y2):
+            for x in range(x1, x2):
+                pixels[y][x] = marks[color]
+    return "\n".join("".join(row) for row in pixels)
+
+if __name__ == "__main__":
+    # Print the faces given (default: all of them and the back) with the fills each one takes
+    for text in sys.argv[1:] or FACES + [HIDDEN]:
+        hidden = text == HIDDEN
+        print(preview(text, hidden))
+        print(f"{text}: {len(card_fills(text, hidden))} fills\n")
@@ -0,0 +1,120 @@
+import hashlib
+import itertools
+import os
+import random
+import sys
+import time
+from functools import lru_cache
+
+# Card RNG defaults
+TABLE_BLOCK = 512  # Random bytes per refill of a server table's stream (~490 cards, ~50 rounds)
+
+def new_seed():
+    """A fresh 64-bit seed, for tables nobody asked to seed"""
+    return int.from_bytes(os.urandom(8), "big")
+
+def table_seed(seed, table_id):
+    """The seed of one table's cards, derived from the server's seed and the table id
+
+    Every table gets its own stream, and a table is reproduced from the
+    server seed and its id alone, whatever other tables did meanwhile.
+    An unseeded server (seed None) gives each table a fresh seed, which
+    still deals its cards and shuffles its shoe again when reused.
+    """
+    if seed is None:
+        return new_seed()
+    digest = hashlib.blake2b(f"{seed}:{table_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+@lru_cache(maxsize=None)
+def translation(cards):
+    """bytes.translate() arguments mapping random bytes onto a tuple of card values, and the bytes to drop"""
+    limit = 256 - 256 % len(cards)  # Past the largest multiple of len(cards), bytes would favour some cards
+    values = bytes(cards[byte % len(cards)] for byte in range(limit)) + bytes(256 - limit)
+    return values, bytes(range(limit, 256))
+
+def card_blocks(cards, seed, block_size=TABLE_BLOCK):
+    """Yield blocks of card values drawn with replacement from cards, forever, as bytes
+
+    Each block is block_size random bytes from random.Random(seed), turned
+    into card values by one bytes.translate() that also drops the bytes past
+    the largest multiple of len(cards), so a block costs two calls into C
+    whatever its size. The Mersenne Twister hands out whole 32-bit words, so
+    a seed gives the same cards at any block size that is a multiple of 4.
+    """
+    values, rejected = translation(tuple(cards))
+    rng = random.Random(seed)
+    while True:
+        yield rng.randbytes(block_size).translate(values, rejected)
+
+class CardStream:
+    """One table's card draws from its own seeded RNG, generated a block at a time
+
+    deal() is the C-level next() of an iterator over card_blocks(), so a
+    card costs one call into C instead of a random.choice() on the shared
+    module RNG, and Python only runs once per block. The RNG is created on
+    the first deal.
+    """
+
+    __slots__ = ("seed", "deal")
+
+    def __init__(self, cards, seed=None, block_size=TABLE_BLOCK):
+        self.seed = new_seed() if seed is None else seed  # Kept, so the table's cards can be dealt again
+        self.deal = itertools.chain.from_iterable(card_blocks(cards, self.seed, block_size)).__next__
+
+def new_rng(seed=None):
+    """The NumPy generator the simulators draw card blocks from (seed may be a SeedSequence)"""
+    import numpy as np  # Only the simulators need NumPy
+    return np.random.default_rng(seed)
+
+def byte_block(rng, size):
+    """size raw random bytes from a NumPy generator's bit generator, as one uint8 array
+
+    Nothing is mapped or rejected, so this is several times cheaper per byte than
+    translating blocks; the caller has to treat bytes past the last whole set of ranks as no card.
+    """
+    import numpy as np
+    return rng.bit_generator.random_raw(-(-size // 8)).view(np.uint8)[:size]
+
+def measure(draws=1_000_000):
+    """Compare per-card cost with random.choice and check a seed deals the same cards at any block size"""
+    from collections import Counter
+
+    from SmartServer import CARDS  # Imported here since SmartServer.py imports this module
+
+    start = time.perf_counter()
+    for _ in range(draws):
+        random.choice(CARDS)
+    choice_time = time.perf_counter() - start
+    print(f"random.choice: {choice_time / draws * 1e9:.0f} ns per card")
+
+    for block_size in (64, TABLE_BLOCK, 4096):
+        stream = CardStream(CARDS, 7, block_size)
+        start = time.perf_counter()
+        for _ in range(draws):
+            stream.deal()
+        elapsed = time.perf_counter() - start
+        print(f"CardStream, {block_size}-byte blocks: {elapsed / draws * 1e9:.0f} ns per card "
+              f"({choice_time / elapsed:.1f}x)")
+
+    number = 2000
+    start = time.perf_counter()
+    for seed in range(number):
+        CardStream(CARDS, seed).deal()
+    print(f"A new table's stream up to its first card: {(time.perf_counter() - start) / number * 1e6:.1f} us")
+
+    seed = 2024
+    reference = CardStream(CARDS, seed, 100)
+    expected = [reference.deal() for _ in range(5000)]
+    for block_size in (4, 52, TABLE_BLOCK):
+        stream = CardStream(CARDS, seed, block_size)
+        assert [stream.deal() for _ in range(5000)] == expected, block_size
+    print(f"Seed {seed}: same 5,000 cards at every block size")
+
+    stream = CardStream(CARDS, seed)
+    counts = Counter(stream.deal() for _ in range(draws))
+    shares = ", ".join(f"{card}: {counts[card] / draws:.4f}" for card in sorted(counts))
+    print(f"Share of each card over {draws:,} deals (1/13 = {1 / 13:.4f}, tens 4/13): {shares}")
+
+if __name__ == "__main__":
+    measure(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,219 @@
+import json
+import timeit
+
+from BinaryProtocol import BUST_MESSAGE, encode_payload, final_message
+from Hand import Hand
+
+# Update modes a client can ask for in reply to the welcome message
+UPDATES = ["full", "delta"]
+
+# Messages that only carry what changed, each numbered with "seq"
+DELTA_TYPES = {"deal", "card", "bust", "turn", "settle"}
+
+def requested_updates(message):
+    """Return the update mode a client asked for, or None if this is not an updates request"""
+    if message.get("type") != "updates":
+        return None
+    mode = message.get("mode")
+    return mode if mode in UPDATES else "full"
+
+def updates_reply(mode, seq=0):
+    """Acknowledgement of an updates request; deltas continue from seq"""
+    return {"type": "updates", "mode": mode, "seq": seq}
+
+def next_player(table):
+    """Seat that plays (or bets) next on a table"""
+    if table.in_turn():
+        return table.player_num
+    if table.player_num == 1 and table.hands_played:
+        return 2  # Player 1's hand is over, player 2 bets next
+    return 1
+
+def snapshot_message(table, seq=0):
+    """Everything a client needs to rebuild its state, sent in reply to {"type": "sync"}
+
+    seq is the number of the last delta the connection was sent, so the
+    client knows which deltas the snapshot already covers.
+    """
+    player = next_player(table)
+    snapshot = {
+        "type": "snapshot",
+        "seq": seq,
+        "table": table.table_id,
+        "player": player,
+        "player1_money": table.player1_money,
+        "player2_money": table.player2_money
+    }
+    if player == 2:
+        # Player 1's hand is still needed for the settlement
+        snapshot["player1_hand"] = table.player1_final_hand.to_list()
+    if table.in_turn():
+        snapshot["in_play"] = {
+            "player": player,
+            "player_hand": table.player_hand.to_list(),
+            "player_value": table.player_hand.value,
+            "dealer_visible": [table.dealer_hand[0]],
+            "bet": table.bets[player]
+        }
+    return snapshot
+
+class DeltaEncoder:
+    """Turns one connection's full replies into numbered deltas
+
+    A hit sends the new card instead of the whole hand, and the settlement
+    sends the dealer's cards past the up card, the results and each
+    player's money change instead of every hand and balance. The client
+    already has the rest, and rebuilds the full message with expand().
+    Messages that are not game updates (errors, game over, a resumed
+    welcome) go out unchanged and unnumbered.
+    """
+
+    def __init__(self, table):
+        self.seq = 0
+        self.watch(table)
+
+    def watch(self, table):
+        """Follow a table, e.g. one the client just resumed and got a full welcome for"""
+        self.table = table
+        self.money = {1: table.player1_money, 2: table.player2_money}  # As the client knows them
+
+    def encode(self, reply):
+        """The delta for a reply, or the reply itself if it has no delta form"""
+        message_type = reply.get("type")
+        seq = self.seq + 1
+
+        if message_type == "hit_result":
+            delta = {"type": "card", "seq": seq, "card": reply["card"]}
+
+        elif message_type == "game_state":
+            delta = {
+                "type": "deal",
+                "seq": seq,
+                "player": self.table.player_num,
+                "cards": reply["player_hand"],
+                "dealer": reply["dealer_visible"][0],
+                "bet": reply["bet"]
+            }
+
+        elif message_type == "player1_done":
+            delta = {"type": "turn", "seq": seq}
+
+        elif message_type == "result" and "player1_hand" in reply:
+            changes = [reply["player1_money"] - self.money[1], reply["player2_money"] - self.money[2]]
+            self.money = {1: reply["player1_money"], 2: reply["player2_money"]}
+            delta = {
+                "type": "settle",
+                "seq": seq,
+                "dealer": reply["dealer_hand"][1:],  # The up card is already known
+                "results": [reply["player1_result"], reply["player2_result"]],
+                "changes": changes
+            }
+
+        elif message_type == "result":
+            player = self.table.player_num  # The seat that busted
+            change = reply["money"] - self.money[player]
+            self.money[player] = reply["money"]
+            delta = {"type": "bust", "seq": seq, "card": reply["player_hand"][-1], "change": change}
+
+        else:
+            return reply
+
+        self.seq = seq
+        return delta
+
+def expand(delta, state):
+    """Rebuild the full message a delta stands for, from the client's state before it
+
+    state is a BlackjackClient.TableState (anything with its hands, money and
+    current_player will do). The result is the same dict full updates send.
+    """
+    message_type = delta["type"]
+
+    if message_type == "deal":
+        hand = delta["cards"]
+        return {
+            "type": "game_state",
+            "player_hand": hand,
+            "player_value": Hand(hand).value,
+            "dealer_visible": [delta["dealer"]],
+            "bet": delta["bet"]
+        }
+
+    if message_type == "card":
+        hand = state.hand() + [delta["card"]]
+        return {"type": "hit_result", "card": delta["card"], "player_hand": hand, "player_value": Hand(hand).value}
+
+    if message_type == "bust":
+        hand = state.hand() + [delta["card"]]
+        return {
+            "type": "result",
+            "player_hand": hand,
+            "player_value": Hand(hand).value,
+            "money": state.money() + delta["change"],
+            "result": "bust",
+            "message": BUST_MESSAGE
+        }
+
+    if message_type == "turn":
+        return {
+            "type": "player1_done",
+            "player1_hand": state.player1_hand,
+            "player1_value": Hand(state.player1_hand).value
+        }
+
+    if message_type == "settle":
+        dealer_hand = state.dealer_visible + delta["dealer"]
+        message = {
+            "type": "result",
+            "player1_hand": state.player1_hand,
+            "player1_value": Hand(state.player1_hand).value,
+            "player2_hand": state.player2_hand,
+            "player2_value": Hand(state.player2_hand).value,
+            "dealer_hand": dealer_hand,
+            "dealer_value": Hand(dealer_hand).value,
+            "player1_result": delta["results"][0],
+            "player2_result": delta["results"][1],
+            "player1_money": state.player1_money + delta["changes"][0],
+            "player2_money": state.player2_money + delta["changes"][1],
+        }
+        message["message"] = final_message(message)
+        return message
+
+    raise ValueError(f"Not a delta message: {message_type}")
+
+def compare():
+    """Print bytes and JSON encode cost (with the delta encoder) of a long round, full against delta"""
+    from BlackjackClient import TableState
+    from SmartServer import BlackjackTable
+
+    # Player 1 hits three times to 19, player 2 hits once to 16, the dealer draws from 16 and busts
+    cards = iter([10, 2, 9, 7, 2, 2, 3, 2, 4, 10, 10, 10, 10, 10])
+    table = BlackjackTable(deal=lambda: next(cards))
+    state = TableState()
+    state.apply(table.welcome_message())
+    encoder = DeltaEncoder(table)
+    script = [{"type": "bet", "amount": 25, "player": 1}, {"action": "hit", "player": 1},
+              {"action": "hit", "player": 1}, {"action": "hit", "player": 1}, {"action": "stand", "player": 1},
+              {"type": "bet", "amount": 25, "player": 2}, {"action": "hit", "player": 2},
+              {"action": "stand", "player": 2}]
+
+    probe = DeltaEncoder(table)  # Timed separately, so the real encoder's seq and money stay right
+    print(f"{'message':<19}{'full B':>7}{'delta B':>8}{'full bin B':>11}{'delta bin B':>12}"
+          f"{'full enc us':>12}{'delta enc us':>13}")
+    totals = [0, 0, 0, 0]
+    for client_message in script:
+        for reply in table.handle_message(client_message):
+            delta = encoder.encode(reply)
+            assert state.update(json.loads(json.dumps(delta))) == reply, (delta, reply)
+            sizes = [len(json.dumps(reply)), len(json.dumps(delta)), len(encode_payload(reply)),
+                     len(encode_payload(delta))]
+            totals = [total + size for total, size in zip(totals, sizes)]
+            number = 20000
+            full_time = timeit.timeit(lambda: json.dumps(reply).encode('utf-8'), number=number)
+            delta_time = timeit.timeit(lambda: json.dumps(probe.encode(reply)).encode('utf-8'), number=number)
+            print(f"{reply['type'] + '/' + delta['type']:<19}{sizes[0]:>7}{sizes[1]:>8}{sizes[2]:>11}"
+                  f"{sizes[3]:>12}{full_time / number * 1e6:>12.2f}{delta_time / number * 1e6:>13.2f}")
+    print(f"{'round':<19}{totals[0]:>7}{totals[1]:>8}{totals[2]:>11}{totals[3]:>12}")
+
+if __name__ == "__main__":
+    compare()
@@ -5,10 +5,15 @@ from tkinter import messagebox, simpledialog
 import threading
 import time
 import random
+import queue
+
+from BinaryProtocol import ProtocolError
+from BlackjackClient import CONNECT_TIMEOUT, HOST, PORT, BlackjackClient, action_message, bet_message
+from CardImages import CardImageCache
+from Hand import Hand
 
 # Client configuration
-HOST = '127.0.0.1'  # Server IP address
-PORT = 65432        # Server port
+POLL_INTERVAL = 20    # Milliseconds between drains of the network event queue
 
 # Card display settings - smaller cards with better spacing
 CARD_WIDTH = 65
@@ -17,6 +22,14 @@ CARD_SPACING = 72
 DEALER_Y = 30
 PLAYER1_Y = 170
 PLAYER2_Y = 320
+MAX_VISIBLE_CARDS = 5  # Longer hands show the first few cards, the last card and a count
+
+# Canvas rows: seat -> (title, title y, value y, card y)
+SEATS = {
+    "dealer": ("Dealer", 10, 25, DEALER_Y),
+    "player1": ("Player 1", 145, 160, PLAYER1_Y),
+    "player2": ("Player 2", 295, 310, PLAYER2_Y),
+}
 
 class TwoPlayerBlackjackClient(tk.Tk):
     def __init__(self):
@@ -27,25 +40,20 @@ class TwoPlayerBlackjackClient(tk.Tk):
         self.geometry("800x600")
         self.configure(bg="darkgreen")
         
-        # Game state variables
+        # The protocol lives in BlackjackClient; the window shows its table state
+        self.client = BlackjackClient(HOST, PORT)
+        self.state = self.client.state  # Hands, money and whose turn it is
         self.connected = False
-        self.player1_money = 0
-        self.player2_money = 0
-        self.current_bet = 0
-        self.player1_hand = []
-        self.player2_hand = []
-        self.dealer_visible = []
-        self.dealer_hand = []
-        self.game_in_progress = False
-        self.current_player = 1  # Track which player's turn it is (1 or 2)
-        
-        # Creating our socket
-        self.socket = None
+        self.waiting_for_reply = False  # A bet, hit or stand has been sent and not answered yet
+        
+        # The network thread posts (event, data) pairs here; only the Tk thread touches widgets
+        self.events = queue.Queue()
         
         # Set up the UI components
         self.setup_ui()
+        self.after(POLL_INTERVAL, self.process_events)
         
-        # Attempt connection in a separate thread to not block the UI
+        # Connect and receive in a separate thread so the UI never waits on the socket
         self.connection_thread = threading.Thread(target=self.connect_to_server)
         self.connection_thread.daemon = True
         self.connection_thread.start()
@@ -55,6 +63,7 @@ class TwoPlayerBlackjackClient(tk.Tk):
         # Canvas for drawing cards
         self.canvas = tk.Canvas(self, width=800, height=450, bg="darkgreen")
         self.canvas.pack(pady=5)
+        self.setup_scene()
         
         # Status frame
         status_frame = tk.Frame(self, bg="darkgreen")
@@ -132,49 +141,118 @@ class TwoPlayerBlackjackClient(tk.Tk):
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def connect_to_server(self):
-        """Connect to the blackjack server"""
+        """Connect to the blackjack server, then keep receiving on this thread"""
         try:
-            # Create a new socket
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(10)  # added a 10-second timeout for connection to server
-            
-            self.update_message("Connecting to server...")
-            
-            # Connect to server
-            self.socket.connect((HOST, PORT))
-            
-            # Set status to connected
-            self.connected = True
-            self.update_status_indicator("green")
-            self.update_message("Connected to server!")
-            
-            # Receive welcome message
-            welcome_data = self.receive_data()
-            if welcome_data and welcome_data.get("type") == "welcome":
-                self.player1_money = welcome_data.get("money", 0)
-                self.player2_money = welcome_data.get("money", 0)
-                self.update_money_display()
-                self.update_message("Two-Player Blackjack! Player 1's turn to bet.")
-                self.update_turn_indicator(1)
-                
-                # Enable betting now that we're connected
-                self.enable_betting()
-            else:
-                self.update_message("Error receiving data from server")
-                self.connected = False
-                self.update_status_indicator("red")
+            # Reads the welcome and switches to the binary encoding before the UI sees anything
+            welcome = self.client.connect(CONNECT_TIMEOUT)
         
         except socket.timeout:
-            self.update_message("Connection timed out. Server not responding.")
-            self.update_status_indicator("red")
+            self.events.put(("disconnected", "Connection timed out. Server not responding."))
+            return
         
         except ConnectionRefusedError:
-            self.update_message("Connection refused. Make sure the server is running.")
-            self.update_status_indicator("red")
+            self.events.put(("disconnected", "Connection refused. Make sure the server is running."))
+            return
         
         except Exception as e:
-            self.update_message(f"Connection error: {str(e)}")
-            self.update_status_indicator("red")
+            self.events.put(("disconnected", f"Connection error: {str(e)}"))
+            return
+        
+        self.events.put(("connected", welcome))
+        self.receive_loop()
+
+    def receive_loop(self):
+        """Read messages as they arrive, whether or not the UI asked for them, and queue them"""
+        while True:
+            try:
+                # One frame is exactly one message, however TCP splits or joins them
+                message = self.client.receive_message()
+            except (json.JSONDecodeError, ProtocolError):
+                self.events.put(("invalid", None))
+                continue
+            except Exception as e:
+                if self.connected:  # Not just the socket being closed by on_close
+                    self.events.put(("disconnected", f"Error receiving data: {str(e)}"))
+                return
+            
+            if message is None:
+                self.events.put(("disconnected", "Server closed the connection"))
+                return
+            self.events.put(("message", message))
+
+    def process_events(self):
+        """Handle everything the network thread has queued, then check again shortly"""
+        try:
+            while True:
+                event, data = self.events.get_nowait()
+                if event == "message":
+                    self.handle_message(data)
+                elif event == "connected":
+                    self.connected = True
+                    self.update_status_indicator("green")
+                    self.handle_welcome()
+                elif event == "invalid":
+                    self.update_message("Error: Received invalid data from server")
+                elif event == "disconnected":
+                    self.connected = False
+                    self.waiting_for_reply = False
+                    self.update_status_indicator("red")
+                    self.update_message(data)
+        except queue.Empty:
+            pass
+        self.after(POLL_INTERVAL, self.process_events)
+
+    def handle_message(self, message):
+        """Apply one server message to the table state and show it, on the Tk thread"""
+        self.waiting_for_reply = False
+        player = self.state.current_player  # Seat that played, before a bust or stand passes the turn
+        message_type = self.state.apply(message)
+        
+        if message_type == "game_state":
+            self.handle_game_state(message)
+        elif message_type == "hit_result":
+            self.handle_hit_result(message)
+        elif message_type == "player1_done":
+            self.update_turn_indicator()
+            self.update_message("Player 1 stands. Now Player 2's turn to place a bet.")
+            self.disable_game_controls()
+            self.enable_betting()
+        elif message_type == "result":
+            # Only the settlement after player 2 carries both hands; otherwise a player busted
+            if "player1_hand" in message:
+                self.handle_final_result(message)
+            else:
+                self.handle_player_result(player, message)
+        elif message_type in ("error", "game_over"):
+            self.update_message(message.get("message", "Server error"))
+        else:
+            self.update_message(f"Unexpected message from server: {message_type}")
+
+    def handle_welcome(self):
+        """Set up the table from the welcome the client read while connecting"""
+        self.update_message("Connected to server!")
+        self.update_money_display()
+        self.update_turn_indicator()
+        
+        if self.state.in_hand:
+            # Pick the recovered hand back up where it was left
+            self.resume_hand()
+        else:
+            self.update_message("Two-Player Blackjack! Player 1's turn to bet.")
+            
+            # Enable betting now that we're connected
+            self.enable_betting()
+
+    def resume_hand(self):
+        """Show a hand that was in play when the server went down and let the player finish it"""
+        state = self.state
+        hand = state.hand()
+        self.update_bet_display()
+        self.update_canvas()
+        self.update_message(f"Player {state.current_player}'s hand was recovered. "
+                            f"Hand value: {self.calculate_hand_value(hand)}{self.strategy_hint(hand)}")
+        self.enable_game_controls()
+        self.disable_betting()
 
     def update_status_indicator(self, color):
         """Update the connection status indicator color"""
@@ -191,19 +269,18 @@ class TwoPlayerBlackjackClient(tk.Tk):
         else:
             update()
 
-    def update_turn_indicator(self, player_num):
+    def update_turn_indicator(self):
         """Update the turn indicator to show which player's turn it is"""
-        self.turn_label.config(text=f"Player {player_num}'s Turn")
-        self.current_player = player_num
+        self.turn_label.config(text=f"Player {self.state.current_player}'s Turn")
 
     def update_money_display(self):
         """Update the money display labels"""
-        self.player1_money_label.config(text=f"Player 1 Money: ${self.player1_money}")
-        self.player2_money_label.config(text=f"Player 2 Money: ${self.player2_money}")
+        self.player1_money_label.config(text=f"Player 1 Money: ${self.state.player1_money}")
+        self.player2_money_label.config(text=f"Player 2 Money: ${self.state.player2_money}")
 
     def update_bet_display(self):
         """Update the bet display label"""
-        self.bet_label.config(text=f"Current Bet: ${self.current_bet}")
+        self.bet_label.config(text=f"Current Bet: ${self.state.bet}")
 
     def enable_betting(self):
         """Enable the bet button"""
@@ -223,32 +300,15 @@ class TwoPlayerBlackjackClient(tk.Tk):
         self.hit_button.config(state=tk.DISABLED)
         self.stand_button.config(state=tk.DISABLED)
 
-    def receive_data(self):
-        """Receive and parse data from the server"""
-        if not self.connected or not self.socket:
-            return None
-        
-        try:
-            data = self.socket.recv(1024).decode('utf-8')
-            if data:
-                return json.loads(data)
-        except json.JSONDecodeError:
-            self.update_message("Error: Received invalid data from server")
-        except Exception as e:
-            self.update_message(f"Error receiving data: {str(e)}")
-            self.connected = False
-            self.update_status_indicator("red")
-        
-        return None
-
     def send_data(self, data):
-        """Send data to the server"""
-        if not self.connected or not self.socket:
+        """Send data to the server; the reply arrives through process_events"""
+        if not self.connected:
             self.update_message("Not connected to server")
             return False
         
         try:
-            self.socket.sendall(json.dumps(data).encode('utf-8'))
+            self.client.send(data)
+            self.waiting_for_reply = True
             return True
         except Exception as e:
             self.update_message(f"Error sending data: {str(e)}")
@@ -262,12 +322,15 @@ class TwoPlayerBlackjackClient(tk.Tk):
             self.update_message("Not connected to server")
             return
         
-        if self.game_in_progress:
+        if self.state.in_hand:
             self.update_message("Game already in progress")
             return
         
+        if self.waiting_for_reply:
+            return
+        
         # Get current player's money
-        current_player_money = self.player1_money if self.current_player == 1 else self.player2_money
+        current_player_money = self.state.money()
         
         # Get bet amount
         bet_amount = self.bet_var.get()
@@ -278,154 +341,78 @@ class TwoPlayerBlackjackClient(tk.Tk):
             return
         
         # Sending the bet back to the server with player identifier
-        bet_data = {
-            "type": "bet",
-            "amount": bet_amount,
-            "player": self.current_player
-        }
+        if self.send_data(bet_message(bet_amount, self.state.current_player)):
+            self.update_message(f"Player {self.state.current_player} placing bet: ${bet_amount}")
+
+    def handle_game_state(self, game_state):
+        """Show the hand the server dealt for a bet"""
+        # Update UI
+        self.update_bet_display()
+        self.update_canvas()
+        player_value = game_state.get('player_value', 0)
+        self.update_message(f"Player {self.state.current_player}'s turn. Hand value: {player_value}"
+                            f"{self.strategy_hint(self.state.hand())}")
         
-        if self.send_data(bet_data):
-            self.current_bet = bet_amount
-            self.update_bet_display()
-            self.update_message(f"Player {self.current_player} placing bet: ${bet_amount}")
-            
-            # Get game state from server
-            game_state = self.receive_data()
-            
-            if game_state and game_state.get("type") == "game_state":
-                # Update game state based on current player
-                if self.current_player == 1:
-                    self.player1_hand = game_state.get("player_hand", [])
-                else:
-                    self.player2_hand = game_state.get("player_hand", [])
-                    
-                self.dealer_visible = game_state.get("dealer_visible", [])
-                self.dealer_hand = []  # Will be populated later
-                self.game_in_progress = True
-                
-                # Update UI
-                self.update_canvas()
-                player_value = game_state.get('player_value', 0)
-                self.update_message(f"Player {self.current_player}'s turn. Hand value: {player_value}")
-                
-                # Enable game controls
-                self.enable_game_controls()
-                self.disable_betting()
-            else:
-                self.update_message("Error starting game")
+        # Enable game controls
+        self.enable_game_controls()
+        self.disable_betting()
 
     def hit(self):
         """Request another card from the server"""
-        if not self.game_in_progress:
+        if not self.state.in_hand or self.waiting_for_reply:
             return
         
-        # Send hit action to server with player identifier
-        hit_data = {
-            "action": "hit",
-            "player": self.current_player
-        }
+        # A hit_result, or a result if the player busts, arrives through process_events
+        self.send_data(action_message("hit", self.state.current_player))
+
+    def handle_hit_result(self, result):
+        """Show the card the server dealt for a hit"""
+        player_value = result.get("player_value", 0)
         
-        if self.send_data(hit_data):
-            # Get result from server
-            result = self.receive_data()
-            
-            if result:
-                if result.get("type") == "hit_result":
-                    # Update player hand based on current player
-                    if self.current_player == 1:
-                        self.player1_hand = result.get("player_hand", [])
-                    else:
-                        self.player2_hand = result.get("player_hand", [])
-                        
-                    player_value = result.get("player_value", 0)
-                    
-                    # Update UI
-                    self.update_canvas()
-                    self.update_message(f"Player {self.current_player} drew a {result.get('card')}. Hand value: {player_value}")
-                
-                elif result.get("type") == "result":
-                    # Player busted, handle game result
-                    self.handle_player_result(result)
-            else:
-                self.update_message("Error receiving hit result")
+        # Update UI
+        self.update_canvas()
+        self.update_message(f"Player {self.state.current_player} drew a {result.get('card')}. "
+                            f"Hand value: {player_value}{self.strategy_hint(self.state.hand())}")
 
     def stand(self):
         """Stand with current hand"""
-        if not self.game_in_progress:
+        if not self.state.in_hand or self.waiting_for_reply:
             return
         
-        # Send stand action to server with player identifier
-        stand_data = {
-            "action": "stand",
-            "player": self.current_player
-        }
-        
-        if self.send_data(stand_data):
-            if self.current_player == 1:
-                # Player 1 is done, switch to Player 2
-                result = self.receive_data()
-                if result and result.get("type") == "player1_done":
-                    self.update_turn_indicator(2)
-                    self.update_message("Player 1 stands. Now Player 2's turn to place a bet.")
-                    self.game_in_progress = False
-                    self.disable_game_controls()
-                    self.enable_betting()
-                else:
-                    self.update_message("Error receiving stand result")
-            else:
-                # Player 2 is done, get final result
-                result = self.receive_data()
-                if result and result.get("type") == "result":
-                    self.handle_final_result(result)
-                else:
-                    self.update_message("Error receiving stand result")
-
-    def handle_player_result(self, result):
+        # player1_done after Player 1, the final result after Player 2
+        self.send_data(action_message("stand", self.state.current_player))
+
+    def strategy_hint(self, hand):
+        """Suggested action for a hand from the precomputed strategy table"""
+        if not self.state.dealer_visible:
+            return ""
+        from StrategyTable import get_table  # Loaded on the first hint, not at startup
+        action = get_table().advise(hand, self.state.dealer_visible[0])
+        return f" (Suggested: {action.capitalize()})"
+
+    def handle_player_result(self, player, result):
         """Handle a player busting during the game"""
-        # Update game state for the current player
-        if self.current_player == 1:
-            self.player1_hand = result.get("player_hand", [])
-            self.player1_money = result.get("money", self.player1_money)
-        else:
-            self.player2_hand = result.get("player_hand", [])
-            self.player2_money = result.get("money", self.player2_money)
-            
         # Update UI
         self.update_money_display()
         self.update_canvas()
-        self.update_message(f"Player {self.current_player} {result.get('message', 'Game over')}")
+        self.update_turn_indicator()
+        self.disable_game_controls()
+        self.enable_betting()
         
-        if self.current_player == 1:
-            # Switch to Player 2's turn
-            self.update_turn_indicator(2)
-            self.game_in_progress = False
-            self.disable_game_controls()
-            self.enable_betting()
+        if player == 1:
+            # Player 2's turn
             self.update_message(f"Player 1 busted. Now Player 2's turn to place a bet.")
         else:
-            # Both players have played, game is over
-            self.game_in_progress = False
-            self.disable_game_controls()
-            self.enable_betting()
-            self.update_turn_indicator(1)  # Reset to Player 1 for next round
+            # Both players have played, Player 1 starts the next round
             self.update_message(f"Player 2 busted. Round complete. Player 1's turn to bet for the next round.")
         
         # Check if any player is out of money
-        if self.player1_money <= 0 or self.player2_money <= 0:
+        if self.state.is_finished():
             messagebox.showinfo("Game Over", "Game over! One player is out of money!")
             self.quit()
 
     def handle_final_result(self, result):
         """Handle the end-game result from the server after both players have played"""
-        # Update game state
-        self.player1_hand = result.get("player1_hand", [])
-        self.player2_hand = result.get("player2_hand", [])
-        self.dealer_hand = result.get("dealer_hand", [])
-        self.dealer_visible = []  # Clear visible cards, we now show the full hand
-        self.player1_money = result.get("player1_money", self.player1_money)
-        self.player2_money = result.get("player2_money", self.player2_money)
-        self.game_in_progress = False
-        
         # Create a detailed result message
         player1_result = result.get("player1_result", "")
         player2_result = result.get("player2_result", "")
@@ -457,167 +444,153 @@ class TwoPlayerBlackjackClient(tk.Tk):
         self.update_canvas()
         self.update_message(result_message)
         
-        # Disable game controls, enable betting, and set turn to Player 1 for next round
+        # Disable game controls, enable betting, and show Player 1's turn for the next round
         self.disable_game_controls()
         self.enable_betting()
-        self.update_turn_indicator(1)
+        self.update_turn_indicator()
         
         # Check if any player is out of money
-        if self.player1_money <= 0 or self.player2_money <= 0:
+        if self.state.is_finished():
             messagebox.showinfo("Game Over", "Game over! One player is out of money!")
             self.quit()
 
-    def draw_card(self, x, y, value, hidden=False):
-        """Draw a card on the canvas"""
-        # Card background with thicker border
-        self.canvas.create_rectangle(x, y, x + CARD_WIDTH, y + CARD_HEIGHT, 
-                                    fill="white", outline="black", width=3)
-        
-        if hidden:
-            # Hidden card, dealers card (card back)
-            self.canvas.create_rectangle(x + 5, y + 5, x + CARD_WIDTH - 5, y + CARD_HEIGHT - 5, 
-                                        fill="red", outline="", width=0)
-            self.canvas.create_text(x + CARD_WIDTH/2, y + CARD_HEIGHT/2, 
-                                   text="?", fill="white", font=("Courier", 20, "bold"))
+    def setup_scene(self):
+        """Create the canvas items that are always there; cards are added as hands grow
+
+        The scene is retained: update_canvas moves, re-texts and hides these
+        items instead of deleting everything and drawing it again.
+        """
+        self.card_slots = {seat: [] for seat in SEATS}  # Card items per seat, reused round after round
+        self.seat_items = {}                              # seat -> (value text, "more cards" text)
+        self.shown = {seat: None for seat in SEATS}       # What each seat last rendered
+        self.card_images = CardImageCache(self.canvas)    # Each card face is painted once
+        self.canvas_stats = {"updates": 0, "seats_drawn": 0, "items_created": 0, "seconds": 0.0}
+        
+        for seat, (title, title_y, value_y, card_y) in SEATS.items():
+            self.canvas.create_text(400, title_y, text=title, fill="white", font=("Courier", 14, "bold"))
+            value_item = self.canvas.create_text(400, value_y, text="", fill="white", font=("Courier", 10))
+            more_item = self.canvas.create_text(400, card_y + CARD_HEIGHT + 15, text="",
+                                                fill="yellow", font=("Courier", 8))
+            self.seat_items[seat] = (value_item, more_item)
+            self.canvas_stats["items_created"] += 3
+
+    def create_card_slot(self, seat, index):
+        """Create the image item of one card position, hidden until a card is shown in it"""
+        slot = {
+            "x": 0,          # The item is created at x=0 and moved into place
+            "card": None,    # (value, hidden) currently shown, None while the slot is hidden
+            "image": self.canvas.create_image(0, SEATS[seat][3], anchor=tk.NW, state=tk.HIDDEN,
+                                              tags=f"{seat}_card{index}"),
+        }
+        self.canvas_stats["items_created"] += 1
+        return slot
+
+    def draw_card(self, slot, x, value, hidden=False):
+        """Show a card in a slot, touching only what differs from what it shows now"""
+        canvas = self.canvas
+        if x != slot["x"]:
+            canvas.move(slot["image"], x - slot["x"], 0)
+            slot["x"] = x
+        if slot["card"] == (value, hidden):
+            return
+        
+        # Card value and symbol
+        card_text = str(value)
+        if value == 11:
+            card_text = "A"  # Ace
+        elif value == 10:
+            # Randomly pick a face card or 10, once per card rather than on every redraw
+            card_text = random.choice(["10", "J", "Q", "K"])
+        canvas.itemconfig(slot["image"], image=self.card_images.get(card_text, hidden), state=tk.NORMAL)
+        slot["card"] = (value, hidden)
+
+    def hide_card(self, slot):
+        """Hide a slot the current hand doesn't reach"""
+        if slot["card"] is not None:
+            self.canvas.itemconfig(slot["image"], state=tk.HIDDEN)
+            slot["card"] = None
+
+    def seat_view(self, seat):
+        """The cards (value, hidden), value text and "more cards" text a seat should show"""
+        state = self.state
+        if seat == "dealer":
+            if state.dealer_hand:
+                # Full dealer hand (end of game)
+                hand = state.dealer_hand
+            else:
+                # Only visible dealer cards (during gameplay), then the hidden card
+                if not state.dealer_visible:
+                    return (), "", ""
+                cards = [(card, False) for card in state.dealer_visible] + [(0, True)]
+                return tuple(cards), "", ""
         else:
-            # Card value and symbol
-            card_text = str(value)
-            if value == 11:
-                card_text = "A"  # Ace
-            elif value == 10:
-                # Randomly pick a face card or 10
-                card_text = random.choice(["10", "J", "Q", "K"])
-            
-            # Main card value
-            self.canvas.create_text(x + CARD_WIDTH/2, y + CARD_HEIGHT/2, 
-                                   text=card_text, fill="black", font=("Courier", 20, "bold"))
-            
-            # Card corner values - only in top left to save space
-            small_text = card_text
-            self.canvas.create_text(x + 8, y + 12, text=small_text, 
-                                   fill="black", font=("Courier", 10, "bold"))
+            hand = state.player1_hand if seat == "player1" else state.player2_hand
+            if not hand:
+                return (), "", ""
+        
+        more = ""
+        shown = list(hand)
+        if len(hand) > MAX_VISIBLE_CARDS:
+            # Draw the first few cards and the last, with a count of the skipped ones
+            shown = shown[:MAX_VISIBLE_CARDS - 1] + shown[-1:]
+            more = f"(+{len(hand) - MAX_VISIBLE_CARDS} more cards)"
+        value_text = f"Value: {self.calculate_hand_value(hand)}"
+        return tuple((card, False) for card in shown), value_text, more
 
     def update_canvas(self):
-        """Update the game canvas with current game state"""
-        self.canvas.delete("all")
-        
-        # Draw dealer's cards
-        self.canvas.create_text(400, 10, text="Dealer", fill="white", font=("Courier", 14, "bold"))
-        
-        if self.dealer_hand:
-            # Full dealer hand (end of game)
-            dealer_value = self.calculate_hand_value(self.dealer_hand)
-            self.canvas.create_text(400, 25, text=f"Value: {dealer_value}", 
-                                   fill="white", font=("Courier", 10))
+        """Update the game canvas with current game state, redrawing only seats that changed"""
+        start = time.perf_counter()
+        stats = self.canvas_stats
+        stats["updates"] += 1
+        
+        for seat in SEATS:
+            view = self.seat_view(seat)
+            if view == self.shown[seat]:
+                continue  # e.g. the other player's hand on a hit
+            self.shown[seat] = view
+            stats["seats_drawn"] += 1
             
-            # Draw all dealer cards - limit how many are shown side by side
-            max_visible = 5
-            if len(self.dealer_hand) > max_visible:
-                # Draw first few cards
-                start_x = 400 - (max_visible * CARD_SPACING) // 2
-                for i in range(max_visible-1):
-                    self.draw_card(start_x + i * CARD_SPACING, DEALER_Y, self.dealer_hand[i])
-                # Draw last card with indicator that cards are skipped
-                self.draw_card(start_x + (max_visible-1) * CARD_SPACING, DEALER_Y, self.dealer_hand[-1])
-                # Text indicating skipped cards
-                self.canvas.create_text(400, DEALER_Y + CARD_HEIGHT + 15, 
-                                      text=f"(+{len(self.dealer_hand) - max_visible} more cards)", 
-                                      fill="yellow", font=("Courier", 8))
-            else:
-                # Draw all dealer cards
-                start_x = 400 - (len(self.dealer_hand) * CARD_SPACING) // 2
-                for i, card in enumerate(self.dealer_hand):
-                    self.draw_card(start_x + i * CARD_SPACING, DEALER_Y, card)
-                
-        elif self.dealer_visible:
-            # Only visible dealer cards (during gameplay)
-            start_x = 400 - (2 * CARD_SPACING) // 2  # Assume 2 cards initially
+            cards, value_text, more = view
+            slots = self.card_slots[seat]
+            while len(slots) < len(cards):
+                slots.append(self.create_card_slot(seat, len(slots)))
             
-            # Draw visible card(s)
-            for i, card in enumerate(self.dealer_visible):
-                self.draw_card(start_x + i * CARD_SPACING, DEALER_Y, card)
+            start_x = 400 - (len(cards) * CARD_SPACING) // 2
+            for i, (value, hidden) in enumerate(cards):
+                self.draw_card(slots[i], start_x + i * CARD_SPACING, value, hidden)
+            for slot in slots[len(cards):]:
+                self.hide_card(slot)
             
-            # Draw hidden card
-            self.draw_card(start_x + len(self.dealer_visible) * CARD_SPACING, DEALER_Y, 0, hidden=True)
+            value_item, more_item = self.seat_items[seat]
+            self.canvas.itemconfig(value_item, text=value_text)
+            self.canvas.itemconfig(more_item, text=more)
         
-        # Draw Player 1's cards
-        self.canvas.create_text(400, 145, text="Player 1", fill="white", font=("Courier", 14, "bold"))
-
-        if self.player1_hand:
-            player1_value = self.calculate_hand_value(self.player1_hand)
-            self.canvas.create_text(400, 160, text=f"Value: {player1_value}", 
-                                fill="white", font=("Courier", 10))
-            
-            # Handle large hands for player 1
-            max_visible = 5
-            if len(self.player1_hand) > max_visible:
-                # Draw first few cards
-                start_x = 400 - (max_visible * CARD_SPACING) // 2
-                for i in range(max_visible-1):
-                    self.draw_card(start_x + i * CARD_SPACING, PLAYER1_Y, self.player1_hand[i])
-                # Draw last card
-                self.draw_card(start_x + (max_visible-1) * CARD_SPACING, PLAYER1_Y, self.player1_hand[-1])
-                # Text indicating skipped cards
-                self.canvas.create_text(400, PLAYER1_Y + CARD_HEIGHT + 15, 
-                                      text=f"(+{len(self.player1_hand) - max_visible} more cards)", 
-                                      fill="yellow", font=("Courier", 8))
-            else:
-                # Draw all player 1 cards
-                start_x = 400 - (len(self.player1_hand) * CARD_SPACING) // 2
-                for i, card in enumerate(self.player1_hand):
-                    self.draw_card(start_x + i * CARD_SPACING, PLAYER1_Y, card)
-        
-        # Draw Player 2's cards - centered at position 400 instead of 200
-        self.canvas.create_text(400, 295, text="Player 2", fill="white", font=("Courier", 14, "bold"))
-       
-        if self.player2_hand:
-            player2_value = self.calculate_hand_value(self.player2_hand)
-            self.canvas.create_text(400, 310, text=f"Value: {player2_value}", 
-                                fill="white", font=("Courier", 10))
-            
-            # Handle large hands for player 2 - centered at position 400
-            max_visible = 5
-            if len(self.player2_hand) > max_visible:
-                # Draw first few cards
-                start_x = 400 - (max_visible * CARD_SPACING) // 2
-                for i in range(max_visible-1):
-                    self.draw_card(start_x + i * CARD_SPACING, PLAYER2_Y, self.player2_hand[i])
-                # Draw last card
-                self.draw_card(start_x + (max_visible-1) * CARD_SPACING, PLAYER2_Y, self.player2_hand[-1])
-                # Text indicating skipped cards
-                self.canvas.create_text(400, PLAYER2_Y + CARD_HEIGHT + 15, 
-                                      text=f"(+{len(self.player2_hand) - max_visible} more cards)", 
-                                      fill="yellow", font=("Courier", 8))
-            else:
-                # Draw all player 2 cards
-                start_x = 400 - (len(self.player2_hand) * CARD_SPACING) // 2
-                for i, card in enumerate(self.player2_hand):
-                    self.draw_card(start_x + i * CARD_SPACING, PLAYER2_Y, card)
+        stats["seconds"] += time.perf_counter() - start
 
+    def print_canvas_stats(self):
+        """Report how much canvas work the game took, for comparing rendering changes"""
+        stats = self.canvas_stats
+        if stats["updates"]:
+            print(f"Canvas: {stats['updates']} updates, {stats['seats_drawn']} seats redrawn, "
+                  f"{stats['items_created']} items created, "
+                  f"{stats['seconds'] / stats['updates'] * 1000:.2f} ms per update")
+            images = self.card_images
+            print(f"Card images: {len(images.images)} painted, {images.hits} cache hits, "
+                  f"{images.misses} misses ({images.hit_rate():.1%} hit rate)")
 
     def calculate_hand_value(self, hand):
         """Calculate the value of a hand, adjusting for aces"""
-        if not hand:
-            return 0
-            
-        total = sum(hand)
-        # Count aces (value 11) in the hand
-        aces = hand.count(11)
-        # Adjust aces from 11 to 1 as needed
-        while total > 21 and aces > 0:
-            total -= 10
-            aces -= 1
-        return total
+        return Hand(hand).value
 
     def on_close(self):
         """Handle window close event"""
         if messagebox.askokcancel("Quit", "Do you want to quit the game?"):
+            self.print_canvas_stats()
             self.connected = False
-            if self.socket:
-                try:
-                    self.socket.close()
-                except:
-                    pass
+            try:
+                self.client.close()  # Also wakes the network thread's recv
+            except OSError:
+                pass
             self.destroy()
 
 # Main entry point
@@ -0,0 +1,125 @@
+import struct
+import time
+from collections import deque
+
+import Serializer
+from Serializer import StaticMessage
+
+# Every message on the wire is a 4-byte big-endian length followed by the payload
+HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 1 << 20  # Refuse frames over 1 MB
+RECV_SIZE = 65536
+
+class FrameError(ValueError):
+    """Raised when the peer sends a frame we refuse to buffer"""
+
+def encode_frame(payload):
+    """Prefix a payload with its length"""
+    return HEADER.pack(len(payload)) + payload
+
+def encode_message(message):
+    """Encode a message dict as a ready-to-send JSON frame"""
+    if type(message) is StaticMessage:
+        return message.frame(encode_message)
+    return encode_frame(Serializer.dumps(message))
+
+def decode_message(payload):
+    """Decode one frame payload back into a message dict"""
+    return Serializer.loads(payload)
+
+class FrameDecoder:
+    """Incremental decoder that turns a byte stream back into frames
+
+    Bytes are appended to one growing buffer and frames are sliced out of it
+    through a memoryview, so a read holding many frames costs one pass and a
+    frame split across many reads is assembled without re-joining chunks.
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.position = 0  # Start of the first unconsumed byte
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        """Add received bytes and return every frame payload now complete"""
+        self.buffer += data
+        return self.frames()
+
+    def frames(self):
+        """Extract all complete frame payloads from the buffer"""
+        payloads = []
+        buffer = self.buffer
+        end = len(buffer)
+        position = self.position
+
+        with memoryview(buffer) as view:
+            while end - position >= HEADER.size:
+                (length,) = HEADER.unpack_from(buffer, position)
+                if length > self.max_frame_size:
+                    raise FrameError(f"Frame of {length} bytes exceeds limit of {self.max_frame_size}")
+                if end - position - HEADER.size < length:
+                    break  # Wait for the rest of this frame
+                start = position + HEADER.size
+                payloads.append(bytes(view[start:start + length]))
+                position = start + length
+
+        # Drop consumed bytes once they make up most of the buffer
+        if position == end:
+            buffer.clear()
+            position = 0
+        elif position > end // 2:
+            del buffer[:position]
+            position = 0
+        self.position = position
+        return payloads
+
+    def pending(self):
+        """Number of buffered bytes not yet returned as a frame"""
+        return len(self.buffer) - self.position
+
+class FrameSocket:
+    """Blocking socket wrapper that sends and receives whole messages"""
+
+    def __init__(self, sock, encode=encode_message, decode=decode_message, metrics=None):
+        self.socket = sock
+        self.decoder = FrameDecoder()
+        self.messages = deque()
+        self.metrics = metrics  # Counts bytes in and out, if given
+        self.heartbeat = None   # Heartbeat.Heartbeat noting when bytes came in, if given
+
+        # Message codec, swapped once an encoding is negotiated
+        self.encode = encode
+        self.decode = decode
+
+    def send_message(self, message):
+        """Frame and send one message"""
+        frame = self.encode(message)
+        self.socket.sendall(frame)
+        if self.metrics:
+            self.metrics.bytes_sent += len(frame)
+
+    def receive_payload(self):
+        """Return the next frame payload, or None once the peer disconnects"""
+        while not self.messages:
+            if not self.fill():
+                return None
+        return self.messages.popleft()
+
+    def fill(self):
+        """Read from the socket once and queue the frames it completes; False once the peer disconnects"""
+        data = self.socket.recv(RECV_SIZE)
+        if not data:
+            return False
+        if self.metrics:
+            self.metrics.bytes_received += len(data)
+        self.messages.extend(self.decoder.feed(data))
+        if self.heartbeat:
+            self.heartbeat.received(time.monotonic(), self.decoder.pending())
+        return True
+
+    def receive_message(self):
+        """Return the next decoded message, or None once the peer disconnects"""
+        payload = self.receive_payload()
+        if payload is None:
+            return None
+        return self.decode(payload)
@@ -0,0 +1,96 @@
+import itertools
+import sys
+import time
+
+class Hand:
+    """Cards in a hand with the value kept up to date as cards are added
+
+    value already counts every ace that had to drop from 11 to 1, and
+    soft_aces is how many are still counted as 11, so adding a card and
+    reading the value are O(1) instead of re-summing the list each time.
+    value is a plain attribute, the same as calculate_hand_value(cards).
+    """
+
+    __slots__ = ("cards", "value", "soft_aces")
+
+    def __init__(self, cards=()):
+        self.cards = []
+        self.value = 0
+        self.soft_aces = 0
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        """Add a card, turning aces from 11 to 1 as needed to stay at 21 or under"""
+        self.cards.append(card)
+        self.value += card
+        if card == 11:
+            self.soft_aces += 1
+        # At most two passes (a new ace on a soft hand), never a rescan of the cards
+        while self.value > 21 and self.soft_aces:
+            self.value -= 10
+            self.soft_aces -= 1
+
+    @property
+    def soft(self):
+        """True while an ace is still counted as 11"""
+        return self.soft_aces > 0
+
+    def is_bust(self):
+        return self.value > 21
+
+    def to_list(self):
+        """The list of card values sent on the wire (the hand's own list, not a copy)"""
+        return self.cards
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __getitem__(self, index):
+        return self.cards[index]
+
+    def __repr__(self):
+        return f"Hand({self.cards!r})"
+
+def verify(max_cards=6):
+    """Check Hand against calculate_hand_value on every hand up to max_cards cards, then time both"""
+    from SmartServer import CARDS, calculate_hand_value
+
+    ranks = sorted(set(CARDS))
+    checked = 0
+    for size in range(1, max_cards + 1):
+        for cards in itertools.product(ranks, repeat=size):
+            hand = Hand()
+            for i, card in enumerate(cards, 1):
+                hand.add(card)
+                if hand.value != calculate_hand_value(list(cards[:i])):
+                    raise AssertionError(f"{cards[:i]}: Hand gives {hand.value}, "
+                                         f"calculate_hand_value gives {calculate_hand_value(list(cards[:i]))}")
+            checked += 1
+    print(f"Hand matches calculate_hand_value on all {checked:,} hands of 1-{max_cards} cards")
+
+    # Dealer-style loop: add a card, read the value, until the hand is done
+    hands = [list(cards) for cards in itertools.product(ranks, repeat=5)]
+    start = time.perf_counter()
+    for cards in hands:
+        hand = []
+        for card in cards:
+            hand.append(card)
+            calculate_hand_value(hand)
+    list_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for cards in hands:
+        hand = Hand()
+        for card in cards:
+            hand.add(card)
+            hand.value
+    hand_time = time.perf_counter() - start
+    steps = len(hands) * 5
+    print(f"add + value per card over 5-card hands: list {list_time / steps * 1e9:.0f} ns, "
+          f"Hand {hand_time / steps * 1e9:.0f} ns")
+
+if __name__ == "__main__":
+    verify(int(sys.argv[1]) if len(sys.argv) > 1 else 6)
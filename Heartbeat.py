@@ -0,0 +1,182 @@
+import asyncio
+import time
+
+from Serializer import StaticMessage, error_message
+
+# Connection deadlines, in seconds
+PING_INTERVAL = 30.0   # Silence from a client before the server pings it
+PONG_TIMEOUT = 15.0    # Time a pinged client has to send anything back before it counts as dead
+READ_TIMEOUT = 15.0    # Time a frame may take to arrive in full once its first bytes are in
+IDLE_TIMEOUT = 600.0   # Time a player may go without a game message; pings and pongs don't count
+SEND_TIMEOUT = 30.0    # Time a client may leave its replies unread with its write buffer full
+REAP_INTERVAL = 1.0    # Time between sweeps of every connection's deadlines
+
+# Outbound buffering
+MAX_OUTBOUND = 64 * 1024  # Write buffer high-water mark; over it the server stops reading from the client
+
+# Either side may ping; the other answers with a pong
+PING = StaticMessage(type="ping")
+PONG = StaticMessage(type="pong")
+HEARTBEAT_TYPES = {"ping", "pong"}
+
+# Told to an idle player before it is disconnected
+IDLE_CLOSE = error_message("Disconnected after too long without a move")
+
+# Reasons a connection is reaped
+DEAD = "dead"        # Didn't answer a ping
+STALLED = "stalled"  # Started a frame and never finished it
+IDLE = "idle"        # Answered pings but stopped playing
+SLOW = "slow"        # Stopped reading its replies
+
+class Heartbeat:
+    """A connection's deadlines: when it was last heard from, played, pinged and blocked
+
+    Every field is a time.monotonic() value set as traffic happens, so the
+    serving path only stores timestamps and due() decides what to do later.
+    """
+
+    __slots__ = ("heard", "active", "ping_sent", "partial_since", "blocked_since", "idle_allowed")
+
+    def __init__(self, now):
+        self.heard = now            # Last bytes received
+        self.active = now           # Last game message received
+        self.ping_sent = None       # Ping not answered yet
+        self.partial_since = None   # First bytes of a frame still incomplete
+        self.blocked_since = None   # Waiting for the client to read its replies
+        self.idle_allowed = False   # Spectators watch without playing
+
+    def received(self, now, partial):
+        """Account for bytes from the client; partial tells if they leave a frame incomplete"""
+        self.heard = now
+        self.ping_sent = None  # Any bytes prove the client is there
+        if not partial:
+            self.partial_since = None
+        elif self.partial_since is None:
+            self.partial_since = now
+
+    def due(self, now):
+        """What the connection needs now: a reap reason, PING, or None"""
+        if self.blocked_since is not None and now - self.blocked_since > SEND_TIMEOUT:
+            return SLOW
+        if self.partial_since is not None and now - self.partial_since > READ_TIMEOUT:
+            return STALLED
+        if self.ping_sent is not None:
+            return DEAD if now - self.ping_sent > PONG_TIMEOUT else None
+        if not self.idle_allowed and now - self.active > IDLE_TIMEOUT:
+            return IDLE
+        if now - self.heard > PING_INTERVAL:
+            return PING
+        return None
+
+class Reaper:
+    """Pings quiet connections and disconnects stuck ones, for every connection on the event loop
+
+    One task sweeps every connection's Heartbeat each REAP_INTERVAL instead
+    of each read and drain carrying its own timeout, so a message only costs
+    a few timestamp stores and a stuck connection is gone within a second of
+    its deadline. A reaped connection's transport is aborted: its buffered
+    replies are dropped and its socket closed at once, rather than waiting
+    on a client that isn't reading. The handler then sees a connection error
+    and closes its table as if the client had left.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = stats
+        self.connections = set()
+        self.task = None
+
+    def add(self, connection):
+        """Start watching a connection's deadlines and return its Heartbeat"""
+        connection.heartbeat = Heartbeat(time.monotonic())
+        connection.writer.transport.set_write_buffer_limits(high=MAX_OUTBOUND)
+        self.connections.add(connection)
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return connection.heartbeat
+
+    def remove(self, connection):
+        self.connections.discard(connection)
+        if not self.connections and self.task:
+            self.task.cancel()  # Nothing to watch; the next connection starts another
+            self.task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            self.sweep(time.monotonic())
+
+    def sweep(self, now):
+        """Ping or reap every connection whose deadline has passed"""
+        stats = self.stats
+        start = time.perf_counter_ns()
+        for connection in list(self.connections):
+            action = connection.heartbeat.due(now)
+            if action is None:
+                continue
+            if action is PING:
+                # Straight to the socket: not a reply, so not part of a recorded session
+                frame = connection.encode(PING)
+                connection.writer.write(frame)
+                connection.heartbeat.ping_sent = now
+                if stats:
+                    stats.pings_sent += 1
+                    stats.bytes_sent += len(frame)
+            else:
+                self.reap(connection, action)
+        if stats:
+            stats.observe("reap_sweep", time.perf_counter_ns() - start)
+
+    def reap(self, connection, reason):
+        self.remove(connection)
+        transport = connection.writer.transport
+        if reason == IDLE and not transport.get_write_buffer_size():
+            # Still reading, so it can be told why and closed cleanly
+            connection.writer.write(connection.encode(IDLE_CLOSE))
+            transport.close()
+        else:
+            transport.abort()
+        if self.stats:
+            self.stats.reap(reason)
+
+async def sweep_cost(count, host="127.0.0.1"):
+    """Open count idle connections to an in-process server and return its median sweep time in ns"""
+    from AsyncServer import ServerStats, serve  # Imported here since AsyncServer.py imports this module
+
+    stats = ServerStats()
+    server = await serve(host, 0, stats)
+    port = server.sockets[0].getsockname()[1]
+    streams = [await asyncio.open_connection(host, port) for _ in range(count)]
+    await asyncio.sleep(REAP_INTERVAL * 5.5)
+    for _, writer in streams:
+        writer.close()
+    while stats.active_tables:
+        await asyncio.sleep(0.01)  # Let every handler see its client leave
+    server.close()
+    await server.wait_closed()
+    return stats.latency["reap_sweep"].quantile(0.5)
+
+def measure(counts=(100, 1000, 4000)):
+    """Per-connection memory and CPU cost of the deadlines"""
+    import timeit
+    import tracemalloc
+
+    number = 10000
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    heartbeats = {Heartbeat(0.0) for _ in range(number)}  # In a set, like the connections of a Reaper
+    size = (tracemalloc.get_traced_memory()[0] - before) / number
+    tracemalloc.stop()
+    print(f"Heartbeat and its set entry: {size:.0f} bytes per connection")
+
+    heartbeat = next(iter(heartbeats))
+    received = timeit.timeit(lambda: heartbeat.received(time.monotonic(), 0), number=number * 10) / number / 10
+    due = timeit.timeit(lambda: heartbeat.due(1.0), number=number * 10) / number / 10
+    print(f"Per read: {received * 1e9:.0f} ns to note it; per connection per sweep: {due * 1e9:.0f} ns to check it")
+
+    for count in counts:
+        nanoseconds = asyncio.run(sweep_cost(count))
+        print(f"{count:>6} idle connections: sweep takes {nanoseconds / 1000:.0f} us "
+              f"({nanoseconds / count:.0f} ns per connection) every {REAP_INTERVAL:.0f} s")
+
+if __name__ == "__main__":
+    measure()
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import random
+import time
+
+from BatchProtocol import STRATEGIES, choose_action
+from BinaryProtocol import ENCODINGS
+from BlackjackClient import HOST, PORT, AsyncBlackjackClient, action_message, bet_message
+from DeltaProtocol import UPDATES
+
+# Load test defaults
+SESSIONS = 1000
+ROUNDS = 20
+BET_AMOUNT = 25
+
+class LatencyStats:
+    """Round-trip times per message type, plus totals for the whole run"""
+
+    def __init__(self):
+        self.samples = {}  # Message type -> list of seconds
+        self.hands = 0
+        self.errors = 0
+        self.sessions_done = 0
+        self.sessions_failed = 0
+
+    def record(self, message_type, seconds):
+        self.samples.setdefault(message_type, []).append(seconds)
+
+    def report(self, elapsed):
+        """Throughput and latency percentiles as a printable table"""
+        messages = sum(len(samples) for samples in self.samples.values())
+        lines = [f"{self.sessions_done} sessions finished, {self.sessions_failed} failed, {self.errors} error replies",
+                 f"{self.hands} hands, {messages} messages in {elapsed:.2f}s: "
+                 f"{self.hands / elapsed:,.0f} hands/s, {messages / elapsed:,.0f} messages/s, "
+                 f"{messages / max(self.hands, 1):.2f} round trips per hand",
+                 f"{'type':<8}{'count':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for message_type, samples in sorted(self.samples.items()):
+            samples.sort()
+            p50, p95, p99 = (percentile(samples, p) * 1000 for p in (50, 95, 99))
+            lines.append(f"{message_type:<8}{len(samples):>9}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}"
+                         f"{samples[-1] * 1000:>10.2f}")
+        return "\n".join(lines)
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+class Session:
+    """One simulated client playing both seats of a table"""
+
+    def __init__(self, args, stats):
+        self.args = args
+        self.stats = stats
+        self.client = AsyncBlackjackClient(args.host, args.port, encoding=args.encoding, updates=args.updates)
+
+    async def request(self, message_type, message):
+        """Send a message and time how long the reply takes"""
+        start = time.perf_counter()
+        reply = await self.client.request(message)
+        if reply is None:
+            raise ConnectionResetError("Server closed the connection")
+        self.stats.record(message_type, time.perf_counter() - start)
+        if reply.get("type") == "error":
+            self.stats.errors += 1
+        return reply
+
+    async def think(self):
+        """Pause like a person deciding, if a think time was given"""
+        if self.args.think:
+            await asyncio.sleep(random.uniform(0, 2 * self.args.think / 1000))
+
+    async def play_turn(self, player):
+        """Bet and play one seat's hand; returns the reply that ended the turn"""
+        bet = min(self.args.bet, self.client.state.money(player))
+        reply = await self.request("bet", bet_message(bet, player))
+        if reply.get("type") != "game_state":
+            return reply
+        hand = reply["player_hand"]
+        value = reply["player_value"]
+        upcard = reply["dealer_visible"][0]
+
+        while True:
+            await self.think()
+            action = choose_action(self.args.strategy, value, hand, upcard, self.args.stand_on)
+            reply = await self.request(action, action_message(action, player))
+            if reply.get("type") != "hit_result":
+                return reply
+            hand = reply["player_hand"]
+            value = reply["player_value"]
+
+    async def play_round(self):
+        """Both seats' bets and hands as one batch, played by the server with the strategy"""
+        state = self.client.state
+        bets = [min(self.args.bet, state.money(player)) for player in (1, 2)]
+        await self.think()
+        start = time.perf_counter()
+        replies = await self.client.play_round(bets, self.args.strategy, self.args.stand_on)
+        if not replies:
+            raise ConnectionResetError("Server closed the connection")
+        self.stats.record("round", time.perf_counter() - start)
+        self.stats.hands += sum(1 for reply in replies if reply.get("type") in ("result", "player1_done"))
+        self.stats.errors += sum(1 for reply in replies if reply.get("type") == "error")
+
+    async def run(self):
+        """Connect, play the configured number of rounds and disconnect"""
+        await self.client.connect()  # Reads the welcome and negotiates the encoding
+        try:
+            for _ in range(self.args.rounds):
+                if self.args.batch:
+                    await self.play_round()
+                else:
+                    for player in (1, 2):
+                        reply = await self.play_turn(player)
+                        self.stats.hands += 1
+                        if reply.get("type") == "error":
+                            break  # Skip the rest of this round
+                if self.client.state.is_finished():
+                    break  # Server sends game_over and closes the table
+        finally:
+            self.client.close()
+
+async def run_session(args, stats, delay):
+    """Start a session after its ramp-up delay, counting failures instead of raising"""
+    await asyncio.sleep(delay)
+    try:
+        await Session(args, stats).run()
+        stats.sessions_done += 1
+    except (OSError, asyncio.TimeoutError, KeyError, IndexError) as e:
+        stats.sessions_failed += 1
+        if stats.sessions_failed <= 5:
+            print(f"Session failed: {e!r}")
+
+async def run_load(args):
+    """Run every session concurrently and print the report"""
+    stats = LatencyStats()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(args, stats, args.ramp * i / args.sessions)
+                           for i in range(args.sessions)))
+    elapsed = time.perf_counter() - start
+    print(stats.report(elapsed))
+    return stats
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless load generator for the blackjack server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--sessions", type=int, default=SESSIONS, help="concurrent simulated clients")
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="rounds each session plays")
+    parser.add_argument("--bet", type=int, default=BET_AMOUNT)
+    parser.add_argument("--think", type=float, default=0.0, help="mean think time before each action, in ms")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which sessions connect")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="threshold")
+    parser.add_argument("--stand-on", type=int, default=17, help="stand value for the threshold strategy")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json")
+    parser.add_argument("--updates", choices=UPDATES, default="full", help="full messages or numbered deltas")
+    parser.add_argument("--batch", action="store_true",
+                        help="send each round as one batch the server plays with --strategy (one round trip)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(run_load(parse_args()))
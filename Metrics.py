@@ -0,0 +1,241 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics endpoint defaults
+METRICS_HOST = '127.0.0.1'  # Only served locally
+METRICS_PORT = 9465
+
+# Histogram resolution: every power of two is split into 2**SUB_BITS buckets,
+# so any recorded latency is within 1/2**SUB_BITS (6.25%) of its bucket's bounds
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+LINEAR_LIMIT = SUB_BUCKETS * 2  # Values below this get a bucket each
+BUCKETS = 640                   # Enough for latencies of several minutes in nanoseconds
+
+# Bucket boundaries exported to Prometheus, in seconds
+EXPORT_BOUNDS = [0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+QUANTILES = [0.5, 0.9, 0.99, 0.999]
+
+# Message types given their own histogram; anything else a client sends counts as "other"
+MESSAGE_TYPES = {"bet", "hit", "stand", "batch", "encoding", "updates", "sync", "resume", "spectate", "ping", "pong"}
+
+def bucket_index(value):
+    """HDR-style log-linear bucket of a non-negative integer"""
+    if value < LINEAR_LIMIT:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift << SUB_BITS) + (value >> shift)
+
+def bucket_bounds(index):
+    """Lowest value in a bucket and the lowest value of the next one"""
+    if index < LINEAR_LIMIT:
+        return index, index + 1
+    shift = (index >> SUB_BITS) - 1
+    top = (index & (SUB_BUCKETS - 1)) + SUB_BUCKETS
+    return top << shift, (top + 1) << shift
+
+class LatencyHistogram:
+    """Nanosecond latencies in fixed log-linear buckets: O(1) to record, mergeable, bounded memory"""
+
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+
+    def record(self, nanoseconds):
+        self.counts[min(bucket_index(nanoseconds), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.maximum:
+            self.maximum = nanoseconds
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile, in nanoseconds"""
+        if not self.count:
+            return 0
+        rank = max(int(fraction * self.count + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_bounds(index)[1], self.maximum)
+        return self.maximum
+
+    def cumulative(self, bounds_ns):
+        """Counts at or below each bound, as Prometheus buckets want them"""
+        counts = self.counts
+        cumulative = []
+        seen = 0
+        index = 0
+        for bound in bounds_ns:
+            # A bucket counts towards a bound once its whole range is below it
+            while index < BUCKETS and bucket_bounds(index)[1] <= bound + 1:
+                seen += counts[index]
+                index += 1
+            cumulative.append(seen)
+        return cumulative
+
+def message_type(client_message, replies=()):
+    """Label a handled message by what it was, or "error" if it got an error reply"""
+    if any(reply.get("type") == "error" for reply in replies):
+        return "error"
+    kind = client_message.get("action", client_message.get("type"))
+    return kind if kind in MESSAGE_TYPES else "other"
+
+class Metrics:
+    """Counters, gauges and per-message-type latency histograms for one server process
+
+    Everything is a plain int or list bump on the serving thread. The
+    exposition endpoint only reads them from its own thread, so no locks are
+    taken on the hot path; a scrape may just see a message counted in its
+    histogram a moment before its bucket.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latency = {}        # Message type -> LatencyHistogram
+        self.errors = {}         # Error kind -> count
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.tables_opened = 0
+        self.active_tables = 0
+        self.hands_played = 0
+        self.spectators = 0
+        self.spectator_bytes_sent = 0
+        self.spectators_coalesced = 0
+        self.spectators_dropped = 0
+        self.pings_sent = 0
+        self.reaped = {}         # Reason -> connections disconnected for it (Heartbeat.py)
+
+    def observe(self, message_type, nanoseconds):
+        """Record one handled message and how long it took to reply"""
+        histogram = self.latency.get(message_type)
+        if histogram is None:
+            histogram = self.latency[message_type] = LatencyHistogram()
+        histogram.record(nanoseconds)
+
+    def error(self, kind):
+        """Count an error (decode, framing, server, ...)"""
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def reap(self, reason):
+        """Count a connection disconnected for missing a deadline"""
+        self.reaped[reason] = self.reaped.get(reason, 0) + 1
+
+    def merge(self, other):
+        """Add another process's metrics into these (gauges add up too)"""
+        for message_type, histogram in other.latency.items():
+            if message_type not in self.latency:
+                self.latency[message_type] = LatencyHistogram()
+            self.latency[message_type].merge(histogram)
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+        self.bytes_received += other.bytes_received
+        self.bytes_sent += other.bytes_sent
+        self.connections += other.connections
+        self.tables_opened += other.tables_opened
+        self.active_tables += other.active_tables
+        self.hands_played += other.hands_played
+        self.spectators += other.spectators
+        self.spectator_bytes_sent += other.spectator_bytes_sent
+        self.spectators_coalesced += other.spectators_coalesced
+        self.spectators_dropped += other.spectators_dropped
+        self.pings_sent += other.pings_sent
+        for reason, count in other.reaped.items():
+            self.reaped[reason] = self.reaped.get(reason, 0) + count
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP blackjack_{name} {help_text}")
+            lines.append(f"# TYPE blackjack_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"blackjack_{name}{labels} {value}")
+
+        latency = sorted(self.latency.items())
+        errors = sorted(self.errors.items())
+        metric("uptime_seconds", "gauge", "Seconds since the server started.",
+               [("", f"{time.perf_counter() - self.started:.3f}")])
+        metric("messages_total", "counter", "Client messages handled, by type.",
+               [(f'{{type="{name}"}}', histogram.count) for name, histogram in latency])
+        metric("errors_total", "counter", "Errors by kind; decode counts undecodable client messages.",
+               [(f'{{kind="{kind}"}}', count) for kind, count in errors])
+        metric("bytes_received_total", "counter", "Bytes read from clients.", [("", self.bytes_received)])
+        metric("bytes_sent_total", "counter", "Bytes written to clients.", [("", self.bytes_sent)])
+        metric("connections_total", "counter", "Client connections accepted.", [("", self.connections)])
+        metric("tables_opened_total", "counter", "Tables opened.", [("", self.tables_opened)])
+        metric("active_tables", "gauge", "Tables with a connected client.", [("", self.active_tables)])
+        metric("hands_played_total", "counter", "Hands finished by a bust or a stand.", [("", self.hands_played)])
+        metric("spectators", "gauge", "Connections watching a table.", [("", self.spectators)])
+        metric("spectator_bytes_sent_total", "counter", "Bytes of table updates written to spectators.",
+               [("", self.spectator_bytes_sent)])
+        metric("spectators_coalesced_total", "counter",
+               "Times a spectator fell behind and had its updates replaced by a snapshot.",
+               [("", self.spectators_coalesced)])
+        metric("spectators_dropped_total", "counter", "Spectators disconnected for staying behind.",
+               [("", self.spectators_dropped)])
+        metric("pings_sent_total", "counter", "Pings sent to quiet clients.", [("", self.pings_sent)])
+        metric("connections_reaped_total", "counter",
+               "Connections disconnected by reason: dead (no pong), stalled (unfinished frame), idle, "
+               "slow (not reading its replies).",
+               [(f'{{reason="{reason}"}}', count) for reason, count in sorted(self.reaped.items())])
+
+        bounds_ns = [int(bound * 1e9) for bound in EXPORT_BOUNDS]
+        samples = []
+        for name, histogram in latency:
+            for bound, count in zip(EXPORT_BOUNDS, histogram.cumulative(bounds_ns)):
+                samples.append((f'_bucket{{type="{name}",le="{bound}"}}', count))
+            samples.append((f'_bucket{{type="{name}",le="+Inf"}}', histogram.count))
+            samples.append((f'_sum{{type="{name}"}}', f"{histogram.total / 1e9:.9f}"))
+            samples.append((f'_count{{type="{name}"}}', histogram.count))
+        metric("message_latency_seconds", "histogram", "Time from a message arriving to its replies being sent.",
+               samples)
+
+        samples = []
+        for name, histogram in latency:
+            for fraction in QUANTILES:
+                samples.append((f'{{type="{name}",quantile="{fraction}"}}',
+                                f"{histogram.quantile(fraction) / 1e9:.9f}"))
+        metric("message_latency_quantile_seconds", "gauge",
+               "Latency quantiles from the full-resolution histogram (within 6.25%).", samples)
+        return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics for the Metrics object of its server"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown out the game's output
+
+def start_metrics_server(metrics, host=METRICS_HOST, port=METRICS_PORT):
+    """Serve metrics over HTTP from a daemon thread and return the HTTP server"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
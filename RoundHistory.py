@@ -0,0 +1,330 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from SmartServer import CARDS, DEALER_STANDS_ON
+
+# Default location of the history, next to this file
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "round_history")
+
+VERSION = 1
+MAX_HAND_CARDS = 22       # Enough cards for any hand to reach a stand value (as in the Simulator)
+INITIAL_CAPACITY = 1 << 16  # Rows the column files start with; they double as they fill
+FLUSH_EVERY = 4096        # Staged rows written to the column files in one go
+FLUSH_SECONDS = 1.0       # Staged rows are also written once the oldest is this old
+
+# Result codes, in the order of the result strings run_server produces
+RESULTS = ["win", "lose", "tie", "bust"]
+
+# One file per column, one fixed-width row per settled hand
+COLUMNS = {
+    "time": ("<f8", ()),            # Unix time the hand was settled
+    "table": ("<u4", ()),
+    "player": ("u1", ()),
+    "bet": ("<i4", ()),
+    "change": ("<i4", ()),          # Money won (or lost, negative) on the hand
+    "result": ("u1", ()),           # Index into RESULTS
+    "player_value": ("u1", ()),
+    "player_count": ("u1", ()),
+    "player_cards": ("u1", (MAX_HAND_CARDS,)),  # Zero-padded after player_count cards
+    "dealer_value": ("u1", ()),     # 0 with no dealer cards for a bust, the dealer never played against it
+    "dealer_count": ("u1", ()),
+    "dealer_cards": ("u1", (MAX_HAND_CARDS,)),
+    "dealer_stands_on": ("u1", ()), # House rules the hand was played under
+    "decks": ("u1", ()),            # 0 for the infinite deck
+}
+
+# Staged rows are converted in one go, with hands as zero-padded byte strings
+STAGED_ROW = np.dtype([(name, f"S{shape[0]}" if shape else dtype) for name, (dtype, shape) in COLUMNS.items()])
+
+def column_path(directory, name):
+    return os.path.join(directory, f"{name}.col")
+
+def meta_path(directory):
+    return os.path.join(directory, "meta.json")
+
+def read_meta(directory):
+    """Row count and schema of a history, or None if there isn't one"""
+    try:
+        with open(meta_path(directory)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+class HistoryWriter:
+    """Appends settled hands to memory-mapped column files
+
+    Appended rows are staged as tuples and written into the mapped files a
+    batch at a time with one slice assignment per column, since a NumPy
+    store per field costs far more than the tuple. The files grow by
+    doubling, and the row count readers trust is only published after a
+    batch is written, so a half-written row is never visible. Staged rows
+    (at most FLUSH_EVERY, or FLUSH_SECONDS old while the server calls
+    flush_due() on a timer) are lost if the process dies.
+    """
+
+    def __init__(self, directory=HISTORY_DIR, decks=0, dealer_stands_on=DEALER_STANDS_ON):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.decks = decks
+        self.dealer_stands_on = dealer_stands_on
+
+        meta = read_meta(directory)
+        if meta and meta["version"] != VERSION:
+            raise ValueError(f"{directory} holds version {meta['version']} history, expected {VERSION}")
+        self.count = meta["count"] if meta else 0
+        self.staged = []
+        self.staged_since = 0.0
+        self.columns = {}
+        self.map(max(INITIAL_CAPACITY, self.count * 2))
+        self.write_meta()
+
+    def map(self, capacity):
+        """(Re)map every column file with room for capacity rows"""
+        self.capacity = capacity
+        for name, (dtype, shape) in COLUMNS.items():
+            path = column_path(self.directory, name)
+            row_size = np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+            with open(path, "ab") as f:
+                if f.tell() < capacity * row_size:
+                    f.truncate(capacity * row_size)
+            self.columns[name] = np.memmap(path, dtype=dtype, mode="r+", shape=(capacity,) + shape)
+
+    def grow(self, needed):
+        """Double the files until needed rows fit"""
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for column in self.columns.values():
+            column.flush()
+        self.columns.clear()
+        self.map(capacity)
+
+    def record_hand(self, table_id, player_num, hand, dealer_hand, result, bet, change):
+        """Stage one settled hand (called by BlackjackTable)"""
+        now = time.time()
+        if not self.staged:
+            self.staged_since = now
+        # A hand can't hold more than MAX_HAND_CARDS cards before it busts
+        cards = hand.to_list()
+        if dealer_hand is None:
+            dealer_value, dealer_cards = 0, ()
+        else:
+            dealer_value, dealer_cards = dealer_hand.value, dealer_hand.to_list()
+        self.staged.append((now, table_id, player_num, bet, change, RESULTS.index(result),
+                            hand.value, len(cards), bytes(cards), dealer_value, len(dealer_cards),
+                            bytes(dealer_cards), self.dealer_stands_on, self.decks))
+        if len(self.staged) >= FLUSH_EVERY or now - self.staged_since >= FLUSH_SECONDS:
+            self.write_staged()
+
+    def flush_due(self, now=None):
+        """Write staged rows once the oldest is FLUSH_SECONDS old, even with no new hand to trigger it"""
+        if self.staged and (now or time.time()) - self.staged_since >= FLUSH_SECONDS:
+            self.write_staged()
+
+    def write_staged(self):
+        """Write staged rows into the column files and publish them"""
+        if not self.staged:
+            return
+        rows = np.array(self.staged, dtype=STAGED_ROW)
+        batch = {}
+        for name, (dtype, shape) in COLUMNS.items():
+            if shape:
+                batch[name] = np.ascontiguousarray(rows[name]).view(dtype).reshape((-1,) + shape)
+            else:
+                batch[name] = rows[name]
+        self.staged.clear()
+        self.append_batch(batch)
+
+    def append_batch(self, batch):
+        """Append many rows at once from a dict of column arrays (missing columns stay zero)"""
+        size = len(next(iter(batch.values())))
+        if self.count + size > self.capacity:
+            self.grow(self.count + size)
+        for name, values in batch.items():
+            self.columns[name][self.count:self.count + size] = values
+        self.count += size
+        self.write_meta()
+
+    def write_meta(self):
+        """Publish the row count, replacing the file atomically"""
+        meta = {"version": VERSION, "count": self.count,
+                "columns": {name: [dtype, list(shape)] for name, (dtype, shape) in COLUMNS.items()}}
+        temporary = meta_path(self.directory) + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporary, meta_path(self.directory))
+
+    def flush(self):
+        """Write staged rows and mapped pages back to the files and publish the row count"""
+        self.write_staged()
+        for column in self.columns.values():
+            column.flush()
+        self.write_meta()
+
+    def close(self):
+        self.flush()
+        self.columns.clear()
+
+def load(directory=HISTORY_DIR):
+    """Read-only NumPy views of every column, cut to the published row count (nothing is copied)"""
+    meta = read_meta(directory)
+    if meta is None:
+        raise FileNotFoundError(f"No round history in {directory}")
+    count = meta["count"]
+    columns = {}
+    for name, (dtype, shape) in meta["columns"].items():
+        if count == 0:
+            columns[name] = np.zeros((0,) + tuple(shape), dtype=dtype)
+            continue
+        columns[name] = np.memmap(column_path(directory, name), dtype=dtype, mode="r",
+                                  shape=(count,) + tuple(shape))
+    return columns
+
+# Keys below this are counted directly by value instead of being sorted into groups
+DIRECT_GROUPS = 1 << 20
+
+# Columns summarize() reads
+SUMMARY_COLUMNS = ("table", "player", "bet", "change", "result", "player_value", "dealer_value",
+                   "dealer_stands_on", "decks")
+
+def group_keys(columns, by):
+    """Key array and label function for a grouping"""
+    if by == "player":
+        return columns["player"], lambda key: f"player {key}"
+    if by == "table":
+        return columns["table"], lambda key: f"table {key}"
+    if by == "bet":
+        return columns["bet"], lambda key: f"${key}"
+    if by == "rules":
+        keys = columns["dealer_stands_on"].astype(np.uint16) << 8 | columns["decks"]
+        return keys, lambda key: f"S{key >> 8} {key & 0xFF or 'inf'}-deck"
+    raise ValueError(f"Unknown grouping {by!r}")
+
+def summarize(columns, by="player", table=None, player=None):
+    """Per-group statistics computed with vectorized scans over the column views
+
+    Returns a list of dicts, one per group, in key order.
+    """
+    mask = None
+    if table is not None:
+        mask = columns["table"] == table
+    if player is not None:
+        mask = (columns["player"] == player) if mask is None else mask & (columns["player"] == player)
+    if mask is not None:
+        # Filtering copies, so only the columns the summary reads
+        columns = {name: columns[name][mask] for name in SUMMARY_COLUMNS}
+
+    keys, label = group_keys(columns, by)
+    if len(keys) == 0:
+        return []
+    if keys.min() >= 0 and keys.max() < DIRECT_GROUPS:
+        # Small keys are their own bin numbers, which avoids sorting
+        index = keys.astype(np.intp)
+        groups = np.arange(int(keys.max()) + 1)
+    else:
+        groups, index = np.unique(keys, return_inverse=True)
+    size = len(groups)
+    hands = np.bincount(index, minlength=size)
+    wagered = np.bincount(index, weights=columns["bet"], minlength=size)
+    net = np.bincount(index, weights=columns["change"], minlength=size)
+    player_value = np.bincount(index, weights=columns["player_value"], minlength=size)
+
+    # Dealer busts among hands the dealer actually played against
+    dealer_value = columns["dealer_value"]
+    dealer_played = np.bincount(index, weights=dealer_value > 0, minlength=size)
+    dealer_busts = np.bincount(index, weights=dealer_value > 21, minlength=size)
+
+    # Result rates need a count per (group, result) pair
+    pairs = np.bincount(index * len(RESULTS) + columns["result"], minlength=size * len(RESULTS))
+    pairs = pairs.reshape(size, len(RESULTS))
+
+    summary = []
+    for i in np.flatnonzero(hands):
+        row = {"group": label(int(groups[i])), "hands": int(hands[i]), "wagered": int(wagered[i]),
+               "net": int(net[i]),
+               "edge": -net[i] / wagered[i] if wagered[i] else 0.0,
+               "average_bet": wagered[i] / hands[i],
+               "average_value": player_value[i] / hands[i],
+               "dealer_bust_rate": dealer_busts[i] / dealer_played[i] if dealer_played[i] else 0.0}
+        for code, result in enumerate(RESULTS):
+            row[result] = pairs[i, code] / hands[i]
+        summary.append(row)
+    return summary
+
+def print_summary(summary):
+    print(f"{'group':<16}{'hands':>12}{'wagered':>14}{'net':>12}{'house edge':>12}{'avg bet':>9}"
+          f"{'avg value':>10}" + "".join(f"{result:>7}" for result in RESULTS) + f"{'dealer bust':>12}")
+    for row in summary:
+        print(f"{row['group']:<16}{row['hands']:>12,}{row['wagered']:>14,}{row['net']:>12,}"
+              f"{row['edge'] * 100:>11.2f}%{row['average_bet']:>9.1f}{row['average_value']:>10.2f}"
+              + "".join(f"{row[result] * 100:>6.1f}%" for result in RESULTS)
+              + f"{row['dealer_bust_rate'] * 100:>11.1f}%")
+
+def generate(directory, hands, seed=0, decks=0, stand_on=17, bet_amount=25):
+    """Fill a history with simulated hands, a batch at a time, for trying out queries at scale"""
+    from Shoe import ShoeRack  # Only the generator needs the simulators
+    from Simulator import BATCH_SIZE, BUST, InfiniteDeck, money_changes, play_rounds
+
+    writer = HistoryWriter(directory, decks=decks)
+    source = ShoeRack(BATCH_SIZE, decks, seed=seed) if decks else InfiniteDeck(seed)
+    card_values = np.array(CARDS + [0], dtype=np.uint8)  # Zero padding stays zero
+    rng = np.random.default_rng(seed)
+    done = 0
+    while done < hands:
+        size = min(BATCH_SIZE, hands - done)
+        outcomes, player, dealer = play_rounds(source, np.arange(size), stand_on, record=True)
+        bust = outcomes == BUST
+
+        # Padding ranks point past CARDS so they map to zero
+        player_ranks = np.where(np.arange(MAX_HAND_CARDS) < player.count[:, None], player.cards, len(CARDS))
+        dealer_ranks = np.where(np.arange(MAX_HAND_CARDS) < dealer.count[:, None], dealer.cards, len(CARDS))
+        dealer_ranks[bust] = len(CARDS)
+        writer.append_batch({
+            "time": np.full(size, time.time()),
+            "table": rng.integers(1, 1001, size, dtype=np.uint32),
+            "player": rng.integers(1, 3, size, dtype=np.uint8),
+            "bet": np.full(size, bet_amount, dtype=np.int32),
+            "change": money_changes(outcomes, bet_amount).astype(np.int32),
+            "result": outcomes,
+            "player_value": player.values(),
+            "player_count": player.count,
+            "player_cards": np.take(card_values, player_ranks),
+            "dealer_value": np.where(bust, 0, dealer.values()),
+            "dealer_count": np.where(bust, 0, dealer.count),
+            "dealer_cards": np.take(card_values, dealer_ranks),
+            "dealer_stands_on": np.full(size, DEALER_STANDS_ON, dtype=np.uint8),
+            "decks": np.full(size, decks, dtype=np.uint8),
+        })
+        done += size
+    writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the round history the servers record")
+    parser.add_argument("directory", nargs="?", default=HISTORY_DIR)
+    parser.add_argument("--by", choices=["player", "table", "bet", "rules"], default="player")
+    parser.add_argument("--table", type=int, help="only hands from this table")
+    parser.add_argument("--player", type=int, choices=[1, 2], help="only this seat's hands")
+    parser.add_argument("--generate", type=int, metavar="HANDS", help="append simulated hands first")
+    parser.add_argument("--decks", type=int, default=0, help="shoe size for --generate (default: infinite deck)")
+    args = parser.parse_args()
+
+    if args.generate:
+        start = time.perf_counter()
+        generate(args.directory, args.generate, decks=args.decks)
+        elapsed = time.perf_counter() - start
+        print(f"Appended {args.generate:,} simulated hands in {elapsed:.2f}s "
+              f"({args.generate / elapsed:,.0f} hands/s)")
+
+    start = time.perf_counter()
+    columns = load(args.directory)
+    summary = summarize(columns, args.by, args.table, args.player)
+    elapsed = time.perf_counter() - start
+    print_summary(summary)
+    print(f"Scanned {len(columns['result']):,} hands in {elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
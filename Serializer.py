@@ -0,0 +1,119 @@
+import json
+import timeit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Optional; the standard library encodes the same bytes, only slower
+
+def json_dumps(message):
+    """Compact UTF-8 JSON with the standard library, byte for byte what orjson writes"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+
+def orjson_dumps(message):
+    try:
+        return orjson.dumps(message)
+    except TypeError:
+        return json_dumps(message)  # Integers past 64 bits or non-string keys, which orjson refuses
+
+def orjson_loads(payload):
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        return json.loads(payload)  # Same result or error as before for what orjson is stricter about
+
+# Serializer name -> (dumps, loads); dumps returns bytes, loads takes bytes or str
+SERIALIZERS = {"json": (json_dumps, json.loads)}
+if orjson:
+    SERIALIZERS["orjson"] = (orjson_dumps, orjson_loads)
+
+# The fastest one installed; use() swaps it
+SERIALIZER = "orjson" if orjson else "json"
+dumps, loads = SERIALIZERS[SERIALIZER]
+
+def use(name):
+    """Encode and decode every JSON message with the named serializer from now on
+
+    Callers look up Serializer.dumps and Serializer.loads at call time, so
+    this affects every connection. Frames StaticMessage already cached keep
+    their bytes, which are the same with either serializer.
+    """
+    global SERIALIZER, dumps, loads
+    dumps, loads = SERIALIZERS[name]
+    SERIALIZER = name
+
+class StaticMessage(dict):
+    """A message that never changes, so each frame encoder only encodes it once
+
+    The frame encoders (Framing.encode_message, BinaryProtocol.encode_message)
+    return the cached frame for it. It is still a dict everywhere else, but
+    must not be modified once created.
+    """
+
+    __slots__ = ("frames",)
+
+    def __init__(self, *args, **fields):
+        super().__init__(*args, **fields)
+        self.frames = {}  # Frame encoder -> this message's frame
+
+    def frame(self, encode):
+        """This message's frame from a frame encoder, encoded on first use"""
+        frame = self.frames.get(encode)
+        if frame is None:
+            frame = self.frames[encode] = encode(dict(self))
+        return frame
+
+def error_message(text):
+    """A constant error reply, encoded once per encoding"""
+    return StaticMessage(type="error", message=text)
+
+def compare():
+    """Print encode cost per message type for each serializer and for cached static messages"""
+    import BinaryProtocol  # Imported here since Framing imports this module
+    import Framing
+    from SmartServer import GAME_OVER, INVALID_ACTION, INVALID_BET, SERVER_ERROR
+
+    dynamic = {
+        "welcome": {"type": "welcome", "money": 2000, "message": "Welcome to Two-Player Blackjack! Each player has $1000.",
+                    "encodings": ["json", "binary"], "updates": ["full", "delta"], "table": 12,
+                    "player1_money": 2000, "player2_money": 2000},
+        "game_state": {"type": "game_state", "player_hand": [10, 6], "player_value": 16, "dealer_visible": [9],
+                       "bet": 100},
+        "hit_result": {"type": "hit_result", "card": 4, "player_hand": [10, 6, 4], "player_value": 20},
+        "result": {"type": "result", "player1_hand": [10, 9], "player1_value": 19, "player2_hand": [11, 7],
+                   "player2_value": 18, "dealer_hand": [9, 8], "dealer_value": 17, "player1_result": "win",
+                   "player2_result": "win", "player1_money": 2100, "player2_money": 2100,
+                   "message": "Dealer: 17, Player 1 wins!, Player 2 wins!"},
+        "snapshot": {"type": "snapshot", "seq": 41, "table": 12, "player": 2, "player1_money": 2100,
+                     "player2_money": 1900, "player1_hand": [10, 9]},
+    }
+    static = {"invalid bet": INVALID_BET, "invalid action": INVALID_ACTION, "server error": SERVER_ERROR,
+              "game_over": GAME_OVER}
+
+    serializers = list(SERIALIZERS)
+    print(f"Frame encode cost in us, {SERIALIZER} in use")
+    print(f"{'message':<16}{'bytes':>7}" + "".join(f"{name:>10}" for name in serializers)
+          + f"{'cached':>10}{'binary':>10}")
+    number = 50000
+    for name, message in {**dynamic, **static}.items():
+        payloads = {serializer: SERIALIZERS[serializer][0](dict(message)) for serializer in serializers}
+        assert len(set(payloads.values())) == 1, payloads  # Every serializer writes the same bytes
+        assert SERIALIZERS["json"][1](payloads["json"]) == message
+
+        timings = []
+        for serializer in serializers:
+            encode = SERIALIZERS[serializer][0]
+            plain = dict(message)
+            timings.append(timeit.timeit(lambda: Framing.encode_frame(encode(plain)), number=number))
+        row = "".join(f"{t / number * 1e6:>10.2f}" for t in timings)
+        if name in static:
+            cached = timeit.timeit(lambda: Framing.encode_message(message), number=number)
+            row += f"{cached / number * 1e6:>10.2f}"
+        else:
+            row += f"{'-':>10}"
+        binary = timeit.timeit(lambda: BinaryProtocol.encode_message(message), number=number)
+        row += f"{binary / number * 1e6:>10.2f}"
+        print(f"{name:<16}{len(payloads['json']):>7}{row}")
+
+if __name__ == "__main__":
+    compare()
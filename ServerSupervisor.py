@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+
+from AsyncServer import MAX_TABLE_ID, ServerStats, bench_table, serve, stop_server
+from BinaryProtocol import ENCODINGS
+from Metrics import Metrics, start_metrics_server
+from SessionRecorder import SessionRecorder
+from SmartServer import HOST, PORT, new_history
+
+# Supervisor defaults
+WORKERS = os.cpu_count() or 1
+STATS_INTERVAL = 1.0      # Seconds between each worker's stats reports
+RESTART_DELAY = 0.5       # First wait before restarting a dead worker, doubled while it keeps dying
+MAX_RESTART_DELAY = 30.0
+STABLE_TIME = 10.0        # A worker that ran at least this long restarts after RESTART_DELAY again
+STOP_TIMEOUT = 5.0        # Seconds workers get to exit after SIGTERM before they are killed
+TABLES_PER_START = 1 << 20  # Table ids reserved for each start of a worker, so a restart never reuses one
+
+# Benchmark defaults
+BENCH_WORKERS = [1, 2, 4]
+BENCH_TABLES = 400
+BENCH_ROUNDS = 20
+
+def worker_history_dir(history_dir, index):
+    """Each worker appends to its own round history; RoundHistory.py reads one directory at a time"""
+    return os.path.join(history_dir, f"worker-{index}")
+
+def worker_record_path(record_dir, index):
+    """Each worker records its sessions to its own file, which SessionRecorder.py replays"""
+    os.makedirs(record_dir, exist_ok=True)
+    return os.path.join(record_dir, f"worker-{index}.rec")
+
+def table_ids(index, workers, generation):
+    """The first and last table id of one start of a worker; ids in between go every workers ids
+
+    Worker i opens tables i+1, i+1+N, ... so workers never share an id,
+    and each restart (generation) gets the next TABLES_PER_START of them,
+    as the supervisor can't tell how many a dead worker opened after its
+    last report. A worker that uses up its block exits to be restarted
+    with the next one. Ids are 32-bit in the logs, so a worker can start
+    about 4096 / N times before they run out, and then it can't start.
+    """
+    first = index + 1 + generation * TABLES_PER_START * workers
+    if first > MAX_TABLE_ID:
+        raise RuntimeError(f"Worker {index} is out of table ids after {generation} starts")
+    return first, min(first + (TABLES_PER_START - 1) * workers, MAX_TABLE_ID)
+
+async def run_worker(index, workers, host, port, decks, history_dir, stats_pipe, seed=None, record_dir=None,
+                     generation=0):
+    """Serve tables on the shared port until SIGTERM, reporting stats to the supervisor"""
+    stats = ServerStats()
+    stats.next_table_id, stats.last_table_id = table_ids(index, workers, generation)
+    stats.table_id_step = workers
+    history = new_history(worker_history_dir(history_dir, index), decks) if history_dir else None
+    recorder = SessionRecorder(worker_record_path(record_dir, index)) if record_dir else None
+    server = await serve(host, port, stats, decks, history=history, reuse_port=True, seed=seed, recorder=recorder)
+
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        # The first report also tells the supervisor this worker is listening
+        while True:
+            # Pickled right here on the event loop's thread, so each report is consistent
+            stats_pipe.send(stats)
+            if stop.is_set():
+                break
+            if stats.out_of_table_ids:
+                print(f"Worker {index} used up its table ids, exiting to be restarted with new ones")
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), STATS_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await stop_server(server)  # Before the history and recorder close, as the sessions still write to them
+        if history:
+            history.close()
+        if recorder:
+            recorder.close()
+
+def worker_main(index, workers, host, port, decks, history_dir, stats_pipe, seed=None, record_dir=None,
+                generation=0):
+    """Entry point of a worker process; generation counts its restarts"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C goes to the supervisor, which sends SIGTERM
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # Not the supervisor's handler, until the loop sets its own
+    asyncio.run(run_worker(index, workers, host, port, decks, history_dir, stats_pipe, seed, record_dir, generation))
+
+class Supervisor:
+    """Runs N shared-nothing worker processes on one port, restarting any that die
+
+    Every worker binds HOST:PORT with SO_REUSEPORT and the kernel spreads
+    new connections across them, so each table lives and dies in one
+    worker. Workers send their ServerStats over a pipe every
+    STATS_INTERVAL. render() merges them, so the supervisor can serve
+    /metrics for the whole server.
+    """
+
+    def __init__(self, workers=WORKERS, host=HOST, port=PORT, decks=0, history_dir=None, seed=None,
+                 record_dir=None):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.decks = decks
+        self.history_dir = history_dir
+        self.seed = seed  # Table ids are unique across workers and restarts, so so are their card seeds
+        self.record_dir = record_dir
+        self.processes = {}       # Worker index -> Process
+        self.pipes = {}           # Worker index -> receiving end of its stats pipe
+        self.snapshots = {}       # Worker index -> latest stats from the running worker
+        self.last_snapshots = {}  # Worker index -> latest stats ever received, kept after it exits
+        self.retired = Metrics()  # Stats of workers that exited, so totals never go backwards
+        self.started_at = {}      # Worker index -> time.monotonic() it was started
+        self.generations = {}     # Worker index -> times it was started before, which picks its table ids
+        self.delays = {}          # Worker index -> wait before its next restart
+        self.pending = {}         # Worker index -> time.monotonic() to restart it at
+        self.restarts = 0
+        self.stopping = False
+        self.started = time.perf_counter()
+
+    def start_worker(self, index):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        generation = self.generations[index] = self.generations.get(index, -1) + 1
+        table_ids(index, self.workers, generation)  # Raises here, not in a worker restarted forever
+        process = multiprocessing.Process(
+            target=worker_main, name=f"blackjack-worker-{index}", daemon=True,
+            args=(index, self.workers, self.host, self.port, self.decks, self.history_dir, sender, self.seed,
+                  self.record_dir, generation))
+        process.start()
+        sender.close()  # Only the worker writes to it
+        self.processes[index] = process
+        self.pipes[index] = receiver
+        self.started_at[index] = time.monotonic()
+
+    def start(self):
+        """Start every worker and wait until they are all listening"""
+        for index in range(self.workers):
+            self.start_worker(index)
+        while len(self.snapshots) < len(self.processes):
+            self.collect(STATS_INTERVAL)
+            if not self.processes:
+                raise RuntimeError(f"Workers could not listen on {self.host}:{self.port}")
+
+    def collect(self, timeout):
+        """Wait up to timeout for stats reports or worker exits and handle them"""
+        sentinels = {process.sentinel: index for index, process in self.processes.items()}
+        ready = wait(list(self.pipes.values()) + list(sentinels), timeout)
+        for index, pipe in list(self.pipes.items()):
+            if pipe in ready:
+                self.receive_stats(index, pipe)
+        for sentinel in ready:
+            if sentinel in sentinels:
+                self.worker_exited(sentinels[sentinel])
+
+    def receive_stats(self, index, pipe):
+        try:
+            while pipe.poll():
+                self.snapshots[index] = self.last_snapshots[index] = pipe.recv()
+        except (EOFError, OSError):
+            pass  # The worker is gone; its sentinel says so too
+
+    def worker_exited(self, index):
+        """Fold a dead worker's stats into the totals and schedule its restart"""
+        process = self.processes.pop(index)
+        process.join()  # Already exited; this sets its exitcode
+        pipe = self.pipes.pop(index)
+        self.receive_stats(index, pipe)
+        pipe.close()
+        snapshot = self.snapshots.pop(index, None)
+        if snapshot:
+            snapshot.active_tables = 0  # Its tables went with it
+            self.retired.merge(snapshot)
+        if self.stopping:
+            return
+
+        ran = time.monotonic() - self.started_at[index]
+        delay = RESTART_DELAY if ran >= STABLE_TIME else self.delays.get(index, RESTART_DELAY)
+        self.delays[index] = min(delay * 2, MAX_RESTART_DELAY)
+        self.pending[index] = time.monotonic() + delay
+        print(f"Worker {index} exited with code {process.exitcode} after {ran:.1f}s, restarting in {delay:.1f}s")
+
+    def restart_due(self):
+        """Restart workers whose restart delay has passed"""
+        now = time.monotonic()
+        for index, restart_at in list(self.pending.items()):
+            if now >= restart_at:
+                del self.pending[index]
+                self.start_worker(index)
+                self.restarts += 1
+
+    def metrics(self):
+        """Stats of every worker, running or exited, merged into one Metrics"""
+        merged = Metrics()
+        merged.started = self.started
+        merged.merge(self.retired)
+        for snapshot in list(self.snapshots.values()):  # May run on the metrics server's thread
+            merged.merge(snapshot)
+        return merged
+
+    def render(self):
+        """Prometheus text for the whole server, so start_metrics_server can serve the supervisor"""
+        return self.metrics().render()
+
+    def summary(self):
+        merged = self.metrics()
+        elapsed = time.perf_counter() - self.started
+        return (f"{len(self.processes)} workers running, {self.restarts} restarts, "
+                f"{merged.tables_opened} tables served, {merged.active_tables} active, "
+                f"{merged.hands_played} hands in {elapsed:.1f}s")
+
+    def run(self):
+        """Supervise until interrupted"""
+        try:
+            while True:
+                timeout = STATS_INTERVAL
+                if self.pending:
+                    timeout = max(min(min(self.pending.values()) - time.monotonic(), timeout), 0)
+                self.collect(timeout)
+                self.restart_due()
+        except KeyboardInterrupt:
+            print("\nStopping workers")
+
+    def stop(self):
+        """SIGTERM every worker, collect their last stats and kill any that hang"""
+        self.stopping = True
+        self.pending.clear()
+        for process in self.processes.values():
+            process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while self.processes and time.monotonic() < deadline:
+            self.collect(0.1)
+        for index, process in list(self.processes.items()):
+            process.kill()
+            self.worker_exited(index)
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt  # Stop on SIGTERM (kill, service managers) the same way as on Ctrl-C
+
+def main(workers=WORKERS, host=HOST, port=PORT, decks=0, history_dir=None, metrics_port=None, seed=None,
+         record_dir=None):
+    signal.signal(signal.SIGTERM, interrupt)
+    supervisor = Supervisor(workers, host, port, decks, history_dir, seed, record_dir)
+    if metrics_port is not None:
+        start_metrics_server(supervisor, port=metrics_port)  # Before the workers, so a busy port leaves none behind
+    try:
+        supervisor.start()
+        print(f"Supervisor running {workers} workers on {host}:{port} (SO_REUSEPORT)")
+        supervisor.run()
+    finally:
+        supervisor.stop()
+        print(supervisor.summary())
+
+def free_port(host=HOST):
+    with socket.socket() as probe:
+        probe.bind((host, 0))
+        return probe.getsockname()[1]
+
+def client_process(host, port, tables, rounds, encoding):
+    """Play tables concurrently from one load-generating process and return the hands played"""
+    async def play():
+        return sum(await asyncio.gather(*(bench_table(host, port, rounds, encoding) for _ in range(tables))))
+    return asyncio.run(play())
+
+def bench(worker_counts=BENCH_WORKERS, tables=BENCH_TABLES, rounds=BENCH_ROUNDS, clients=WORKERS, encoding="json"):
+    """Measure hands/second against worker count, with the clients in their own processes"""
+    print(f"{os.cpu_count()} CPUs, {tables} tables x {rounds} rounds from {clients} client processes")
+    shares = [tables // clients + (i < tables % clients) for i in range(clients)]
+    results = {}
+    with multiprocessing.Pool(clients) as pool:
+        pool.map(abs, range(clients))  # Start the client processes before the clock does
+        for workers in worker_counts:
+            supervisor = Supervisor(workers, HOST, free_port())
+            supervisor.start()
+            try:
+                start = time.perf_counter()
+                hands = sum(pool.starmap(client_process, [(HOST, supervisor.port, share, rounds, encoding)
+                                                          for share in shares]))
+                elapsed = time.perf_counter() - start
+            finally:
+                supervisor.stop()
+            spread = [supervisor.last_snapshots[index].tables_opened for index in sorted(supervisor.last_snapshots)]
+            results[workers] = hands / elapsed
+            print(f"{workers} workers: {hands} hands in {elapsed:.2f}s: {hands / elapsed:,.0f} hands/s "
+                  f"({results[workers] / results[worker_counts[0]]:.2f}x), tables per worker {spread}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the asyncio server as N worker processes sharing one port")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes (default: one per CPU)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--decks", type=int, default=0, help="deal from an N-deck shoe (default: infinite deck)")
+    parser.add_argument("--history", metavar="DIR", help="append settled hands to DIR/worker-N per worker")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve every worker's merged metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--seed", type=int, help="seed every table's cards from this and its id (default: random)")
+    parser.add_argument("--record", metavar="DIR", help="record every session to DIR/worker-N.rec per worker")
+    parser.add_argument("--bench", action="store_true", help="measure hands/s scaling with worker count and exit")
+    parser.add_argument("--bench-workers", default=",".join(map(str, BENCH_WORKERS)),
+                        help="worker counts for --bench (default %(default)s)")
+    parser.add_argument("--tables", type=int, default=BENCH_TABLES, help="concurrent tables for --bench")
+    parser.add_argument("--rounds", type=int, default=BENCH_ROUNDS, help="rounds per table for --bench")
+    parser.add_argument("--clients", type=int, default=WORKERS, help="load-generating processes for --bench")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="json", help="encoding for --bench")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench([int(n) for n in args.bench_workers.split(",")], args.tables, args.rounds, args.clients,
+              args.encoding)
+    else:
+        main(args.workers, HOST, args.port, args.decks, args.history, args.metrics_port, args.seed, args.record)
@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import time
+import zlib
+
+from BankrollLog import frame, read_records
+
+# Default location of the recording, next to this file
+RECORD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.rec")
+
+WRITE_BUFFER = 1 << 20  # Bytes of records buffered before a write; lost if the process dies
+DIFF_BYTES = 24         # Bytes shown from the first difference in a mismatched reply
+
+# Records are framed like the bankroll log, but with 32-bit lengths since a payload can be up to 1 MB
+FRAME = struct.Struct("<II")            # CRC32 of the body, body length
+START_RECORD = struct.Struct("<BIQBII")  # kind, table, card seed, decks, CRC32 and length of the welcome
+STEP_RECORD = struct.Struct("<BIII")     # kind, table, CRC32 and length of the replies; the payload follows
+END_RECORD = struct.Struct("<BIB")       # kind, table, reason
+REPLIES_RECORD = struct.Struct("<BI")    # kind, table; the bytes sent for the table's previous record follow
+
+# Record kinds
+START = 1
+STEP = 2
+END = 3
+REPLIES = 4  # Only written when the recorder keeps replies
+
+# Reasons a recording ends
+CLOSED = 0      # The client left or the game ended
+RESUMED = 1     # The client took over a recovered table, whose past isn't in the recording
+SPECTATING = 2  # The client watches another table, whose updates depend on its timing
+END_REASONS = {CLOSED: "closed", RESUMED: "resumed", SPECTATING: "spectating"}
+
+class Recording:
+    """One session being recorded: what the client sent and a checksum of what it got back
+
+    A client message's replies are only known once the next message comes
+    in (or the session ends), so each record is written one step late.
+    """
+
+    __slots__ = ("recorder", "table_id", "pending", "crc", "length", "replies")
+
+    def __init__(self, recorder, table, decks):
+        self.recorder = recorder
+        self.table_id = table.table_id
+        self.pending = (START, table.cards.seed, decks)  # Written with the welcome's checksum
+        self.crc = 0
+        self.length = 0
+        self.replies = bytearray() if recorder.replies else None  # The bytes themselves, if kept
+
+    def sent(self, frame_bytes):
+        """Account for a frame sent to the client"""
+        self.crc = zlib.crc32(frame_bytes, self.crc)
+        self.length += len(frame_bytes)
+        if self.replies is not None:
+            self.replies += frame_bytes
+
+    def received(self, payload):
+        """Start a new step with a payload the client sent"""
+        self.write_pending()
+        self.pending = (STEP, payload)
+
+    def write_pending(self):
+        kind = self.pending[0]
+        if kind == START:
+            _, seed, decks = self.pending
+            body = START_RECORD.pack(START, self.table_id, seed, decks, self.crc, self.length)
+        else:
+            body = STEP_RECORD.pack(STEP, self.table_id, self.crc, self.length) + self.pending[1]
+        self.recorder.append(body)
+        if self.replies is not None:
+            self.recorder.append(REPLIES_RECORD.pack(REPLIES, self.table_id) + self.replies)
+            self.replies = bytearray()
+        self.crc = 0
+        self.length = 0
+
+    def stop(self, reason=CLOSED):
+        """End the recording; the step that resumed or spectated is left out, as it can't be replayed"""
+        if reason == CLOSED:
+            self.write_pending()
+        self.recorder.append(END_RECORD.pack(END, self.table_id, reason))
+        self.recorder.sessions += 1
+
+class SessionRecorder:
+    """Appends every session's card seed and inbound messages to a file
+
+    Each client message is stored as received, with the CRC32 and length of
+    the bytes the server sent back, so replay() can re-run the session
+    through the same code and check every reply byte for byte. That costs
+    ~20 bytes per message on top of the message itself. With replies, the
+    bytes sent back are kept too, so a mismatch can show where the replies
+    first differ; that makes the recording several times larger. Records
+    go through a WRITE_BUFFER-sized file buffer: this is a sample of
+    traffic for debugging and testing, not a write-ahead log, and it is
+    never fsynced.
+    """
+
+    def __init__(self, path=RECORD_PATH, replies=False):
+        self.path = path
+        self.file = open(path, "ab", buffering=WRITE_BUFFER)
+        self.replies = replies
+        self.sessions = 0
+        self.records = 0
+
+    def start(self, table, decks=0):
+        """Begin recording a fresh table's session"""
+        return Recording(self, table, decks)
+
+    def append(self, body):
+        self.file.write(frame(body, FRAME))
+        self.records += 1
+
+    def close(self):
+        self.file.close()
+
+class Session:
+    """A recorded session read back from a recording"""
+
+    __slots__ = ("table_id", "seed", "decks", "welcome", "welcome_bytes", "steps", "end")
+
+    def __init__(self, table_id, seed, decks, welcome):
+        self.table_id = table_id
+        self.seed = seed
+        self.decks = decks
+        self.welcome = welcome      # (CRC32, length) of the welcome frame
+        self.welcome_bytes = None   # The welcome frame, if the replies were kept
+        self.steps = []             # (payload, CRC32, length, bytes or None) of the replies
+        self.end = None             # End reason, or None if the server stopped mid-session
+
+def read_sessions(path):
+    """Every session in a recording, in the order they started"""
+    sessions = []
+    open_sessions = {}  # Table id -> session still being read; ids repeat across server restarts
+    for _, body in read_records(path, FRAME):
+        kind = body[0]
+        if kind == START:
+            _, table_id, seed, decks, crc, length = START_RECORD.unpack(body)
+            session = open_sessions[table_id] = Session(table_id, seed, decks, (crc, length))
+            sessions.append(session)
+        elif kind == STEP:
+            _, table_id, crc, length = STEP_RECORD.unpack_from(body)
+            session = open_sessions.get(table_id)
+            if session:
+                session.steps.append((body[STEP_RECORD.size:], crc, length, None))
+        elif kind == REPLIES:
+            # Written right after the record the replies belong to
+            _, table_id = REPLIES_RECORD.unpack_from(body)
+            session = open_sessions.get(table_id)
+            if session and session.steps:
+                session.steps[-1] = session.steps[-1][:3] + (body[REPLIES_RECORD.size:],)
+            elif session:
+                session.welcome_bytes = body[REPLIES_RECORD.size:]
+        elif kind == END:
+            _, table_id, reason = END_RECORD.unpack(body)
+            session = open_sessions.pop(table_id, None)
+            if session:
+                session.end = reason
+    return sessions
+
+class ReplayWriter:
+    """Stands in for a client's StreamWriter, keeping the CRC32 and length of everything written
+
+    With keep, it also keeps the bytes, for sessions recorded with their replies.
+    """
+
+    def __init__(self, keep=False):
+        self.crc = 0
+        self.length = 0
+        self.data = bytearray() if keep else None
+
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        self.length += len(data)
+        if self.data is not None:
+            self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    def take(self):
+        """(CRC32, length) of the bytes written since the last call, and the bytes if kept (else None)"""
+        written = (self.crc, self.length)
+        data = None
+        if self.data is not None:
+            data = bytes(self.data)
+            self.data.clear()
+        self.crc = 0
+        self.length = 0
+        return written, data
+
+def first_difference(recorded, replayed):
+    """Offset of the first byte where two replies differ, and DIFF_BYTES of each from there"""
+    offset = next((i for i, (a, b) in enumerate(zip(recorded, replayed)) if a != b),
+                  min(len(recorded), len(replayed)))  # Otherwise one is cut short
+    return offset, recorded[offset:offset + DIFF_BYTES], replayed[offset:offset + DIFF_BYTES]
+
+def check(replay, table_id, step, payload, recorded, recorded_bytes, replayed, replayed_bytes):
+    """Note a mismatch: byte for byte when the recording kept the replies, else by CRC32 and length"""
+    if recorded_bytes is not None:
+        if recorded_bytes != replayed_bytes:
+            difference = first_difference(recorded_bytes, replayed_bytes)
+            replay.mismatches.append((table_id, step, payload, recorded, replayed, difference))
+    elif recorded != replayed:
+        replay.mismatches.append((table_id, step, payload, recorded, replayed, None))
+
+def run_now(coroutine):
+    """Run a coroutine that never has to wait to completion, without an event loop"""
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    coroutine.close()
+    raise RuntimeError("Replayed message waited on I/O")
+
+class Replay:
+    """Result of replaying a recording"""
+
+    def __init__(self):
+        self.sessions = 0
+        self.messages = 0
+        self.hands = 0
+        self.bytes = 0          # Reply bytes regenerated
+        self.mismatches = []    # (table id, step, payload, recorded (CRC32, length), replayed (CRC32, length),
+                                #  first_difference() if the replies were recorded, else None)
+        self.seconds = 0.0
+
+    def report(self):
+        rate = self.messages / self.seconds if self.seconds else 0
+        return (f"Replayed {self.sessions:,} sessions, {self.messages:,} messages, {self.hands:,} hands "
+                f"in {self.seconds:.2f}s ({rate:,.0f} messages/s), {self.bytes / 1024 / 1024:.1f} MB of replies "
+                f"regenerated: {len(self.mismatches)} mismatches")
+
+def replay_session(session, stats, replay):
+    """Re-run one session through the asyncio server's message handling and check its replies"""
+    from AsyncServer import Connection, handle_payload  # Imported here since AsyncServer.py imports this module
+    from SmartServer import BlackjackTable, new_shoe
+
+    table = BlackjackTable(session.table_id, shoe=new_shoe(session.decks, session.seed) if session.decks else None,
+                           seed=session.seed)
+    writer = ReplayWriter(keep=session.welcome_bytes is not None)
+    connection = Connection(None, writer)
+    run_now(connection.send_message(table.welcome_message()))
+    replayed, replayed_bytes = writer.take()
+    check(replay, session.table_id, 0, b"", session.welcome, session.welcome_bytes, replayed, replayed_bytes)
+
+    hands_before = stats.hands_played
+    for step, (payload, crc, length, replies) in enumerate(session.steps, 1):
+        if table.is_finished():
+            break
+        table = run_now(handle_payload(table, payload, connection, stats))
+        if table.is_finished():
+            run_now(connection.send_message(table.game_over_message()))  # handle_client sends it right after
+        replayed, replayed_bytes = writer.take()
+        replay.bytes += replayed[1]
+        replay.messages += 1
+        check(replay, session.table_id, step, payload, (crc, length), replies, replayed, replayed_bytes)
+    replay.hands += stats.hands_played - hands_before
+    replay.sessions += 1
+
+def replay(path, repeat=1):
+    """Replay every session in a recording as fast as the CPU allows, checking every reply"""
+    from AsyncServer import ServerStats  # Imported here since AsyncServer.py imports this module
+
+    sessions = read_sessions(path)
+    result = Replay()
+    stats = ServerStats()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for session in sessions:
+            replay_session(session, stats, result)
+    result.seconds = time.perf_counter() - start
+    return result
+
+async def sample_client(host, port, number, rounds, table_ids):
+    """Play one recorded sample session; each client number uses a different mix of the protocol"""
+    from BlackjackClient import AsyncBlackjackClient, basic_strategy
+
+    encoding = ("json", "binary")[number % 2]
+    updates = ("full", "delta")[number // 2 % 2]
+    async with AsyncBlackjackClient(host, port, encoding=encoding, updates=updates) as client:
+        table_ids.append(client.state.table)
+        if number % 8 == 7 and len(table_ids) > 1:
+            await client.spectate(table_ids[0])  # Recorded up to here, then ended as spectating
+            return
+        await client.request({"type": "bet", "amount": -5, "player": 1})  # Errors are replayed too
+        for _ in range(rounds):
+            if client.state.is_finished():
+                break
+            if number % 3 == 0:
+                await client.play_round((25, 50))
+            else:
+                for _ in (1, 2):
+                    if client.state.is_finished():
+                        break
+                    await client.play_hand(25, basic_strategy)
+
+async def record_sample(path, clients=32, rounds=20, decks=0, seed=None, host="127.0.0.1", replies=False):
+    """Record clients mixed sessions played against an in-process asyncio server"""
+    from AsyncServer import ServerStats, serve  # Imported here since AsyncServer.py imports this module
+
+    stats = ServerStats()
+    recorder = SessionRecorder(path, replies)
+    server = await serve(host, 0, stats, decks, seed=seed, recorder=recorder)
+    port = server.sockets[0].getsockname()[1]
+    table_ids = []
+    await asyncio.gather(*(sample_client(host, port, number, rounds, table_ids) for number in range(clients)))
+    server.close()
+    await server.wait_closed()
+    while stats.active_tables:
+        await asyncio.sleep(0.01)  # Let every session finish its recording
+    recorder.close()
+    print(f"Recorded {recorder.sessions:,} sessions, {recorder.records:,} records, "
+          f"{os.path.getsize(path):,} bytes to {path}")
+
+def describe(payload):
+    """A recorded payload as the message it decodes to, for reports"""
+    from BinaryProtocol import decode_message  # Only needed for reports
+
+    try:
+        return decode_message(payload)
+    except Exception:
+        return payload[:60]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded sessions and check every reply byte for byte")
+    parser.add_argument("path", nargs="?", default=RECORD_PATH, help="recording to replay (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the recording this many times")
+    parser.add_argument("--sample", type=int, metavar="CLIENTS",
+                        help="first record this many sample sessions to the path, which is overwritten")
+    parser.add_argument("--rounds", type=int, default=20, help="rounds per sample session")
+    parser.add_argument("--decks", type=int, default=0, help="deal the sample from N-deck shoes")
+    parser.add_argument("--seed", type=int, help="server seed for the sample")
+    parser.add_argument("--replies", action="store_true",
+                        help="keep the sample's reply bytes, so mismatches show where they differ")
+    parser.add_argument("--show", type=int, default=5, help="mismatches to print")
+    args = parser.parse_args()
+
+    if args.sample:
+        if os.path.exists(args.path):
+            os.remove(args.path)
+        asyncio.run(record_sample(args.path, args.sample, args.rounds, args.decks, args.seed, replies=args.replies))
+    result = replay(args.path, args.repeat)
+    print(result.report())
+    for table_id, step, payload, recorded, replayed, difference in result.mismatches[:args.show]:
+        print(f"  table {table_id} step {step} {describe(payload)}: recorded crc {recorded[0]:08x} "
+              f"{recorded[1]} bytes, replayed crc {replayed[0]:08x} {replayed[1]} bytes")
+        if difference:
+            offset, recorded_bytes, replayed_bytes = difference
+            print(f"    first difference at byte {offset}: recorded {recorded_bytes!r}, replayed {replayed_bytes!r}")
+    sys.exit(1 if result.mismatches else 0)
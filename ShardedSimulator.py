@@ -0,0 +1,128 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from Shoe import ShoeRack
+from Simulator import (BET_AMOUNT, PLAYER_STANDS_ON, BankrollStats, InfiniteDeck, SimulationStats,
+                       simulate, simulate_bankrolls)
+from SmartServer import STARTING_MONEY
+
+# Work is cut into fixed-size shards so results never depend on the worker count
+SHARD_ROUNDS = 1_000_000
+SHARD_PLAYERS = 5_000
+SHOE_TABLES = 10_000  # Shoes per shard when dealing from finite shoes
+
+def shard_seeds(seed, shards):
+    """Independent RNG streams, one per shard, all derived from one seed"""
+    return np.random.SeedSequence(seed).spawn(shards)
+
+def shard_sizes(total, shard_size):
+    """Split total into shard_size pieces with the remainder in the last one"""
+    sizes = [shard_size] * (total // shard_size)
+    if total % shard_size:
+        sizes.append(total % shard_size)
+    return sizes
+
+def run_round_shard(rounds, seed_sequence, bet_amount, stand_on, decks=0):
+    """Worker: simulate one shard of rounds, optionally on SHOE_TABLES shoes side by side"""
+    if decks:
+        source = ShoeRack(SHOE_TABLES, decks, seed=seed_sequence)
+        return simulate(rounds, bet_amount=bet_amount, stand_on=stand_on, batch_size=SHOE_TABLES, source=source)
+    return simulate(rounds, bet_amount=bet_amount, stand_on=stand_on, source=InfiniteDeck(seed_sequence))
+
+def run_bankroll_shard(players, rounds, seed_sequence, bet_amount, stand_on):
+    """Worker: follow one shard of bankrolls to the end"""
+    _, bankroll = simulate_bankrolls(players, rounds, bet_amount=bet_amount, stand_on=stand_on,
+                                     source=InfiniteDeck(seed_sequence))
+    stats = BankrollStats(bet_amount)
+    stats.add(bankroll)
+    return stats
+
+def run_sharded(worker, stats, jobs, workers, progress=None):
+    """Run jobs on a process pool, merging each shard's stats as soon as it finishes
+
+    Stats hold only integer totals, so the merged result is the same whatever
+    order shards finish in and however many workers ran them.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(worker, *job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            stats.merge(future.result())
+            if progress:
+                progress(done, len(futures), stats)
+    return stats
+
+def simulate_sharded(rounds, seed=0, workers=None, bet_amount=BET_AMOUNT, stand_on=PLAYER_STANDS_ON,
+                     shard_rounds=SHARD_ROUNDS, progress=None, decks=0):
+    """Simulate rounds across processes; reproducible for a given seed at any worker count"""
+    sizes = shard_sizes(rounds, shard_rounds)
+    jobs = [(size, seeds, bet_amount, stand_on, decks)
+            for size, seeds in zip(sizes, shard_seeds(seed, len(sizes)))]
+    return run_sharded(run_round_shard, SimulationStats(bet_amount), jobs, workers, progress)
+
+def simulate_ruin_sharded(players, rounds, seed=0, workers=None, bet_amount=BET_AMOUNT,
+                          stand_on=PLAYER_STANDS_ON, shard_players=SHARD_PLAYERS, progress=None):
+    """Risk of ruin over many players, split across processes by groups of players"""
+    sizes = shard_sizes(players, shard_players)
+    # Spawn from a different key than the round shards so the two streams never overlap
+    seeds = np.random.SeedSequence(seed, spawn_key=(1,)).spawn(len(sizes))
+    jobs = [(size, rounds, seeds, bet_amount, stand_on) for size, seeds in zip(sizes, seeds)]
+    return run_sharded(run_bankroll_shard, BankrollStats(bet_amount), jobs, workers, progress)
+
+def measure_scaling(rounds, seed=0, max_workers=None):
+    """Time the same sharded job at each worker count and report speedup and efficiency"""
+    max_workers = max_workers or os.cpu_count() or 1
+    print(f"{'workers':>8}{'seconds':>10}{'rounds/s':>14}{'speedup':>9}{'efficiency':>12}  result")
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        stats = simulate_sharded(rounds, seed, workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        speedup = baseline / elapsed
+        # Identical totals at every worker count show the seeding is deterministic
+        print(f"{workers:>8}{elapsed:>10.2f}{rounds / elapsed:>14,.0f}{speedup:>9.2f}"
+              f"{speedup / workers * 100:>11.0f}%  net={stats.net}")
+
+def print_progress(done, total, stats):
+    """Progress line for long runs"""
+    print(f"  shard {done}/{total} merged", end="\r", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-core sharded simulation of the house rules")
+    parser.add_argument("--rounds", type=int, default=20_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--bet", type=int, default=BET_AMOUNT)
+    parser.add_argument("--stand-on", type=int, default=PLAYER_STANDS_ON)
+    parser.add_argument("--decks", type=int, default=0, help="deal from N-deck shoes instead of an infinite deck")
+    parser.add_argument("--ruin", type=int, metavar="PLAYERS",
+                        help="estimate risk of ruin for this many players over --ruin-rounds rounds")
+    parser.add_argument("--ruin-rounds", type=int, default=1000)
+    parser.add_argument("--scaling", action="store_true", help="report scaling efficiency per core count")
+    args = parser.parse_args()
+
+    if args.scaling:
+        measure_scaling(args.rounds, args.seed, args.workers)
+        return
+
+    start = time.perf_counter()
+    stats = simulate_sharded(args.rounds, args.seed, args.workers, args.bet, args.stand_on,
+                             progress=print_progress, decks=args.decks)
+    elapsed = time.perf_counter() - start
+    print()
+    print(stats.report())
+    print(f"{args.rounds / elapsed:,.0f} rounds/s on {args.workers or os.cpu_count()} workers")
+
+    if args.ruin:
+        ruin = simulate_ruin_sharded(args.ruin, args.ruin_rounds, args.seed, args.workers, args.bet,
+                                     args.stand_on, progress=print_progress)
+        print()
+        print(f"Starting with ${STARTING_MONEY}, betting ${args.bet} for {args.ruin_rounds} rounds:")
+        print(ruin.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+
+from CardRNG import new_rng
+from SmartServer import CARDS
+
+# Shoe defaults
+DECKS = 6
+PENETRATION = 0.75  # Fraction of the shoe dealt before the cut card comes out
+SUITS = 4           # CARDS holds one suit's worth of ranks
+
+class Shoe:
+    """Finite multi-deck shoe stored as one byte per card
+
+    Cards are dealt by advancing a position through the array, and a reshuffle
+    shuffles the same array in place, so nothing is allocated after creation.
+    Each table owns its shoe, so tables never see each other's cards.
+    """
+
+    __slots__ = ("cards", "position", "cut", "rng", "shuffles")
+
+    def __init__(self, decks=DECKS, penetration=PENETRATION, rng=None):
+        self.cards = array("B", CARDS * SUITS * decks)
+        self.cut = int(len(self.cards) * penetration)
+        self.rng = rng or random  # Shared module RNG unless the table brings its own
+        self.shuffles = 0
+        self.shuffle()
+
+    def shuffle(self):
+        """Shuffle every card back into the shoe"""
+        self.rng.shuffle(self.cards)
+        self.position = 0
+        self.shuffles += 1
+
+    def deal(self):
+        """Deal the next card, reshuffling if the shoe has run out mid-round"""
+        if self.position == len(self.cards):
+            self.shuffle()
+        card = self.cards[self.position]
+        self.position += 1
+        return card
+
+    def start_round(self):
+        """Reshuffle between rounds once the cut card has been reached"""
+        if self.position >= self.cut:
+            self.shuffle()
+
+    def remaining(self):
+        """Cards left before the shoe is empty"""
+        return len(self.cards) - self.position
+
+class ShoeRack:
+    """One shoe per simulated table, as a card source for the Simulator
+
+    Shoes are the rows of one NumPy array of card ranks (indexes into CARDS),
+    so every table draws and reshuffles in the same vectorized operation.
+    """
+
+    def __init__(self, tables, decks=DECKS, penetration=PENETRATION, seed=None):
+        import numpy as np  # Only the simulators need NumPy
+
+        self.rng = new_rng(seed)
+        deck = np.tile(np.arange(len(CARDS), dtype=np.uint8), SUITS * decks)
+        self.cards = np.tile(deck, (tables, 1))
+        self.position = np.zeros(tables, dtype=np.int32)
+        self.cut = int(self.cards.shape[1] * penetration)
+        self.shuffles = 0
+        self.shuffle(np.arange(tables))
+
+    def shuffle(self, rows):
+        """Reshuffle the shoes at the given tables"""
+        self.cards[rows] = self.rng.permuted(self.cards[rows], axis=1)
+        self.position[rows] = 0
+        self.shuffles += len(rows)
+
+    def start_round(self, rows):
+        """Reshuffle every shoe in rows that has reached its cut card"""
+        due = rows[self.position[rows] >= self.cut]
+        if due.size:
+            self.shuffle(due)
+
+    def draw(self, rows):
+        """Deal the next card rank from each table's shoe"""
+        empty = rows[self.position[rows] == self.cards.shape[1]]
+        if empty.size:
+            self.shuffle(empty)
+        cards = self.cards[rows, self.position[rows]]
+        self.position[rows] += 1
+        return cards
+
+def measure(tables=10_000, decks=DECKS):
+    """Report memory per table and the cost of dealing and reshuffling"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    shoes = [Shoe(decks) for _ in range(tables)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{tables:,} tables with {decks}-deck shoes: {used / 1024 / 1024:.2f} MB, "
+          f"{used / tables:.0f} bytes per table ({decks * 52} bytes of cards)")
+
+    shoe = shoes[0]
+    passes = 500
+    start = time.perf_counter()
+    for _ in range(passes):
+        shoe.position = 0
+        for _ in range(len(shoe.cards)):
+            shoe.deal()
+    deal_time = time.perf_counter() - start
+    count = passes * len(shoe.cards)
+    start = time.perf_counter()
+    for _ in range(200):
+        shoe.shuffle()
+    shuffle_time = time.perf_counter() - start
+    print(f"deal: {deal_time / count * 1e9:.0f} ns, reshuffle: {shuffle_time / 200 * 1e6:.0f} us")
+
+if __name__ == "__main__":
+    measure(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,438 @@
+import argparse
+import math
+import time
+import timeit
+from functools import lru_cache
+
+import numpy as np
+
+from CardRNG import byte_block, new_rng
+from Shoe import PENETRATION, ShoeRack
+from SmartServer import (CARDS, DEALER_STANDS_ON, STARTING_MONEY, calculate_hand_value,
+                         deal_card, settle_hand)
+
+# Simulation defaults
+BET_AMOUNT = 100
+PLAYER_STANDS_ON = 17  # Simulated players hit until reaching at least this value
+BATCH_SIZE = 65_536    # Rounds played per vectorized batch
+MAX_HAND_CARDS = 22    # Enough cards for any hand to reach a stand value
+FULL_PASS_SHARE = 1 / 8  # Hit every hand at once while more than this share are still drawing
+VERIFY_REPEAT = 5      # Timed runs of each engine in verify(), keeping the fastest
+
+DRAW_BLOCK = 1 << 20  # Card codes generated per RNG call
+
+# Cards are handled as ranks, indexes into CARDS, so a draw needs no value lookup
+RANKS = len(CARDS)
+
+# A draw is a code byte: codes below ACCEPTED are rank code % RANKS, each rank equally
+# likely, and the rest are no card at all. An infinite deck's codes are raw random
+# bytes, so nothing has to map or reject them; a shoe's codes are its ranks.
+ACCEPTED = 256 // RANKS * RANKS
+
+# Outcome codes, in the order of the result strings run_server produces
+WIN, LOSE, TIE, BUST = range(4)
+OUTCOMES = ["win", "lose", "tie", "bust"]
+OUTCOME_SIGNS = np.array([1, -1, 0, -1], dtype=np.int64)  # Bets won or lost per outcome
+
+# Hand states are value * 2 + soft, where soft means an ace is still counted as 11.
+# Once the value is 21 or less at most one ace can be soft, so this pair is all
+# calculate_hand_value needs to carry from one card to the next.
+STATES = 64
+BUST_STATE = 22 * 2  # First state whose value is over 21
+
+# Hands are kept as keys, their state shifted past a code, so adding a card is key | code
+CODE_BITS = 8
+
+def build_transitions():
+    """Table of the state reached by adding each rank to each state, indexed by [state, rank]"""
+    transitions = np.zeros((STATES, RANKS), dtype=np.uint8)
+    for value in range(STATES // 2):
+        for soft in (0, 1):
+            for rank, card in enumerate(CARDS):
+                # Same adjustment as calculate_hand_value, applied to the soft ace we carry
+                total = value + card
+                aces = soft + (card == 11)
+                while total > 21 and aces > 0:
+                    total -= 10
+                    aces -= 1
+                transitions[value * 2 + soft, rank] = min(total, STATES // 2 - 1) * 2 + min(aces, 1)
+    return transitions
+
+def build_settlements():
+    """Flat table of the outcome for each player state and dealer state, indexed by player << 6 | dealer"""
+    settlements = np.zeros(STATES * STATES, dtype=np.uint8)
+    for player_state in range(STATES):
+        for dealer_state in range(STATES):
+            result, _, _ = settle_hand(1, player_state >> 1, dealer_state >> 1, 0)
+            settlements[player_state << 6 | dealer_state] = OUTCOMES.index(result)
+    return settlements
+
+def build_hits():
+    """Flat table of the key reached from each key | code, where a rejected code leaves the key alone"""
+    codes = np.arange(1 << CODE_BITS)
+    states = np.arange(STATES)[:, None]
+    reached = TRANSITIONS[:, codes % RANKS]
+    hits = np.where(codes < ACCEPTED, reached, states).astype(np.uint16) << CODE_BITS
+    return hits.ravel()
+
+TRANSITIONS = build_transitions()
+SETTLEMENTS = build_settlements()
+HITS = build_hits()
+OPENINGS = HITS[HITS[:1 << CODE_BITS, None] | np.arange(1 << CODE_BITS)].T.ravel()  # Key from first | second << 8
+
+@lru_cache(maxsize=None)
+def standing_hits(stand_on):
+    """HITS, except that a hand already at stand_on keeps its key whatever the card"""
+    hits = HITS.reshape(STATES, 1 << CODE_BITS).copy()
+    standing = np.arange(stand_on * 2, STATES, dtype=np.uint16)
+    hits[standing] = (standing << CODE_BITS)[:, None]
+    return hits.ravel()
+
+class InfiniteDeck:
+    """Card source drawing with replacement from CARDS, as deal_card() does
+
+    Codes are random bytes that come a block at a time from CardRNG, like a
+    server table's cards, and go straight into the HITS lookups unmapped.
+    """
+
+    independent = True  # Every card is a fresh draw, so a card nobody uses changes nothing
+
+    def __init__(self, seed=None):
+        self.rng = new_rng(seed)
+        self.block = np.empty(0, dtype=np.uint8)
+        self.position = 0
+
+    def start_round(self, rows):
+        """Nothing to reshuffle in an infinite deck"""
+
+    def draw(self, rows):
+        """Return one card code for each seat in rows"""
+        count = len(rows)
+        if self.position + count > len(self.block):
+            # Cards are generated a block at a time and handed out as slices
+            self.block = byte_block(self.rng, max(DRAW_BLOCK, count))
+            self.position = 0
+        cards = self.block[self.position:self.position + count]
+        self.position += count
+        return cards
+
+class HandArrays:
+    """Hand keys for one hand per seat, with optional card recording"""
+
+    def __init__(self, size, record=False):
+        self.key = np.zeros(size, dtype=np.uint16)
+        self.count = np.zeros(size, dtype=np.uint8) if record else None
+        self.cards = np.zeros((size, MAX_HAND_CARDS), dtype=np.uint8) if record else None
+
+    def deal(self, first, second):
+        """Give every hand its first two card codes"""
+        self.key = np.take(OPENINGS, first | second.astype(np.uint16) << CODE_BITS)
+        if self.cards is not None:
+            self.count[:] = 0
+            self.record(np.arange(len(first)), first)
+            self.record(np.arange(len(second)), second)
+
+    def record(self, index, codes):
+        """Append the rank of each accepted code to the recorded cards of the hands in index"""
+        accepted = codes < ACCEPTED
+        index = index[accepted]
+        self.cards[index, self.count[index]] = codes[accepted] % RANKS
+        self.count[index] += 1
+
+    def add(self, index, codes):
+        """Add one card code to each hand in index"""
+        self.key[index] = np.take(HITS, self.key[index] | codes)
+        if self.cards is not None:
+            self.record(index, codes)
+
+    def redeal(self, source, rows, first, second):
+        """Draw again for hands whose opening codes were rejected, until each has two cards"""
+        missing = (first >= ACCEPTED).view(np.uint8) + (second >= ACCEPTED)
+        index = np.flatnonzero(missing)
+        while index.size:
+            codes = source.draw(rows[index])
+            self.add(index, codes)
+            missing[index] -= codes < ACCEPTED
+            index = index[missing[index] > 0]
+
+    def draw_until(self, source, rows, stand_on):
+        """Keep drawing for every hand whose value is below stand_on"""
+        limit = stand_on * 2 << CODE_BITS  # Keys below this have values below stand_on
+        independent = getattr(source, "independent", False)
+        # While many hands are still drawing, give every hand a card in one pass with no
+        # indexing and let the standing ones ignore theirs. A rejected code leaves a
+        # hand where it was, so it keeps drawing below.
+        while independent and np.count_nonzero(self.key < limit) > len(rows) * FULL_PASS_SHARE:
+            codes = source.draw(rows)
+            if self.cards is not None:
+                index = np.flatnonzero(self.key < limit)
+                self.record(index, codes[index])
+            self.key = np.take(standing_hits(stand_on), self.key | codes)
+        index = np.flatnonzero(self.key < limit)
+        keys = self.key[index]  # Carried along with index so each draw reads no keys back
+        while index.size:
+            codes = source.draw(index if independent else rows[index])  # Only the count matters then
+            keys = np.take(HITS, keys | codes)
+            self.key[index] = keys
+            if self.cards is not None:
+                self.record(index, codes)
+            drawing = keys < limit
+            index, keys = index[drawing], keys[drawing]
+
+    def values(self):
+        """Hand values, as calculate_hand_value would give them"""
+        return (self.key >> (CODE_BITS + 1)).astype(np.uint8)
+
+def play_rounds(source, rows, stand_on=PLAYER_STANDS_ON, record=False):
+    """Play one round at every seat in rows and return (outcomes, player hands, dealer hands)"""
+    size = len(rows)
+    player = HandArrays(size, record)
+    dealer = HandArrays(size, record)
+
+    # Deal in the server's order: two player cards, then two dealer cards
+    source.start_round(rows)
+    player_cards = source.draw(rows), source.draw(rows)
+    dealer_cards = source.draw(rows), source.draw(rows)
+    player.deal(*player_cards)
+    dealer.deal(*dealer_cards)
+
+    # A hand missing an opening card is worth at most 11, so a hand that draws past that
+    # picks up the missing card in draw_until anyway and needs no separate pass
+    for hand, cards, target in ((player, player_cards, stand_on), (dealer, dealer_cards, DEALER_STANDS_ON)):
+        if target <= max(CARDS):
+            hand.redeal(source, rows, *cards)
+
+    # Player hits to the stand value, then the dealer draws until 17
+    player.draw_until(source, rows, stand_on)
+    dealer.draw_until(source, rows, DEALER_STANDS_ON)
+
+    # Settle exactly as settle_hand does, through a lookup on both final states
+    outcomes = np.take(SETTLEMENTS, player.key >> (CODE_BITS - 6) | dealer.key >> CODE_BITS)
+    return outcomes, player, dealer
+
+def money_changes(outcomes, bet_amount=BET_AMOUNT):
+    """Money won or lost at each seat"""
+    return np.take(OUTCOME_SIGNS, outcomes) * bet_amount
+
+def play_round_scalar(player_cards, dealer_cards, bet_amount=BET_AMOUNT, stand_on=PLAYER_STANDS_ON):
+    """Play one round with the server's scalar functions, taking cards in order from the given lists"""
+    player_draws = iter(player_cards)
+    dealer_draws = iter(dealer_cards)
+    player_hand = [next(player_draws), next(player_draws)]
+    dealer_hand = [next(dealer_draws), next(dealer_draws)]
+
+    while calculate_hand_value(player_hand) < stand_on:
+        player_hand.append(next(player_draws))
+    while calculate_hand_value(dealer_hand) < DEALER_STANDS_ON:
+        dealer_hand.append(next(dealer_draws))
+
+    result, _, change = settle_hand(1, calculate_hand_value(player_hand),
+                                    calculate_hand_value(dealer_hand), bet_amount)
+    if result == "bust":
+        change = -bet_amount  # The server takes a busted bet when the player busts
+    return result, change
+
+class SimulationStats:
+    """Mergeable totals over any number of simulated rounds"""
+
+    def __init__(self, bet_amount=BET_AMOUNT):
+        self.bet_amount = bet_amount
+        self.rounds = 0
+        self.outcomes = [0] * len(OUTCOMES)
+        self.dealer_busts = 0
+        self.net = 0          # Player's total winnings (negative means the house is ahead)
+        self.net_squares = 0  # For the variance of the per-round result
+
+    def add(self, outcomes, dealer):
+        """Fold in one batch from play_rounds"""
+        self.rounds += len(outcomes)
+        counts = [np.count_nonzero(outcomes == outcome) for outcome in range(len(OUTCOMES))]
+        self.outcomes = [a + b for a, b in zip(self.outcomes, counts)]
+        self.dealer_busts += int(np.count_nonzero(dealer.key >= BUST_STATE << CODE_BITS))
+
+        # Every round wins, loses or pushes exactly one bet
+        decided = counts[WIN] + counts[LOSE] + counts[BUST]
+        self.net += (counts[WIN] - counts[LOSE] - counts[BUST]) * self.bet_amount
+        self.net_squares += decided * self.bet_amount * self.bet_amount
+
+    def merge(self, other):
+        """Fold in totals computed elsewhere (e.g. by another process)"""
+        self.rounds += other.rounds
+        self.outcomes = [a + b for a, b in zip(self.outcomes, other.outcomes)]
+        self.dealer_busts += other.dealer_busts
+        self.net += other.net
+        self.net_squares += other.net_squares
+
+    def house_edge(self):
+        """House edge as a fraction of the amount bet, with its 95% confidence half-width"""
+        if not self.rounds:
+            return 0.0, 0.0
+        mean = self.net / self.rounds
+        variance = max(self.net_squares / self.rounds - mean * mean, 0.0)
+        half_width = 1.96 * math.sqrt(variance / self.rounds)
+        return -mean / self.bet_amount, half_width / self.bet_amount
+
+    def rates(self):
+        """Fraction of rounds ending in each outcome, plus the dealer bust rate"""
+        rounds = self.rounds or 1
+        rates = {name: count / rounds for name, count in zip(OUTCOMES, self.outcomes)}
+        rates["dealer_bust"] = self.dealer_busts / rounds
+        return rates
+
+    def report(self):
+        """Human-readable summary"""
+        edge, half_width = self.house_edge()
+        lines = [f"Rounds: {self.rounds:,}",
+                 f"House edge: {edge * 100:.3f}% +/- {half_width * 100:.3f}% (95% CI)"]
+        for name, rate in self.rates().items():
+            lines.append(f"  {name:<12}{rate * 100:7.3f}%")
+        return "\n".join(lines)
+
+class BankrollStats:
+    """Mergeable totals over final bankrolls"""
+
+    def __init__(self, bet_amount=BET_AMOUNT):
+        self.bet_amount = bet_amount
+        self.players = 0
+        self.ruined = 0  # Players left unable to cover a bet
+        self.total = 0
+
+    def add(self, bankroll):
+        """Fold in the final bankrolls from simulate_bankrolls"""
+        self.players += len(bankroll)
+        self.ruined += int(np.count_nonzero(bankroll < self.bet_amount))
+        self.total += int(bankroll.sum())
+
+    def merge(self, other):
+        """Fold in totals computed elsewhere (e.g. by another process)"""
+        self.players += other.players
+        self.ruined += other.ruined
+        self.total += other.total
+
+    def risk_of_ruin(self):
+        """Fraction of players ruined, with its 95% confidence half-width"""
+        if not self.players:
+            return 0.0, 0.0
+        ruin = self.ruined / self.players
+        return ruin, 1.96 * math.sqrt(ruin * (1 - ruin) / self.players)
+
+    def report(self):
+        """Human-readable summary"""
+        ruin, half_width = self.risk_of_ruin()
+        average = self.total / (self.players or 1)
+        return (f"Players: {self.players:,}, average final bankroll: ${average:,.2f}\n"
+                f"Risk of ruin: {ruin * 100:.3f}% +/- {half_width * 100:.3f}% (95% CI)")
+
+def simulate(rounds, seed=None, bet_amount=BET_AMOUNT, stand_on=PLAYER_STANDS_ON,
+             batch_size=BATCH_SIZE, source=None):
+    """Play independent rounds in batches and return their SimulationStats"""
+    source = source or InfiniteDeck(seed)
+    stats = SimulationStats(bet_amount)
+    remaining = rounds
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        outcomes, _, dealer = play_rounds(source, np.arange(size), stand_on)
+        stats.add(outcomes, dealer)
+        remaining -= size
+    return stats
+
+def simulate_bankrolls(players, rounds, seed=None, bet_amount=BET_AMOUNT, stand_on=PLAYER_STANDS_ON,
+                       checkpoints=10, source=None):
+    """Follow each player's bankroll from STARTING_MONEY, stopping players who can no longer bet
+
+    Returns (curve, bankroll) where curve holds the 5th/50th/95th percentile bankroll
+    at evenly spaced rounds and bankroll is every player's final bankroll.
+    """
+    source = source or InfiniteDeck(seed)
+    bankroll = np.full(players, STARTING_MONEY, dtype=np.int64)
+    every = max(rounds // checkpoints, 1)
+    curve = []
+
+    for round_number in range(1, rounds + 1):
+        seats = np.flatnonzero(bankroll >= bet_amount)
+        if seats.size:
+            outcomes, _, _ = play_rounds(source, seats, stand_on)
+            bankroll[seats] += money_changes(outcomes, bet_amount)
+        if round_number % every == 0 or round_number == rounds:
+            curve.append((round_number, *np.percentile(bankroll, [5, 50, 95]).tolist()))
+
+    return curve, bankroll
+
+def verify(rounds, seed=None, bet_amount=BET_AMOUNT, stand_on=PLAYER_STANDS_ON):
+    """Check the vectorized engine against the scalar functions and compare their speed"""
+    # Same cards, same outcomes
+    outcomes, player, dealer = play_rounds(InfiniteDeck(seed), np.arange(rounds), stand_on, record=True)
+    changes = money_changes(outcomes, bet_amount)
+    for i in range(rounds):
+        player_cards = [CARDS[rank] for rank in player.cards[i, :player.count[i]]]
+        dealer_cards = [CARDS[rank] for rank in dealer.cards[i, :dealer.count[i]]]
+        result, change = play_round_scalar(player_cards, dealer_cards, bet_amount, stand_on)
+        if result != OUTCOMES[outcomes[i]] or change != changes[i]:
+            raise AssertionError(f"Round {i} differs: scalar {result} {change}, "
+                                 f"vectorized {OUTCOMES[outcomes[i]]} {changes[i]}")
+    print(f"Vectorized outcomes match the scalar functions on {rounds:,} seeded rounds")
+
+    # Scalar loop over deal_card/calculate_hand_value versus batched arrays, best of a few
+    # runs each so a stall on a busy machine doesn't count against either
+    def scalar():
+        for _ in range(rounds):
+            cards = iter(deal_card, None)
+            play_round_scalar(cards, cards, bet_amount, stand_on)
+
+    # Batches need to be full-sized for a fair rate, so time more rounds
+    vector_rounds = max(rounds, 10 * BATCH_SIZE)
+    scalar_rate = rounds / min(timeit.repeat(scalar, number=1, repeat=VERIFY_REPEAT))
+    vector_rate = vector_rounds / min(timeit.repeat(lambda: simulate(vector_rounds, seed, bet_amount, stand_on),
+                                                    number=1, repeat=VERIFY_REPEAT))
+    print(f"Scalar: {scalar_rate:,.0f} rounds/s, vectorized: {vector_rate:,.0f} rounds/s "
+          f"({vector_rate / scalar_rate:.0f}x faster)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Monte Carlo simulation of the house rules")
+    parser.add_argument("--rounds", type=int, default=1_000_000, help="rounds to simulate")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--bet", type=int, default=BET_AMOUNT)
+    parser.add_argument("--stand-on", type=int, default=PLAYER_STANDS_ON,
+                        help="player hits until reaching this value")
+    parser.add_argument("--bankroll", type=int, metavar="PLAYERS",
+                        help="also follow this many bankrolls for --bankroll-rounds rounds")
+    parser.add_argument("--bankroll-rounds", type=int, default=1000)
+    parser.add_argument("--decks", type=int, default=0,
+                        help="deal from one N-deck shoe per table instead of an infinite deck")
+    parser.add_argument("--tables", type=int, default=10_000, help="tables (shoes) played side by side with --decks")
+    parser.add_argument("--penetration", type=float, default=PENETRATION)
+    parser.add_argument("--verify", type=int, metavar="ROUNDS",
+                        help="check against the scalar functions and time both")
+    args = parser.parse_args()
+
+    if args.verify:
+        verify(args.verify, args.seed, args.bet, args.stand_on)
+        return
+
+    # With shoes, each batch plays one round at every table
+    source, batch_size = None, BATCH_SIZE
+    if args.decks:
+        source = ShoeRack(args.tables, args.decks, args.penetration, args.seed)
+        batch_size = args.tables
+
+    start = time.perf_counter()
+    stats = simulate(args.rounds, args.seed, args.bet, args.stand_on, batch_size, source)
+    elapsed = time.perf_counter() - start
+    print(stats.report())
+    print(f"{args.rounds / elapsed:,.0f} rounds/s")
+
+    if args.bankroll:
+        source = ShoeRack(args.bankroll, args.decks, args.penetration, args.seed) if args.decks else None
+        curve, bankroll = simulate_bankrolls(args.bankroll, args.bankroll_rounds, args.seed,
+                                             args.bet, args.stand_on, source=source)
+        bankroll_stats = BankrollStats(args.bet)
+        bankroll_stats.add(bankroll)
+        print(f"\nBankrolls of {args.bankroll:,} players starting at ${STARTING_MONEY}:")
+        print(f"{'round':>8}{'p5':>10}{'median':>10}{'p95':>10}")
+        for round_number, low, median, high in curve:
+            print(f"{round_number:>8}{low:>10.0f}{median:>10.0f}{high:>10.0f}")
+        print(f"After {args.bankroll_rounds} rounds:")
+        print(bankroll_stats.report())
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,20 @@
 import socket
 import random
+import select
 import time
 import json
+import sys
+
+from BatchProtocol import handle_batch
+from BinaryProtocol import (ENCODINGS, FRAME_ENCODERS, ProtocolError, decode_message,
+                            encoding_reply, requested_encoding)
+from CardRNG import CardStream, table_seed
+from DeltaProtocol import UPDATES, DeltaEncoder, requested_updates, snapshot_message, updates_reply
+from Framing import FrameError, FrameSocket
+from Hand import Hand
+from Heartbeat import HEARTBEAT_TYPES, IDLE, IDLE_CLOSE, PING, PONG, REAP_INTERVAL, SEND_TIMEOUT, SLOW, Heartbeat
+from Metrics import Metrics, message_type, start_metrics_server
+from Serializer import StaticMessage, error_message
 
 # Basic server configuration
 HOST = '127.0.0.1'  # Standard loopback IP address
@@ -10,10 +23,23 @@ PORT = 65432        # Port to listen on
 # Game variables
 STARTING_MONEY = 2000
 
+# House rules
+CARDS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11]  # 10s represent J,Q,K, 11 is Ace
+DEALER_STANDS_ON = 17  # Dealer draws until reaching at least this value
+
+# Replies that never change, encoded once per encoding instead of on every send
+INVALID_BET = error_message("Invalid bet amount")
+INVALID_ACTION = error_message("Invalid action. Use 'hit' or 'stand'.")
+INVALID_FORMAT = error_message("Invalid message format")
+SERVER_ERROR = error_message("Server error occurred")
+GAME_OVER = StaticMessage(type="game_over", message="Game over! One player is out of money.")
+
+# Cards for callers without a table of their own
+SHARED_CARDS = CardStream(CARDS)
+
 def deal_card():
     """Returns a random card value between 2-11"""
-    cards = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11]  # 10s represent J,Q,K, 11 is Ace
-    return random.choice(cards)
+    return SHARED_CARDS.deal()
 
 def calculate_hand_value(hand):
     """Calculate the value of a hand, adjusting for aces"""
@@ -26,18 +52,346 @@ def calculate_hand_value(hand):
         aces -= 1
     return total
 
-def run_server():
-    """Main server function"""
+class BlackjackTable:
+    """Game state for a single table: two players sharing one dealer"""
+
+    def __init__(self, table_id=0, deal=None, shoe=None, log=None, history=None, seed=None):
+        self.table_id = table_id
+        self.shoe = shoe  # Finite shoe, if this table doesn't deal from an infinite deck
+        self.cards = CardStream(CARDS, seed)  # This table's own infinite deck, reproducible from its seed
+        self.deal = shoe.deal if shoe else deal or self.cards.deal  # Card source for this table
+
+        # Bankroll log, if the table's state should survive a crash
+        self.log = log
+        self.dealt = []   # Cards dealt since the last log record
+        self.logged = 0   # Log sequence number that must be durable before replies go out
+        self.history = history  # Round history recorder, if settled hands should be kept
+        self.spectators = None  # Spectators.Broadcast, once someone watches this table
+
+        # Initialize player money
+        self.player1_money = STARTING_MONEY
+        self.player2_money = STARTING_MONEY
+
+        # Keep track of dealer's hand for the round
+        self.dealer_hand = Hand()
+
+        # Hand currently being played (None between turns)
+        self.player_hand = None
+        self.player_num = 1
+        self.bets = {1: 0, 2: 0}
+
+        # Final hands of each player for the dealer's settlement
+        self.player1_final_hand = Hand()
+        self.player1_final_value = 0
+
+        self.hands_played = 0
+
+    def welcome_message(self):
+        """Initial message sent to a newly connected client"""
+        welcome = {
+            "type": "welcome",
+            "money": STARTING_MONEY,
+            "message": "Welcome to Two-Player Blackjack! Each player has $1000.",
+            "encodings": ENCODINGS,  # Client may reply with an "encoding" request
+            "updates": UPDATES,  # ... and an "updates" request for delta updates
+            "table": self.table_id,
+            "player1_money": self.player1_money,  # Differ from "money" on a recovered table
+            "player2_money": self.player2_money
+        }
+
+        # A table recovered from the bankroll log may have a hand waiting for hit/stand
+        if self.in_turn():
+            welcome["in_play"] = {
+                "player": self.player_num,
+                "player_hand": self.player_hand.to_list(),
+                "player_value": self.player_hand.value,
+                "dealer_visible": [self.dealer_hand[0]],
+                "bet": self.bets[self.player_num]
+            }
+        return welcome
+
+    def game_over_message(self):
+        """Message sent once a player is out of money"""
+        return GAME_OVER
+
+    def in_turn(self):
+        """True while a player's hand is waiting for hit/stand"""
+        return self.player_hand is not None
+
+    def is_finished(self):
+        """True once a player is out of money and no hand is in play"""
+        return not self.in_turn() and (self.player1_money <= 0 or self.player2_money <= 0)
+
+    def handle_message(self, client_message):
+        """Apply one client message to the table and return the replies to send"""
+        try:
+            if self.in_turn():
+                replies = self.handle_action(client_message)
+            elif client_message.get("type", "") == "bet":
+                replies = self.handle_bet(client_message)
+            else:
+                replies = []  # Between turns only bets are accepted, anything else is ignored
+        except Exception:
+            self.dealt.clear()  # Cards of a message that was never logged must not reach the next record
+            raise
+
+        if self.spectators:
+            self.spectators.publish(replies)
+        return replies
+
+    def handle_bet(self, client_message):
+        """Validate a bet and deal the opening hand"""
+        player_num = client_message.get("player", 1)  # Default to player 1
+        bet_amount = client_message.get("amount", 0)
+
+        # Get current player's money
+        current_player_money = self.player1_money if player_num == 1 else self.player2_money
+
+        # Validate bet (whole dollars, and only for the two seats, so it can be logged)
+        if (player_num not in (1, 2) or not isinstance(bet_amount, int)
+                or bet_amount <= 0 or bet_amount > current_player_money):
+            return [INVALID_BET]
+
+        # Player 2 plays against the dealer hand dealt with player 1's bet
+        if player_num == 2 and not self.dealer_hand:
+            return [INVALID_BET]
+
+        # A new round starts with player 1, the only time a shoe may be reshuffled
+        if player_num == 1 and self.shoe:
+            self.shoe.start_round()
+        
+        # Deal initial cards
+        player_hand = Hand((self.next_card(), self.next_card()))
+
+        # Only deal dealer cards on first player's turn
+        if player_num == 1:
+            self.dealer_hand = Hand((self.next_card(), self.next_card()))
+
+        # Send game state to client
+        game_state = {
+            "type": "game_state",
+            "player_hand": player_hand.to_list(),
+            "player_value": player_hand.value,
+            "dealer_visible": [self.dealer_hand[0]],  # Only first card visible
+            "bet": bet_amount
+        }
+
+        self.player_hand = player_hand
+        self.player_num = player_num
+        self.bets[player_num] = bet_amount
+        if self.log:
+            self.logged = self.log.record(self, "bet", player_num, bet_amount)
+        return [game_state]
+
+    def handle_action(self, action_message):
+        """Handle a hit or stand for the hand in play"""
+        action = action_message.get("action", "")
+        current_player = self.player_num  # The seat in turn plays, whatever "player" the client sent
+
+        # Invalid action
+        if action not in ("hit", "stand"):
+            return [INVALID_ACTION]
+
+        # Handle player hit or stand
+        reply = self.hit(current_player) if action == "hit" else self.stand(current_player)
+        if self.log:
+            self.logged = self.log.record(self, action, current_player)
+        return [reply]
+
+    def hit(self, current_player):
+        """Deal a new card to the player in turn"""
+        player_hand = self.player_hand
+        new_card = self.next_card()
+        player_hand.add(new_card)
+        player_value = player_hand.value
+
+        # Player didn't bust, send updated hand
+        if player_value <= 21:
+            return {
+                "type": "hit_result",
+                "card": new_card,
+                "player_hand": player_hand.to_list(),
+                "player_value": player_value
+            }
+
+        # Player busts, dealer wins
+        bet_amount = self.bets[self.player_num]
+        if current_player == 1:
+            self.player1_money -= bet_amount
+            # Keep the busted hand so the dealer's settlement can report it
+            self.player1_final_hand = player_hand
+            self.player1_final_value = player_value
+        else:
+            self.player2_money -= bet_amount
+        if self.history:
+            # The dealer never plays against a busted hand
+            self.history.record_hand(self.table_id, 1 if current_player == 1 else 2, player_hand, None,
+                                     "bust", bet_amount, -bet_amount)
+
+        self.player_hand = None
+        self.hands_played += 1
+        return {
+            "type": "result",
+            "player_hand": player_hand.to_list(),
+            "player_value": player_value,
+            "money": self.player1_money if current_player == 1 else self.player2_money,
+            "result": "bust",
+            "message": "Bust! You lose."
+        }
+
+    def stand(self, current_player):
+        """End the current player's turn, settling the round after player 2"""
+        player_hand = self.player_hand
+        self.player_hand = None
+        self.hands_played += 1
+
+        if current_player == 1:
+            # Player 1 stands, notify to switch to Player 2
+            self.player1_final_hand = player_hand  # Store Player 1's final hand
+            self.player1_final_value = player_hand.value
+            return {
+                "type": "player1_done",
+                "player1_hand": player_hand.to_list(),
+                "player1_value": self.player1_final_value
+            }
+
+        # Player 2 stands
+        player1_final_hand = self.player1_final_hand
+        player1_final_value = self.player1_final_value
+        player2_final_hand = player_hand  # Store Player 2's final hand
+        player2_final_value = player_hand.value
+
+        # Now dealer plays
+        dealer_hand = self.dealer_hand
+
+        # Dealer draws cards until reaching at least 17
+        while dealer_hand.value < DEALER_STANDS_ON:
+            dealer_hand.add(self.next_card())
+        dealer_value = dealer_hand.value
+
+        # Determine results for both players
+        player1_result, player1_message, player1_change = settle_hand(
+            1, player1_final_value, dealer_value, self.bets[1])
+        player2_result, player2_message, player2_change = settle_hand(
+            2, player2_final_value, dealer_value, self.bets[2])
+        self.player1_money += player1_change
+        self.player2_money += player2_change
+        if self.history:
+            # A busted player 1 hand was recorded when it busted
+            if player1_result != "bust":
+                self.history.record_hand(self.table_id, 1, player1_final_hand, dealer_hand,
+                                         player1_result, self.bets[1], player1_change)
+            self.history.record_hand(self.table_id, 2, player2_final_hand, dealer_hand,
+                                     player2_result, self.bets[2], player2_change)
+
+        # Send final result to client
+        return {
+            "type": "result",
+            "player1_hand": player1_final_hand.to_list(),
+            "player1_value": player1_final_value,
+            "player2_hand": player2_final_hand.to_list(),
+            "player2_value": player2_final_value,
+            "dealer_hand": dealer_hand.to_list(),
+            "dealer_value": dealer_value,
+            "player1_result": player1_result,
+            "player2_result": player2_result,
+            "player1_money": self.player1_money,
+            "player2_money": self.player2_money,
+            "message": f"Dealer: {dealer_value}, {player1_message}, {player2_message}"
+        }
+
+    def next_card(self):
+        """Deal a card, remembering it for the bankroll log if there is one"""
+        card = self.deal()
+        if self.log:
+            self.dealt.append(card)
+        return card
+
+def settle_hand(player_num, player_value, dealer_value, bet_amount):
+    """Compare a final hand against the dealer, returning (result, message, money change)"""
+    if player_value > 21:
+        # Money already deducted when the player busted
+        return "bust", f"Player {player_num} busted", 0
+    elif dealer_value > 21:
+        return "win", f"Player {player_num} wins! Dealer busted", bet_amount
+    elif dealer_value > player_value:
+        return "lose", f"Player {player_num} loses", -bet_amount
+    elif player_value > dealer_value:
+        return "win", f"Player {player_num} wins!", bet_amount
+    else:
+        return "tie", f"Player {player_num} ties", 0
+
+def new_shoe(decks, seed=None):
+    """Create a table's shoe, shuffled with its own RNG if seeded (imported here since Shoe.py imports this module)"""
+    from Shoe import Shoe
+    return Shoe(decks, rng=random.Random(seed) if seed is not None else None)
+
+def new_history(history_dir, decks=0):
+    """Open a round history recorder (imported here since RoundHistory.py imports this module)"""
+    from RoundHistory import HistoryWriter
+    return HistoryWriter(history_dir, decks=decks)
+
+def open_table(decks=0, log_path=None, history=None, seed=None):
+    """The server's table, recovered from the bankroll log if one is given and has it"""
+    if not log_path:
+        seed = table_seed(seed, 0)
+        return BlackjackTable(shoe=new_shoe(decks, seed) if decks else None, history=history, seed=seed), None
+
+    from BankrollLog import open_log  # Imported here since BankrollLog.py imports this module
+    log, recovery = open_log(log_path, decks=decks, seed=seed)
+    print(recovery.report())
+    table = recovery.tables.get(0)
+    if table is None:
+        seed = table_seed(seed, 0)
+        table = BlackjackTable(shoe=new_shoe(decks, seed) if decks else None, log=log, seed=seed)
+        log.open_table(table)
+    table.history = history
+    return table, log
+
+def check_deadlines(connection, metrics=None):
+    """Ping a quiet client or tell whether it should be disconnected, from its FrameSocket's Heartbeat"""
+    action = connection.heartbeat.due(time.monotonic())
+    if action is PING:
+        connection.send_message(PING)
+        connection.heartbeat.ping_sent = time.monotonic()
+        if metrics:
+            metrics.pings_sent += 1
+    elif action:
+        print(f"Disconnecting client: {action}")
+        if action == IDLE:
+            connection.send_message(IDLE_CLOSE)
+        if metrics:
+            metrics.reap(action)
+        return True
+    return False
+
+def run_server(decks=0, host=HOST, port=PORT, log_path=None, history_dir=None, metrics=None, metrics_port=None,
+               seed=None):
+    """Main server function, dealing from a shoe of the given number of decks if any
+
+    With a log path, bankrolls and the hand in play are written to a bankroll
+    log before every reply and recovered from it when the server restarts.
+    With a history directory, every settled hand is appended to the round history.
+    With a metrics port, counters and latency histograms are served over HTTP.
+    With a seed, the table deals the same cards every time it is started.
+    A client that goes quiet, stops playing or stops reading is disconnected
+    on the same deadlines as on the asyncio server (Heartbeat.py).
+    """
     print("Starting Two-Player Blackjack server...")
+    history = new_history(history_dir, decks) if history_dir else None
+    table, log = open_table(decks, log_path, history, seed)
+    if metrics_port is not None:
+        metrics = metrics or Metrics()
+        start_metrics_server(metrics, port=metrics_port)
     
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
         # Allow socket reuse to avoid "address already in use" errors
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         
         try:
-            server_socket.bind((HOST, PORT))
+            server_socket.bind((host, port))
             server_socket.listen()
-            print(f"Server running on {HOST}:{PORT}")
+            print(f"Server running on {host}:{port}")
             print("Waiting for client connection...")
             
             # Accept client connection
@@ -45,251 +399,145 @@ def run_server():
             print(f"Client connected from {address}")
             
             with client_socket:
-                # Initialize player money
-                player1_money = STARTING_MONEY
-                player2_money = STARTING_MONEY
-                
-                # Keep track of dealer's hand for the round
-                dealer_hand = []
+                # Replies that can't be sent within SEND_TIMEOUT raise socket.timeout
+                client_socket.settimeout(SEND_TIMEOUT)
+                connection = FrameSocket(client_socket, decode=decode_message, metrics=metrics)
+                heartbeat = connection.heartbeat = Heartbeat(time.monotonic())
+                delta = None  # DeltaEncoder once the client asks for delta updates
+                if metrics:
+                    metrics.connections += 1
+                    metrics.tables_opened += 1
+                    metrics.active_tables += 1
                 
                 # Send initial message to client
-                welcome_message = {
-                    "type": "welcome",
-                    "money": STARTING_MONEY,
-                    "message": "Welcome to Two-Player Blackjack! Each player has $1000."
-                }
-                client_socket.sendall(json.dumps(welcome_message).encode('utf-8'))
+                connection.send_message(table.welcome_message())
                 
                 # Main game loop
-                while player1_money > 0 and player2_money > 0:
+                while not table.is_finished():
                     try:
-                        # Wait for bet from client
-                        data = client_socket.recv(1024).decode('utf-8')
-                        if not data:
-                            print("Client disconnected")
-                            break
+                        # Wait for the next message from client, checking its deadlines
+                        # at least every REAP_INTERVAL and after every read short of a frame
+                        if not connection.messages:
+                            if select.select([client_socket], [], [], REAP_INTERVAL)[0] and not connection.fill():
+                                print("Client disconnected")
+                                break
+                            if not connection.messages:
+                                if check_deadlines(connection, metrics):
+                                    break
+                                if history:
+                                    history.flush_due()  # A quiet table's last hands don't wait for the next
+                                continue
+                        payload = connection.messages.popleft()
+                        start = time.perf_counter_ns()  # Latency is measured from here to the last reply
                         
-                        # Parse client message
-                        client_message = json.loads(data)
-                        message_type = client_message.get("type", "")
+                        # Parse client message and let the table handle it
+                        client_message = decode_message(payload)
                         
-                        # Handle client bet
-                        if message_type == "bet":
-                            player_num = client_message.get("player", 1)  # Default to player 1
-                            bet_amount = client_message.get("amount", 0)
-                            
-                            # Get current player's money
-                            current_player_money = player1_money if player_num == 1 else player2_money
-                            
-                            # Validate bet
-                            if bet_amount <= 0 or bet_amount > current_player_money:
-                                error_message = {
-                                    "type": "error",
-                                    "message": "Invalid bet amount"
-                                }
-                                client_socket.sendall(json.dumps(error_message).encode('utf-8'))
-                                continue
-                            
-                            # Deal initial cards
-                            player_hand = [deal_card(), deal_card()]
-                            
-                            # Only deal dealer cards on first player's turn
-                            if player_num == 1:
-                                dealer_hand = [deal_card(), deal_card()]
-                            
-                            # Send game state to client
-                            game_state = {
-                                "type": "game_state",
-                                "player_hand": player_hand,
-                                "player_value": calculate_hand_value(player_hand),
-                                "dealer_visible": [dealer_hand[0]],  # Only first card visible
-                                "bet": bet_amount
-                            }
-                            client_socket.sendall(json.dumps(game_state).encode('utf-8'))
-                            
-                            # Player's turn loop
-                            game_over = False
-                            while not game_over:
-                                # Wait for player action
-                                action_data = client_socket.recv(1024).decode('utf-8')
-                                if not action_data:
-                                    print("Client disconnected")
-                                    return
-                                
-                                action_message = json.loads(action_data)
-                                action = action_message.get("action", "")
-                                current_player = action_message.get("player", player_num)
-                                
-                                # Handle player hit
-                                if action == "hit":
-                                    # Deal a new card to player
-                                    new_card = deal_card()
-                                    player_hand.append(new_card)
-                                    player_value = calculate_hand_value(player_hand)
-                                    
-                                    # Check if player busts
-                                    if player_value > 21:
-                                        # Player busts, dealer wins
-                                        if current_player == 1:
-                                            player1_money -= bet_amount
-                                        else:
-                                            player2_money -= bet_amount
-                                        
-                                        result = {
-                                            "type": "result",
-                                            "player_hand": player_hand,
-                                            "player_value": player_value,
-                                            "money": player1_money if current_player == 1 else player2_money,
-                                            "result": "bust",
-                                            "message": "Bust! You lose."
-                                        }
-                                        client_socket.sendall(json.dumps(result).encode('utf-8'))
-                                        game_over = True
-                                    else:
-                                        # Player didn't bust, send updated hand
-                                        hit_result = {
-                                            "type": "hit_result",
-                                            "card": new_card,
-                                            "player_hand": player_hand,
-                                            "player_value": player_value
-                                        }
-                                        client_socket.sendall(json.dumps(hit_result).encode('utf-8'))
-                                
-                                # Handle player stand
-                                elif action == "stand":
-                                    if current_player == 1:
-                                        # Player 1 stands, notify to switch to Player 2
-                                        player1_final_hand = player_hand  # Store Player 1's final hand
-                                        player1_final_value = calculate_hand_value(player_hand)
-                                        
-                                        # Notify client to switch to Player 2
-                                        player1_done = {
-                                            "type": "player1_done",
-                                            "player1_hand": player1_final_hand,
-                                            "player1_value": player1_final_value
-                                        }
-                                        client_socket.sendall(json.dumps(player1_done).encode('utf-8'))
-                                        game_over = True  # End player 1's turn
-                                    
-                                    else:  # Player 2 stands
-                                        player2_final_hand = player_hand  # Store Player 2's final hand
-                                        player2_final_value = calculate_hand_value(player_hand)
-                                        
-                                        # Now dealer plays
-                                        dealer_value = calculate_hand_value(dealer_hand)
-                                        
-                                        # Dealer draws cards until reaching at least 17
-                                        while dealer_value < 17:
-                                            dealer_hand.append(deal_card())
-                                            dealer_value = calculate_hand_value(dealer_hand)
-                                        
-                                        # Determine results for both players
-                                        player1_result = ""
-                                        player2_result = ""
-                                        player1_message = ""
-                                        player2_message = ""
-                                        
-                                        # Player 1 result
-                                        if player1_final_value > 21:
-                                            player1_result = "bust"
-                                            player1_message = "Player 1 busted"
-                                            # Money already deducted
-                                        elif dealer_value > 21:
-                                            player1_result = "win"
-                                            player1_message = "Player 1 wins! Dealer busted"
-                                            player1_money += bet_amount
-                                        elif dealer_value > player1_final_value:
-                                            player1_result = "lose"
-                                            player1_message = "Player 1 loses"
-                                            player1_money -= bet_amount
-                                        elif player1_final_value > dealer_value:
-                                            player1_result = "win"
-                                            player1_message = "Player 1 wins!"
-                                            player1_money += bet_amount
-                                        else:
-                                            player1_result = "tie"
-                                            player1_message = "Player 1 ties"
-                                        
-                                        # Player 2 result
-                                        if player2_final_value > 21:
-                                            player2_result = "bust"
-                                            player2_message = "Player 2 busted"
-                                            # Money already deducted
-                                        elif dealer_value > 21:
-                                            player2_result = "win"
-                                            player2_message = "Player 2 wins! Dealer busted"
-                                            player2_money += bet_amount
-                                        elif dealer_value > player2_final_value:
-                                            player2_result = "lose"
-                                            player2_message = "Player 2 loses"
-                                            player2_money -= bet_amount
-                                        elif player2_final_value > dealer_value:
-                                            player2_result = "win"
-                                            player2_message = "Player 2 wins!"
-                                            player2_money += bet_amount
-                                        else:
-                                            player2_result = "tie"
-                                            player2_message = "Player 2 ties"
-                                        
-                                        # Send final result to client
-                                        final_result = {
-                                            "type": "result",
-                                            "player1_hand": player1_final_hand,
-                                            "player1_value": player1_final_value,
-                                            "player2_hand": player2_final_hand,
-                                            "player2_value": player2_final_value,
-                                            "dealer_hand": dealer_hand,
-                                            "dealer_value": dealer_value,
-                                            "player1_result": player1_result,
-                                            "player2_result": player2_result,
-                                            "player1_money": player1_money,
-                                            "player2_money": player2_money,
-                                            "message": f"Dealer: {dealer_value}, {player1_message}, {player2_message}"
-                                        }
-                                        client_socket.sendall(json.dumps(final_result).encode('utf-8'))
-                                        game_over = True
-                                
-                                else:
-                                    # Invalid action
-                                    error_message = {
-                                        "type": "error",
-                                        "message": "Invalid action. Use 'hit' or 'stand'."
-                                    }
-                                    client_socket.sendall(json.dumps(error_message).encode('utf-8'))
+                        # Answer a ping; a pong only had to arrive
+                        if client_message.get("type") in HEARTBEAT_TYPES:
+                            if client_message["type"] == "ping":
+                                connection.send_message(PONG)
+                            if metrics:
+                                metrics.observe(client_message["type"], time.perf_counter_ns() - start)
+                            if not connection.messages and check_deadlines(connection, metrics):
+                                break  # Pongs alone don't hold off the idle deadline
+                            continue
+                        heartbeat.active = heartbeat.heard
+                        
+                        # Switch encodings after acknowledging in the current one
+                        encoding = requested_encoding(client_message)
+                        if encoding:
+                            connection.send_message(encoding_reply(encoding))
+                            connection.encode = FRAME_ENCODERS[encoding]
+                            if metrics:
+                                metrics.observe("encoding", time.perf_counter_ns() - start)
+                            continue
+                        
+                        # Switch to numbered deltas (or back), or send the whole table for a resync
+                        updates = requested_updates(client_message)
+                        if updates:
+                            delta = DeltaEncoder(table) if updates == "delta" else None
+                            connection.send_message(updates_reply(updates))
+                            if metrics:
+                                metrics.observe("updates", time.perf_counter_ns() - start)
+                            continue
+                        if client_message.get("type") == "sync":
+                            connection.send_message(snapshot_message(table, delta.seq if delta else 0))
+                            if metrics:
+                                metrics.observe("sync", time.perf_counter_ns() - start)
+                            continue
+                        
+                        hands_before = table.hands_played
+                        if client_message.get("type") == "batch":
+                            # Every message in the batch, answered in one frame
+                            replies = [handle_batch(table, client_message, delta)]
+                        else:
+                            replies = table.handle_message(client_message)
+                            if delta:
+                                replies = [delta.encode(reply) for reply in replies]
+                        if log:
+                            log.wait(table.logged)  # Durable before the client hears about it
+                        for reply in replies:
+                            connection.send_message(reply)
+                        if metrics:
+                            metrics.hands_played += table.hands_played - hands_before
+                            metrics.observe(message_type(client_message, replies), time.perf_counter_ns() - start)
                     
-                    except json.JSONDecodeError as e:
-                        print(f"JSON error: {e}")
-                        error_message = {
-                            "type": "error",
-                            "message": "Invalid message format"
-                        }
-                        client_socket.sendall(json.dumps(error_message).encode('utf-8'))
+                    except FrameError as e:
+                        print(f"Framing error: {e}")
+                        if metrics:
+                            metrics.error("framing")
+                        break
+                    
+                    except socket.timeout:
+                        print("Disconnecting client: not reading its replies")
+                        if metrics:
+                            metrics.reap(SLOW)
+                        break
+                    
+                    except (json.JSONDecodeError, ProtocolError) as e:
+                        print(f"Message format error: {e}")
+                        connection.send_message(INVALID_FORMAT)
+                        if metrics:
+                            metrics.error("decode")
+                            metrics.observe("error", time.perf_counter_ns() - start)
                     
                     except Exception as e:
                         print(f"Error during game: {e}")
+                        if metrics:
+                            metrics.error("server")
                         try:
-                            error_message = {
-                                "type": "error",
-                                "message": "Server error occurred"
-                            }
-                            client_socket.sendall(json.dumps(error_message).encode('utf-8'))
+                            connection.send_message(SERVER_ERROR)
                         except:
                             pass
                 
                 # Game over - a player is out of money
-                if player1_money <= 0 or player2_money <= 0:
-                    game_over_message = {
-                        "type": "game_over",
-                        "message": "Game over! One player is out of money."
-                    }
-                    client_socket.sendall(json.dumps(game_over_message).encode('utf-8'))
+                if table.is_finished():
+                    if log:
+                        log.close_table(table)  # Next start deals a fresh game
+                    connection.send_message(table.game_over_message())
+                if metrics:
+                    metrics.active_tables -= 1
         
         except Exception as e:
             print(f"Server error: {e}")
 
+        finally:
+            if log:
+                log.close()
+            if history:
+                history.close()
+
 if __name__ == "__main__":
     try:
-        run_server()
+        # Optional arguments: number of decks in the shoe (default: infinite deck),
+        # a bankroll log to recover from and write to, a round history directory
+        # (an empty string skips either), a port to serve metrics on and a card seed
+        run_server(int(sys.argv[1]) if len(sys.argv) > 1 else 0,
+                   log_path=sys.argv[2] if len(sys.argv) > 2 else None,
+                   history_dir=sys.argv[3] if len(sys.argv) > 3 else None,
+                   metrics_port=int(sys.argv[4]) if len(sys.argv) > 4 and sys.argv[4] else None,
+                   seed=int(sys.argv[5]) if len(sys.argv) > 5 else None)
     except KeyboardInterrupt:
         print("\nServer shutdown by user")
     except Exception as e:
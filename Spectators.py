@@ -0,0 +1,266 @@
+import asyncio
+import time
+
+from BatchProtocol import frozen
+from DeltaProtocol import snapshot_message
+from Framing import FrameDecoder, FrameError, encode_message
+
+# Spectator defaults
+MAX_SPECTATOR_BUFFER = 64 * 1024  # Bytes queued for one spectator before it counts as behind
+SLOW_TIMEOUT = 10.0               # Seconds a spectator may stay behind before it is dropped
+FANOUT_CHUNK = 256                # Spectators written to before letting the tables run again
+
+# Replies spectators see; errors and encoding acks only concern the player
+PUBLISHED = {"game_state", "hit_result", "player1_done", "result", "game_over"}
+
+class Spectator:
+    __slots__ = ("connection", "start", "behind_since")
+
+    def __init__(self, connection, start):
+        self.connection = connection
+        self.start = start         # Number of the first update it needs; its snapshot covers the ones before
+        self.behind_since = None   # time.monotonic() it fell behind, while it is
+
+class Broadcast:
+    """Spectators of one table, all sent the same bytes
+
+    The table hands its replies to publish() as it makes them. flush(),
+    called once they are durable, passes them to a sender task, which
+    encodes them once per encoding in use and writes that buffer to every
+    spectator, FANOUT_CHUNK spectators at a time. Between chunks the event
+    loop runs the tables, so thousands of spectators never hold up a
+    table, and updates made meanwhile go out together in the next pass.
+
+    Each spectator's queue is its transport's write buffer, bounded at
+    MAX_SPECTATOR_BUFFER. A spectator over it is behind: it skips updates
+    and, once its buffer has drained, gets one snapshot of the table in
+    their place. One that stays behind for SLOW_TIMEOUT is dropped.
+    """
+
+    def __init__(self, table, stats=None):
+        self.table = table
+        self.stats = stats
+        self.spectators = {}  # Connection -> Spectator
+        self.pending = []     # Published replies, not yet durable
+        self.ready = []       # Durable replies waiting for the sender
+        self.published = 0    # Replies published so far; each one's number is its position
+        self.sender = None    # Task writing ready replies out
+        self.closed = False
+
+    def add(self, connection):
+        """Start sending a spectator the table's updates, beginning with a snapshot"""
+        connection.writer.write(connection.encode(snapshot_message(self.table)))
+        self.spectators[connection] = Spectator(connection, self.published)
+        if self.stats:
+            self.stats.spectators += 1
+
+    def remove(self, connection):
+        if self.spectators.pop(connection, None) and self.stats:
+            self.stats.spectators -= 1
+
+    def publish(self, replies):
+        for reply in replies:
+            if reply.get("type") in PUBLISHED:
+                self.pending.append(frozen(reply))  # The table keeps adding to its hands
+                self.published += 1
+
+    def flush(self):
+        """Hand every published reply to the sender task"""
+        if self.pending:
+            self.ready.extend(self.pending)
+            self.pending = []
+        if (self.ready or self.closed) and self.sender is None:
+            self.sender = asyncio.get_running_loop().create_task(self.send())
+
+    def close(self):
+        """Disconnect every spectator once the updates so far are out, e.g. when the player leaves"""
+        self.closed = True
+        self.flush()
+
+    async def send(self):
+        """Write ready replies to every spectator until none are left"""
+        try:
+            while self.ready:
+                messages = self.ready
+                self.ready = []
+                await self.send_pass(messages, self.published - len(self.pending) - len(messages))
+                await asyncio.sleep(0)
+        finally:
+            self.sender = None
+            if self.closed:
+                for connection in list(self.spectators):
+                    self.remove(connection)
+                    connection.close()
+
+    async def send_pass(self, messages, first):
+        """Write one batch of replies, numbered from first, to every spectator"""
+        start = time.perf_counter_ns()
+        encoded = {}    # Encoder -> (the messages encoded once with it, where each one starts)
+        snapshots = {}  # Encoder -> the table's snapshot, for spectators catching up
+        stats = self.stats
+        now = time.monotonic()
+
+        for count, spectator in enumerate(list(self.spectators.values()), 1):
+            if count % FANOUT_CHUNK == 0:
+                await asyncio.sleep(0)  # Let the tables run
+            connection = spectator.connection
+            transport = connection.writer.transport
+            if transport.is_closing():
+                self.remove(connection)
+                continue
+
+            if transport.get_write_buffer_size() > MAX_SPECTATOR_BUFFER:
+                if spectator.behind_since is None:
+                    spectator.behind_since = now
+                    if stats:
+                        stats.spectators_coalesced += 1
+                elif now - spectator.behind_since > SLOW_TIMEOUT:
+                    self.remove(connection)
+                    connection.close()
+                    if stats:
+                        stats.spectators_dropped += 1
+                continue
+
+            encode = connection.encode
+            if spectator.behind_since is not None:
+                # Caught up: the updates it skipped are replaced by the table as it is now
+                data = snapshots.get(encode)
+                if data is None:
+                    data = snapshots[encode] = encode(snapshot_message(self.table))
+                spectator.behind_since = None
+                spectator.start = self.published
+            else:
+                skip = spectator.start - first
+                if skip >= len(messages):
+                    continue  # Joined after these, and its snapshot has them
+                frames = encoded.get(encode)
+                if frames is None:
+                    parts = [encode(message) for message in messages]
+                    offsets = [0]
+                    for part in parts:
+                        offsets.append(offsets[-1] + len(part))
+                    frames = encoded[encode] = (b"".join(parts), offsets)
+                data = frames[0] if skip <= 0 else frames[0][frames[1][skip]:]
+            connection.writer.write(data)
+            if stats:
+                stats.spectator_bytes_sent += len(data)
+
+        if stats:
+            stats.observe("broadcast", time.perf_counter_ns() - start)
+
+    async def watch(self, connection):
+        """Hold a spectator's connection until it closes; anything it sends is ignored"""
+        try:
+            while True:
+                await connection.read_payloads()
+        except (ConnectionError, FrameError):
+            pass
+        finally:
+            self.remove(connection)
+
+async def spectate_clients(host, port, table, count, connect_limit=500):
+    """Open count spectator connections to a table and read each until it closes
+
+    Returns (connections that subscribed, bytes received, frames received).
+    """
+    limit = asyncio.Semaphore(connect_limit)  # Stay under the listen backlog while connecting
+    totals = [0, 0, 0]
+
+    async def spectator():
+        async with limit:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(encode_message({"type": "spectate", "table": table}))
+        decoder = FrameDecoder()
+        subscribed = False
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                frames = decoder.feed(data)
+                if not subscribed and len(frames) > 1:
+                    subscribed = True  # Past the welcome, at the snapshot
+                    totals[0] += 1
+                totals[1] += len(data)
+                totals[2] += len(frames)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(spectator() for _ in range(count)))
+    return totals
+
+def spectator_process(host, port, table, count, results):
+    """Entry point of the process that plays the spectators"""
+    results.send(asyncio.run(spectate_clients(host, port, table, count)))
+
+async def bench_broadcast(count, rounds, host="127.0.0.1"):
+    """One table played for rounds rounds while count spectators in another process watch it"""
+    import multiprocessing
+
+    from AsyncServer import ServerStats, serve  # Imported here since AsyncServer.py imports this module
+    from BlackjackClient import AsyncBlackjackClient
+
+    stats = ServerStats()
+    server = await serve(host, 0, stats)
+    port = server.sockets[0].getsockname()[1]
+    player = AsyncBlackjackClient(host, port, encoding="json")
+    await player.connect()
+    table_id = player.state.table
+
+    # Spawned: a forked child would think this process's event loop is running in it
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=spectator_process, args=(host, port, table_id, count, sender))
+    process.start()
+    while stats.spectators < count:
+        await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    hands = 0
+    for _ in range(rounds):
+        for player_num in (1, 2):
+            await player.bet(25, player_num)
+            await player.stand(player_num)
+            hands += 1
+    elapsed = time.perf_counter() - start
+    player.close()
+
+    loop = asyncio.get_running_loop()
+    subscribed, received, frames = await loop.run_in_executor(None, receiver.recv)
+    process.join()
+    server.close()
+    await server.wait_closed()
+    broadcast = stats.latency.get("broadcast")
+    return {"hands_per_second": hands / elapsed, "subscribed": subscribed, "received": received,
+            "frames": frames, "coalesced": stats.spectators_coalesced, "dropped": stats.spectators_dropped,
+            "flush_p50": broadcast.quantile(0.5) if broadcast else 0,
+            "flush_p99": broadcast.quantile(0.99) if broadcast else 0}
+
+def bench(counts=(1, 100, 10000), rounds=200):
+    """Broadcast cost and the player's hands/s against the number of spectators"""
+    import timeit
+
+    update = {"type": "hit_result", "card": 4, "player_hand": [10, 6, 4], "player_value": 20}
+    number = 20000
+    encode_us = timeit.timeit(lambda: encode_message(update), number=number) / number * 1e6
+    print(f"Encoding one update: {encode_us:.2f} us (once per flush here, instead of once per spectator)")
+    print(f"{'spectators':>10}{'hands/s':>10}{'p50 us':>10}{'p99 us':>10}{'ns/spectator':>14}{'frames/spectator':>18}"
+          f"{'coalesced':>11}{'dropped':>9}")
+
+    for count in counts:
+        result = asyncio.run(bench_broadcast(count, rounds))
+        print(f"{count:>10}{result['hands_per_second']:>10,.0f}{result['flush_p50'] / 1000:>10.1f}"
+              f"{result['flush_p99'] / 1000:>10.1f}{result['flush_p50'] / count:>14.0f}"
+              f"{result['frames'] / max(result['subscribed'], 1):>18.1f}{result['coalesced']:>11}"
+              f"{result['dropped']:>9}")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark broadcasting table updates to spectators")
+    parser.add_argument("--spectators", default="1,100,10000", help="spectator counts (default %(default)s)")
+    parser.add_argument("--rounds", type=int, default=200, help="rounds played while they watch")
+    args = parser.parse_args()
+    bench([int(n) for n in args.spectators.split(",")], args.rounds)
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import struct
+import sys
+import time
+from array import array
+from functools import lru_cache
+
+from Hand import Hand
+from SmartServer import CARDS, DEALER_STANDS_ON
+
+# Default location of the cached table, next to this file
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "strategy_table.bin")
+
+# File layout: header, then stand EVs, hit EVs and dealer distributions as float64
+MAGIC = b"BJEV"
+VERSION = 1
+HEADER = struct.Struct("<4sH8sBB")  # magic, version, rules hash, dealer stands on, dealer outcomes
+
+# Tables are indexed by value (0-21), soft flag and dealer upcard value (0-11)
+VALUES = 22
+UPCARDS = max(CARDS) + 1
+CELLS = VALUES * 2 * UPCARDS
+
+def rules_hash(cards=CARDS, dealer_stands_on=DEALER_STANDS_ON):
+    """Fingerprint of the rules the table was computed for"""
+    return hashlib.sha256(repr((sorted(cards), dealer_stands_on)).encode("utf-8")).digest()[:8]
+
+def add_card(value, soft, card):
+    """Value and soft flag after adding a card, with the ace adjustment of calculate_hand_value"""
+    total = value + card
+    aces = soft + (card == 11)
+    while total > 21 and aces > 0:
+        total -= 10
+        aces -= 1
+    return total, min(aces, 1)
+
+def hand_state(hand):
+    """(value, soft) for a list of cards; soft means an ace is still counted as 11"""
+    hand = Hand(hand)
+    return hand.value, int(hand.soft)
+
+def cell(value, soft, upcard):
+    """Flat index of a table entry"""
+    return (value * 2 + soft) * UPCARDS + upcard
+
+def compute(cards=CARDS, dealer_stands_on=DEALER_STANDS_ON):
+    """Exact EVs under the infinite deck deal_card() draws from
+
+    Returns (stand_ev, hit_ev, dealer) as flat arrays; dealer holds, per upcard,
+    the probability of finishing on each value from dealer_stands_on to 21 and
+    then of busting.
+    """
+    probability = 1 / len(cards)
+    outcomes = 21 - dealer_stands_on + 2  # Each stand value plus bust
+
+    @lru_cache(maxsize=None)
+    def dealer_final(value, soft):
+        """Distribution of the dealer's final value from a given state"""
+        if value > 21:
+            return tuple(1.0 if i == outcomes - 1 else 0.0 for i in range(outcomes))
+        if value >= dealer_stands_on:
+            return tuple(1.0 if i == value - dealer_stands_on else 0.0 for i in range(outcomes))
+        distribution = [0.0] * outcomes
+        for card in cards:
+            for i, chance in enumerate(dealer_final(*add_card(value, soft, card))):
+                distribution[i] += probability * chance
+        return tuple(distribution)
+
+    def stand(value, upcard):
+        """EV of standing on value against the dealer's upcard, settled as settle_hand does"""
+        distribution = dealer_final(*add_card(0, 0, upcard))
+        ev = distribution[-1]  # Dealer busts
+        for i, chance in enumerate(distribution[:-1]):
+            dealer_value = dealer_stands_on + i
+            if value > dealer_value:
+                ev += chance
+            elif dealer_value > value:
+                ev -= chance
+        # Dealer values below the stand value never happen, so low hands lose to every finish
+        return ev
+
+    @lru_cache(maxsize=None)
+    def best(value, soft, upcard):
+        """EV of playing on from a state with the better of hit and stand"""
+        if value > 21:
+            return -1.0
+        return max(stand(value, upcard), hit(value, soft, upcard))
+
+    @lru_cache(maxsize=None)
+    def hit(value, soft, upcard):
+        """EV of taking one card and then playing on optimally"""
+        return sum(probability * best(*add_card(value, soft, card), upcard) for card in cards)
+
+    stand_ev = array("d", bytes(8 * CELLS))
+    hit_ev = array("d", bytes(8 * CELLS))
+    dealer = array("d", bytes(8 * UPCARDS * outcomes))
+    for upcard in set(cards):
+        dealer[upcard * outcomes:(upcard + 1) * outcomes] = array("d", dealer_final(*add_card(0, 0, upcard)))
+        for value in range(VALUES):
+            for soft in (0, 1):
+                stand_ev[cell(value, soft, upcard)] = stand(value, upcard)
+                hit_ev[cell(value, soft, upcard)] = hit(value, soft, upcard)
+    return stand_ev, hit_ev, dealer
+
+class StrategyTable:
+    """O(1) lookups into precomputed stand/hit EVs and dealer outcome distributions"""
+
+    def __init__(self, stand_ev, hit_ev, dealer, dealer_stands_on=DEALER_STANDS_ON):
+        self.stand_evs = stand_ev
+        self.hit_evs = hit_ev
+        self.dealer = dealer
+        self.dealer_stands_on = dealer_stands_on
+        self.outcomes = 21 - dealer_stands_on + 2
+
+    def stand_ev(self, value, soft, upcard):
+        """Expected result, in bets, of standing"""
+        return self.stand_evs[cell(value, soft, upcard)]
+
+    def hit_ev(self, value, soft, upcard):
+        """Expected result, in bets, of hitting and then playing on optimally"""
+        return self.hit_evs[cell(value, soft, upcard)]
+
+    def best_action(self, value, soft, upcard):
+        """"hit" or "stand", whichever has the higher EV"""
+        index = cell(value, soft, upcard)
+        return "hit" if self.hit_evs[index] > self.stand_evs[index] else "stand"
+
+    def advise(self, hand, upcard):
+        """Best action for a list of cards against the dealer's upcard"""
+        value, soft = hand_state(hand)
+        if value > 21:
+            return "stand"
+        return self.best_action(value, soft, upcard)
+
+    def dealer_distribution(self, upcard):
+        """Probability of each dealer final value ("bust" for over 21) given the upcard"""
+        start = upcard * self.outcomes
+        chances = self.dealer[start:start + self.outcomes]
+        distribution = {self.dealer_stands_on + i: chance for i, chance in enumerate(chances[:-1])}
+        distribution["bust"] = chances[-1]
+        return distribution
+
+    def save(self, path=CACHE_PATH):
+        """Write the table in its compact binary form"""
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, rules_hash(), self.dealer_stands_on, self.outcomes))
+            self.stand_evs.tofile(f)
+            self.hit_evs.tofile(f)
+            self.dealer.tofile(f)
+
+    @classmethod
+    def load(cls, path=CACHE_PATH):
+        """Read a saved table, or return None if it is missing or was built for other rules"""
+        try:
+            with open(path, "rb") as f:
+                magic, version, fingerprint, dealer_stands_on, outcomes = HEADER.unpack(f.read(HEADER.size))
+                if (magic, version, fingerprint) != (MAGIC, VERSION, rules_hash()):
+                    return None
+                stand_ev, hit_ev, dealer = array("d"), array("d"), array("d")
+                stand_ev.fromfile(f, CELLS)
+                hit_ev.fromfile(f, CELLS)
+                dealer.fromfile(f, UPCARDS * outcomes)
+        except (OSError, EOFError, ValueError, struct.error):  # ValueError: cut off mid-number
+            return None
+        return cls(stand_ev, hit_ev, dealer, dealer_stands_on)
+
+    @classmethod
+    def build(cls):
+        """Compute the table for the current rules"""
+        return cls(*compute())
+
+_table = None
+
+def get_table(path=CACHE_PATH):
+    """Shared table, loaded from disk or recomputed (and saved) when the rules changed"""
+    global _table
+    if _table is None:
+        _table = StrategyTable.load(path)
+        if _table is None:
+            _table = StrategyTable.build()
+            try:
+                _table.save(path)
+            except OSError:
+                pass  # Still usable, just recomputed next time
+    return _table
+
+def print_chart(table):
+    """Print the basic strategy chart and the dealer's final-value distributions"""
+    upcards = sorted(set(CARDS))
+    header = "".join(f"{'A' if upcard == 11 else upcard:>4}" for upcard in upcards)
+    for soft, label in ((0, "Hard"), (1, "Soft")):
+        print(f"{label:<6}{header}")
+        for value in range(12 if soft else 4, 22):
+            row = "".join(f"{table.best_action(value, soft, upcard)[0].upper():>4}" for upcard in upcards)
+            print(f"{value:<6}{row}")
+        print()
+
+    finals = list(table.dealer_distribution(upcards[0]))
+    print("Dealer " + "".join(f"{str(final):>7}" for final in finals))
+    for upcard in upcards:
+        chances = table.dealer_distribution(upcard).values()
+        print(f"{'A' if upcard == 11 else upcard:<7}" + "".join(f"{chance * 100:>6.1f}%" for chance in chances))
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv and os.path.exists(CACHE_PATH):
+        os.remove(CACHE_PATH)
+
+    start = time.perf_counter()
+    loaded = StrategyTable.load()
+    load_time = time.perf_counter() - start
+
+    if loaded is None:
+        start = time.perf_counter()
+        table = get_table()
+        print(f"Computed and saved the table in {(time.perf_counter() - start) * 1000:.1f} ms")
+    else:
+        table = loaded
+        print(f"Loaded the cached table in {load_time * 1000:.2f} ms")
+    print()
+    print_chart(table)
@@ -0,0 +1,75 @@
+import asyncio
+
+from AsyncServer import ServerStats, serve, stop_server
+from CardRNG import table_seed
+from Framing import HEADER, decode_message, encode_frame, encode_message
+from SmartServer import BlackjackTable
+
+HOST = "127.0.0.1"
+
+async def read_message(reader):
+    length, = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return decode_message(await reader.readexactly(length))
+
+async def exchange(payloads):
+    """Send raw payloads to an in-process server; returns the replies to each and the server's stats"""
+    stats = ServerStats()
+    server = await serve(HOST, 0, stats)
+    reader, writer = await asyncio.open_connection(HOST, server.sockets[0].getsockname()[1])
+    await read_message(reader)  # Welcome
+    replies = []
+    for payload in payloads:
+        writer.write(encode_frame(payload))
+        replies.append(await read_message(reader))
+    writer.close()
+    await stop_server(server)
+    return replies, stats
+
+def test_text_that_is_not_utf8_is_a_format_error():
+    replies, stats = asyncio.run(exchange([b'{"type": "bet", "amount": "\xff"}',
+                                           encode_message({"type": "bet", "amount": 10, "player": 1})[HEADER.size:]]))
+    assert replies[0] == {"type": "error", "message": "Invalid message format"}
+    assert replies[1]["type"] == "game_state"  # The connection carries on
+    assert stats.errors == {"decode": 1}
+
+def moves(table, bet, stand_on):
+    """The messages of rounds played at a table, each chosen from the table's state at the time"""
+    while not table.is_finished():
+        for player in (1, 2):
+            yield {"type": "bet", "amount": bet, "player": player}
+            while table.in_turn():
+                yield {"action": "hit" if table.player_hand.value < stand_on else "stand", "player": player}
+
+async def two_tables(seed, steps):
+    """Play two tables at once on one server, a message to each in turn, checking each against its own copy"""
+    stats = ServerStats()
+    server = await serve(HOST, 0, stats, seed=seed)
+    port = server.sockets[0].getsockname()[1]
+    clients = []
+    for bet, stand_on in ((100, 15), (250, 17)):
+        reader, writer = await asyncio.open_connection(HOST, port)
+        welcome = await read_message(reader)
+        # What the table would do on its own: same id, same cards
+        alone = BlackjackTable(welcome["table"], seed=table_seed(seed, welcome["table"]))
+        clients.append((reader, writer, alone, moves(alone, bet, stand_on)))
+
+    for _ in range(steps):
+        for reader, writer, alone, plan in clients:
+            message = next(plan, None)
+            if message is None:
+                continue
+            expected = [decode_message(encode_message(reply)[HEADER.size:]) for reply in alone.handle_message(message)]
+            writer.write(encode_message(message))
+            assert [await read_message(reader) for _ in expected] == expected
+
+    for _, writer, _, _ in clients:
+        writer.close()
+    await stop_server(server)
+    return [alone for _, _, alone, _ in clients], stats
+
+def test_two_tables_on_one_loop_keep_their_own_state():
+    (first, second), stats = asyncio.run(two_tables(seed=21, steps=150))
+    assert first.table_id != second.table_id and stats.tables_opened == 2
+    # Different bets and play, so any shared money or cards would have shown in the replies
+    assert (first.player1_money, first.player2_money) != (second.player1_money, second.player2_money)
+    assert stats.active_tables == 0
@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import os
+
+from BankrollLog import BankrollLog, open_log, play_random_rounds, recover
+from CardRNG import CardStream, table_seed
+from SmartServer import CARDS, INVALID_BET, STARTING_MONEY, BlackjackTable
+
+def live_table(path, seed=7):
+    log = BankrollLog(str(path))
+    table = BlackjackTable(1, log=log, seed=seed)
+    log.open_table(table)
+    return log, table
+
+def test_player2_bet_before_dealer_hand_is_rejected_without_dealing(tmp_path):
+    log, table = live_table(tmp_path / "bankroll.log")
+    assert table.handle_message({"type": "bet", "amount": 10, "player": 2}) == [INVALID_BET]
+    assert table.dealt == []
+    log.close()
+
+def test_recovery_after_rejected_bet_rebuilds_the_same_hands(tmp_path):
+    path = tmp_path / "bankroll.log"
+    log, table = live_table(path)
+    table.handle_message({"type": "bet", "amount": 10, "player": 2})
+    table.handle_message({"type": "bet", "amount": 10, "player": 1})
+    log.close()
+
+    recovered = recover(str(path)).tables[1]
+    assert recovered.player_hand.to_list() == table.player_hand.to_list()
+    assert recovered.dealer_hand.to_list() == table.dealer_hand.to_list()
+
+def test_failed_message_drops_its_unlogged_cards(tmp_path):
+    log, table = live_table(tmp_path / "bankroll.log")
+    table.deal = iter([5]).__next__  # Deals one card, then fails on the second
+    try:
+        table.handle_message({"type": "bet", "amount": 10, "player": 1})
+    except StopIteration:
+        pass
+    assert table.dealt == []
+    log.close()
+
+def test_seeded_recovery_deals_from_the_tables_own_stream(tmp_path):
+    path = tmp_path / "bankroll.log"
+    log, table = live_table(path)
+    table.handle_message({"type": "bet", "amount": 10, "player": 1})
+    log.close()
+
+    expected = CardStream(CARDS, table_seed(42, 1))
+    expected = [expected.deal() for _ in range(20)]
+    for _ in range(2):  # Every restart with the same seed deals the same cards
+        recovered = recover(str(path), seed=42).tables[1]
+        assert recovered.cards.seed == table_seed(42, 1)
+        assert [recovered.deal() for _ in range(20)] == expected
+
+def test_seeded_recovery_shuffles_the_same_shoe(tmp_path):
+    path = str(tmp_path / "bankroll.log")
+    log, table = live_table(path)
+    table.handle_message({"type": "bet", "amount": 10, "player": 1})
+    log.close()
+
+    dealt = []
+    for _ in range(2):
+        log, recovery = open_log(path, decks=2, seed=42)
+        shoe = recovery.tables[1].deal
+        dealt.append([shoe() for _ in range(20)])
+        log.close()
+    assert dealt[0] == dealt[1]
+
+def test_action_for_the_other_seat_plays_the_seat_in_turn(tmp_path):
+    path = tmp_path / "bankroll.log"
+    log, table = live_table(path)
+    table.handle_message({"type": "bet", "amount": 10, "player": 1})
+    table.deal = itertools.repeat(10).__next__  # Tens until the hand in turn busts
+    reply, = table.handle_message({"action": "hit", "player": 2})
+    while reply["type"] == "hit_result":
+        reply, = table.handle_message({"action": "hit", "player": 2})
+    assert reply["result"] == "bust" and reply["money"] == STARTING_MONEY - 10
+    assert (table.player1_money, table.player2_money) == (STARTING_MONEY - 10, STARTING_MONEY)
+    log.close()
+
+    # The log holds player 1's bust too, so recovery charges the same seat
+    recovery = recover(str(path))
+    recovered = recovery.tables[1]
+    assert recovery.mismatches == 0
+    assert (recovered.player1_money, recovered.player2_money) == (STARTING_MONEY - 10, STARTING_MONEY)
+
+def state(table):
+    hand = table.player_hand.to_list() if table.in_turn() else None
+    return table.player1_money, table.player2_money, table.player_num, hand
+
+def test_recovery_rebuilds_every_open_table(tmp_path):
+    path = str(tmp_path / "bankroll.log")
+    log = BankrollLog(path)
+    live, in_play = play_random_rounds(log, 20, 30)
+    closed = live.pop()
+    log.close_table(closed)
+    log.close()
+
+    recovery = recover(path)
+    assert recovery.mismatches == 0 and recovery.torn_bytes == 0
+    assert sorted(recovery.tables) == sorted(table.table_id for table in live)
+    for table in live:
+        assert state(recovery.tables[table.table_id]) == state(table)
+    assert recovery.tables[in_play.table_id].in_turn()
+
+def test_torn_or_corrupt_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "bankroll.log")
+    log, table = live_table(path)
+    table.handle_message({"type": "bet", "amount": 10, "player": 1})
+    before = state(table)
+    log.close()
+    size = os.path.getsize(path)
+
+    log = BankrollLog(path)
+    table.log = log
+    table.handle_message({"action": "stand", "player": 1})
+    log.close()
+
+    # A crash mid-write leaves part of the last record
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+    recovery = recover(path)
+    assert recovery.torn_bytes == os.path.getsize(path) - size
+    assert state(recovery.tables[1]) == before
+
+    # So does a record whose bytes changed on disk
+    with open(path, "r+b") as f:
+        f.truncate(size)
+        f.seek(size - 1)
+        last = f.read(1)
+        f.seek(size - 1)
+        f.write(bytes([last[0] ^ 1]))
+    recovery = recover(path)
+    assert recovery.torn_bytes > 0
+    assert not recovery.tables[1].in_turn()  # Back to before the bet
+
+def test_open_log_compacts_to_the_current_rounds(tmp_path):
+    path = str(tmp_path / "bankroll.log")
+    log = BankrollLog(path)
+    live, _ = play_random_rounds(log, 10, 50)
+    log.close()
+    size = os.path.getsize(path)
+
+    log, recovery = open_log(path)
+    log.close()
+    assert os.path.getsize(path) < size / 10
+    compacted = recover(path)
+    for table in live:
+        assert state(compacted.tables[table.table_id]) == state(table)
+
+def test_waiters_return_once_their_record_is_durable(tmp_path):
+    log = BankrollLog(str(tmp_path / "bankroll.log"), group_delay=0.01)
+    tables = [BlackjackTable(table_id, log=log) for table_id in range(1, 51)]
+
+    async def bet(table):
+        log.open_table(table)
+        table.handle_message({"type": "bet", "amount": 10, "player": 1})
+        await log.wait_async(table.logged)
+        assert log.durable >= table.logged
+
+    async def main():
+        await asyncio.gather(*(bet(table) for table in tables))
+    asyncio.run(main())
+    assert log.fsyncs < len(tables)  # Waiters at the same time shared fsyncs
+    log.close()
@@ -0,0 +1,67 @@
+from BatchProtocol import (BATCH_SIZE_ERROR, INVALID_IN_BATCH, MAX_BATCH, NO_HAND_IN_PLAY, UNKNOWN_STRATEGY,
+                           batch_message, handle_batch, play_hand, play_message, round_messages)
+from DeltaProtocol import DeltaEncoder
+from SmartServer import BlackjackTable
+
+def bet(player, amount=50):
+    return {"type": "bet", "amount": amount, "player": player}
+
+def test_batch_stops_at_the_first_error():
+    table = BlackjackTable(1, seed=3)
+    replies = handle_batch(table, batch_message([bet(1), {"action": "dance", "player": 1}, play_message(1)]))
+    assert replies["type"] == "batch"
+    assert [reply["type"] for reply in replies["messages"]] == ["game_state", "error"]
+    # The play after the error never ran, so player 1 is still in turn with two cards
+    assert table.in_turn() and table.player_num == 1 and len(table.player_hand.to_list()) == 2
+
+def test_invalid_and_nested_messages_are_errors():
+    table = BlackjackTable(1, seed=3)
+    for message in ("bet", batch_message([bet(1)])):
+        assert handle_batch(table, batch_message([message, bet(1)]))["messages"] == [INVALID_IN_BATCH]
+    assert not table.in_turn()
+
+def test_batch_size_limits():
+    table = BlackjackTable(1, seed=3)
+    assert handle_batch(table, batch_message([])) == BATCH_SIZE_ERROR
+    assert handle_batch(table, {"type": "batch"}) == BATCH_SIZE_ERROR
+    assert handle_batch(table, batch_message([bet(1)] * (MAX_BATCH + 1))) == BATCH_SIZE_ERROR
+    assert not table.in_turn()  # A rejected batch applies nothing
+
+    # A full-sized batch is accepted, and stops at its first error (a bet while in turn)
+    replies = handle_batch(table, batch_message([bet(1)] * MAX_BATCH))["messages"]
+    assert [reply["type"] for reply in replies] == ["game_state", "error"]
+
+def test_play_checks_strategy_and_player():
+    table = BlackjackTable(1, seed=3)
+    assert play_hand(table, play_message(1)) == [NO_HAND_IN_PLAY]
+    table.handle_message(bet(1))
+    assert play_hand(table, play_message(1, "martingale")) == [UNKNOWN_STRATEGY]
+    assert play_hand(table, play_message(1, "threshold", "17")) == [UNKNOWN_STRATEGY]
+    assert play_hand(table, play_message(2)) == [NO_HAND_IN_PLAY]
+    assert table.in_turn() and table.player_num == 1
+
+def test_replies_keep_their_own_copy_of_the_hand():
+    table = BlackjackTable(1, seed=3)
+    # Hitting to 21 takes several cards, so later replies would change earlier ones
+    replies = handle_batch(table, batch_message([bet(1), play_message(1, "threshold", 21)]))["messages"]
+    hands = [reply["player_hand"] for reply in replies if "player_hand" in reply]
+    assert len(hands) >= 3
+    assert [len(hand) for hand in hands] == list(range(2, len(hands) + 2))
+    assert len({id(hand) for hand in hands}) == len(hands)
+
+def test_whole_rounds_play_both_seats():
+    table = BlackjackTable(1, seed=5)
+    replies = handle_batch(table, batch_message(round_messages((50, 70), "threshold")))["messages"]
+    assert [reply["type"] for reply in replies] == ["game_state", "result", "game_state", "result"]
+    final = replies[-1]
+    assert (final["player1_money"], final["player2_money"]) == (table.player1_money, table.player2_money)
+    assert not table.in_turn()
+
+def test_deltas_are_numbered_across_a_batch_and_the_next():
+    table = BlackjackTable(1, seed=5)
+    encoder = DeltaEncoder(table)
+    seqs = []
+    for _ in range(3):
+        replies = handle_batch(table, batch_message(round_messages((50, 70), "basic")), encoder)["messages"]
+        seqs += [reply["seq"] for reply in replies]
+    assert seqs == list(range(1, len(seqs) + 1))
@@ -0,0 +1,53 @@
+import pytest
+
+from BinaryProtocol import (JSON_START, ProtocolError, decode_message, encode_message, encode_payload, pack,
+                            requested_encoding)
+from Framing import HEADER
+from SmartServer import INVALID_BET, BlackjackTable
+
+def table_messages(seed, rounds=30):
+    """Every message a seeded table exchanges over some rounds, client and server side"""
+    table = BlackjackTable(1, seed=seed)
+    messages = []
+    for _ in range(rounds):
+        for player in (1, 2):
+            bet = {"type": "bet", "amount": 10, "player": player}
+            messages.append(bet)
+            messages.extend(table.handle_message(bet))
+            while table.in_turn():
+                action = {"action": "hit" if table.player_hand.value < 15 else "stand", "player": player}
+                messages.append(action)
+                messages.extend(table.handle_message(action))
+    return messages
+
+def test_table_messages_round_trip_in_binary():
+    messages = table_messages(seed=3)
+    for message in messages:
+        payload = encode_payload(message)
+        assert payload[0] != JSON_START, message  # Every game message has a binary form
+        assert decode_message(payload) == message
+    kinds = {message.get("type", message.get("action")) for message in messages}
+    assert {"bet", "hit", "stand", "game_state", "hit_result", "player1_done", "result"} <= kinds
+
+def test_binary_is_smaller_than_json():
+    from Framing import encode_message as json_frame
+    messages = table_messages(seed=5)
+    assert sum(map(len, map(encode_message, messages))) < sum(map(len, map(json_frame, messages))) / 2
+
+def test_messages_without_a_binary_form_fall_back_to_json():
+    for message in (INVALID_BET, {"type": "bet", "amount": 10, "player": 1, "note": "extra key"},
+                    {"type": "encoding", "encoding": "binary"}):
+        payload = encode_message(message)[HEADER.size:]
+        assert payload[0] == JSON_START
+        assert decode_message(payload) == message
+    assert pack({"action": "double", "player": 1}) is None
+
+def test_bad_payloads_raise_protocol_error():
+    payload = encode_payload({"type": "bet", "amount": 10, "player": 1})
+    for bad in (b"", payload[:-1], bytes([200])):
+        with pytest.raises(ProtocolError):
+            decode_message(bad)
+
+def test_encoding_request():
+    assert requested_encoding({"type": "encoding", "encoding": "binary"}) == "binary"
+    assert requested_encoding({"type": "bet", "amount": 10, "player": 1}) is None
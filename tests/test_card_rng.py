@@ -0,0 +1,51 @@
+from collections import Counter
+
+from CardRNG import CardStream, byte_block, new_rng, table_seed
+from SmartServer import CARDS, BlackjackTable, new_shoe
+
+def deal(stream, count=2000):
+    return [stream.deal() for _ in range(count)]
+
+def test_a_seed_deals_the_same_cards_at_any_block_size():
+    expected = deal(CardStream(CARDS, 2024))
+    for block_size in (4, 52, 100, 4096):
+        assert deal(CardStream(CARDS, 2024, block_size)) == expected
+
+def test_seeds_give_different_cards():
+    assert deal(CardStream(CARDS, 1)) != deal(CardStream(CARDS, 2))
+    assert CardStream(CARDS).seed != CardStream(CARDS).seed  # Unseeded streams get fresh seeds
+
+def test_every_card_comes_up_as_often_as_it_should():
+    draws = 130_000
+    counts = Counter(deal(CardStream(CARDS, 5), draws))
+    assert set(counts) == set(CARDS)
+    for card in set(CARDS):
+        expected = draws * CARDS.count(card) / len(CARDS)
+        assert abs(counts[card] - expected) < 5 * expected ** 0.5
+
+def test_table_seed_depends_only_on_the_server_seed_and_table():
+    assert table_seed(7, 3) == table_seed(7, 3)
+    assert len({table_seed(7, table_id) for table_id in range(1000)}) == 1000
+    assert table_seed(7, 3) != table_seed(8, 3)
+    assert table_seed(None, 3) != table_seed(None, 3)
+
+def test_seeded_tables_play_the_same_rounds():
+    def rounds(table):
+        replies = []
+        for _ in range(20):
+            for player in (1, 2):
+                replies += table.handle_message({"type": "bet", "amount": 10, "player": player})
+                while table.in_turn():
+                    action = "hit" if table.player_hand.value < 16 else "stand"
+                    replies += table.handle_message({"action": action, "player": player})
+        return replies
+
+    seed = table_seed(11, 4)
+    assert rounds(BlackjackTable(4, seed=seed)) == rounds(BlackjackTable(4, seed=seed))
+    assert (rounds(BlackjackTable(4, shoe=new_shoe(6, seed), seed=seed))
+            == rounds(BlackjackTable(4, shoe=new_shoe(6, seed), seed=seed)))
+
+def test_byte_block_is_seeded_and_covers_every_byte():
+    first, second = byte_block(new_rng(3), 100_003), byte_block(new_rng(3), 100_003)
+    assert len(first) == 100_003 and (first == second).all()
+    assert len(set(first.tolist())) == 256
@@ -0,0 +1,62 @@
+from BinaryProtocol import decode_message, encode_payload
+from BlackjackClient import TableState
+from DeltaProtocol import DELTA_TYPES, DeltaEncoder, snapshot_message
+from SmartServer import BlackjackTable
+
+def play(table, rounds, stand_on=15):
+    """The replies of some rounds where each player hits below stand_on"""
+    for _ in range(rounds):
+        for player in (1, 2):
+            if table.is_finished():
+                return
+            yield from table.handle_message({"type": "bet", "amount": 50, "player": player})
+            while table.in_turn():
+                action = "hit" if table.player_hand.value < stand_on else "stand"
+                yield from table.handle_message({"action": action, "player": player})
+
+def wire(message):
+    """A message as the client receives it; replies share lists the table goes on changing"""
+    return decode_message(encode_payload(message))
+
+def following(table):
+    state = TableState()
+    state.apply(table.welcome_message())
+    return state, DeltaEncoder(table)
+
+def test_deltas_expand_to_the_full_replies():
+    table = BlackjackTable(1, seed=4)
+    state, encoder = following(table)
+    seq = 0
+    for reply in play(table, 40):
+        delta = encoder.encode(reply)
+        assert delta["type"] in DELTA_TYPES
+        assert delta["seq"] == seq + 1
+        seq = delta["seq"]
+        assert state.update(wire(delta)) == reply
+    assert (state.player1_money, state.player2_money) == (table.player1_money, table.player2_money)
+
+def test_missed_delta_is_detected_and_a_snapshot_resyncs():
+    table = BlackjackTable(1, seed=8)
+    state, encoder = following(table)
+    replies = play(table, 40)
+    for reply in replies:
+        state.update(wire(encoder.encode(reply)))
+        if state.seq == 5:
+            break
+    encoder.encode(next(replies))  # Lost on the way
+    assert state.update(wire(encoder.encode(next(replies)))) is None
+
+    state.update(wire(snapshot_message(table, encoder.seq)))
+    assert state.seq == encoder.seq
+    for reply in replies:
+        assert state.update(wire(encoder.encode(reply))) == reply
+    assert (state.player1_money, state.player2_money) == (table.player1_money, table.player2_money)
+
+def test_deltas_are_smaller():
+    table = BlackjackTable(1, seed=6)
+    encoder = DeltaEncoder(table)
+    full = delta = 0
+    for reply in play(table, 40):
+        full += len(encode_payload(reply))
+        delta += len(encode_payload(encoder.encode(reply)))
+    assert delta < full
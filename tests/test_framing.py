@@ -0,0 +1,46 @@
+import socket
+
+import pytest
+
+from Framing import HEADER, FrameDecoder, FrameError, FrameSocket, encode_frame, encode_message
+from Serializer import StaticMessage
+
+PAYLOADS = [b"", b"{}", b'{"type":"bet","amount":10,"player":1}', bytes(range(256)) * 40]
+
+def test_frames_come_back_whole_however_the_stream_is_split():
+    stream = b"".join(encode_frame(payload) for payload in PAYLOADS)
+    for chunk in (1, 3, 4, 5, 1000, len(stream)):
+        decoder = FrameDecoder()
+        frames = []
+        for start in range(0, len(stream), chunk):
+            frames.extend(decoder.feed(stream[start:start + chunk]))
+        assert frames == PAYLOADS, chunk
+        assert decoder.pending() == 0
+
+def test_partial_frame_stays_pending():
+    frame = encode_frame(b"x" * 10)
+    decoder = FrameDecoder()
+    assert decoder.feed(frame[:7]) == []
+    assert decoder.pending() == 7
+    assert decoder.feed(frame[7:] + frame[:2]) == [b"x" * 10]
+    assert decoder.pending() == 2
+
+def test_oversized_frame_is_refused_before_it_is_buffered():
+    decoder = FrameDecoder(max_frame_size=100)
+    with pytest.raises(FrameError):
+        decoder.feed(HEADER.pack(101))
+
+def test_static_message_frames_like_its_dict():
+    message = StaticMessage(type="error", message="Invalid bet")
+    assert encode_message(message) == encode_message(dict(message))
+
+def test_frame_socket_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        sender, receiver = FrameSocket(left), FrameSocket(right)
+        messages = [{"type": "hit", "player": 1}, {"type": "stand", "player": 2}]
+        for message in messages:
+            sender.send_message(message)
+        assert [receiver.receive_message() for _ in messages] == messages
+        left.close()
+        assert receiver.receive_message() is None  # Peer gone
@@ -0,0 +1,49 @@
+import itertools
+
+import pytest
+
+from Hand import Hand
+from SmartServer import CARDS, calculate_hand_value
+
+@pytest.mark.parametrize("cards, value, soft", [
+    ([11, 6], 17, True),
+    ([11, 11], 12, True),
+    ([11, 11, 11], 13, True),
+    ([11, 11, 11, 11], 14, True),
+    ([11, 11, 9], 21, True),
+    ([11, 11, 10], 12, False),
+    ([11, 6, 10], 17, False),
+    ([11, 6, 10, 11], 18, False),
+    ([10, 6], 16, False),
+    ([11, 10], 21, True),
+])
+def test_soft_and_hard_totals(cards, value, soft):
+    hand = Hand(cards)
+    assert (hand.value, hand.soft) == (value, soft)
+    assert not hand.is_bust()
+
+def test_bust_detection():
+    hand = Hand([10, 6])
+    hand.add(5)
+    assert hand.value == 21 and not hand.is_bust()
+    hand = Hand([10, 6, 11, 11])
+    assert hand.value == 18 and not hand.is_bust()
+    hand.add(4)
+    assert hand.value == 22 and hand.is_bust() and not hand.soft
+    assert Hand([10, 10, 2]).is_bust()
+
+def test_matches_calculate_hand_value_on_every_short_hand():
+    ranks = sorted(set(CARDS))
+    for size in range(1, 5):
+        for cards in itertools.product(ranks, repeat=size):
+            hand = Hand()
+            for i, card in enumerate(cards, 1):
+                hand.add(card)
+                assert hand.value == calculate_hand_value(list(cards[:i])), cards[:i]
+                assert hand.is_bust() == (calculate_hand_value(list(cards[:i])) > 21)
+
+def test_wire_list_and_sequence_access():
+    hand = Hand([11, 9])
+    assert hand.to_list() == [11, 9] and hand.to_list() is hand.cards
+    assert len(hand) == 2 and hand[0] == 11 and list(hand) == [11, 9]
+    assert repr(hand) == "Hand([11, 9])"
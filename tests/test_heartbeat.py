@@ -0,0 +1,107 @@
+from Heartbeat import (DEAD, IDLE, IDLE_CLOSE, IDLE_TIMEOUT, PING, PING_INTERVAL, PONG_TIMEOUT, READ_TIMEOUT,
+                       SEND_TIMEOUT, SLOW, STALLED, Heartbeat, Reaper)
+from Metrics import Metrics
+
+class FakeTransport:
+    def __init__(self, buffered=0):
+        self.buffered = buffered
+        self.closed = self.aborted = False
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.aborted = True
+
+class FakeWriter:
+    def __init__(self, buffered=0):
+        self.transport = FakeTransport(buffered)
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+class FakeConnection:
+    """What a Reaper needs of an AsyncServer connection"""
+
+    def __init__(self, heartbeat, buffered=0):
+        self.heartbeat = heartbeat
+        self.writer = FakeWriter(buffered)
+
+    def encode(self, message):
+        return repr(message).encode()
+
+def test_quiet_connection_is_pinged_then_dead():
+    heartbeat = Heartbeat(100.0)
+    assert heartbeat.due(100.0 + PING_INTERVAL) is None
+    assert heartbeat.due(100.0 + PING_INTERVAL + 1) is PING
+
+    heartbeat.ping_sent = sent = 100.0 + PING_INTERVAL + 1
+    assert heartbeat.due(sent + PONG_TIMEOUT) is None
+    assert heartbeat.due(sent + PONG_TIMEOUT + 1) == DEAD
+
+    # Any bytes answer the ping
+    heartbeat.received(sent + 1, partial=False)
+    assert heartbeat.ping_sent is None
+    assert heartbeat.due(sent + PONG_TIMEOUT + 1) is None
+
+def test_unfinished_frame_is_stalled():
+    heartbeat = Heartbeat(0.0)
+    heartbeat.received(1.0, partial=True)
+    heartbeat.received(5.0, partial=True)  # More of the same frame doesn't restart the clock
+    assert heartbeat.partial_since == 1.0
+    assert heartbeat.due(1.0 + READ_TIMEOUT) is None
+    assert heartbeat.due(1.0 + READ_TIMEOUT + 1) == STALLED
+    heartbeat.received(6.0, partial=False)
+    assert heartbeat.due(1.0 + READ_TIMEOUT + 1) is None
+
+def test_player_without_moves_is_idle_unless_spectating():
+    heartbeat = Heartbeat(0.0)
+    # Pings keep the connection heard from, but only game messages count as play
+    heartbeat.received(IDLE_TIMEOUT, partial=False)
+    assert heartbeat.due(IDLE_TIMEOUT + 1) == IDLE
+    heartbeat.idle_allowed = True
+    assert heartbeat.due(IDLE_TIMEOUT + 1) is None
+
+def test_blocked_writes_are_slow_before_anything_else():
+    heartbeat = Heartbeat(0.0)
+    heartbeat.blocked_since = 10.0
+    heartbeat.received(11.0, partial=True)
+    assert heartbeat.due(10.0 + SEND_TIMEOUT) == STALLED  # Only the frame is overdue so far
+    assert heartbeat.due(10.0 + SEND_TIMEOUT + 1) == SLOW
+
+def test_sweep_pings_and_reaps():
+    metrics = Metrics()
+    reaper = Reaper(metrics)
+    now = 1000.0
+    fresh = FakeConnection(Heartbeat(now))
+    quiet = FakeConnection(Heartbeat(now - PING_INTERVAL - 1))
+    dead = FakeConnection(Heartbeat(now - PING_INTERVAL - 1))
+    dead.heartbeat.ping_sent = now - PONG_TIMEOUT - 1
+    idle = FakeConnection(Heartbeat(now - IDLE_TIMEOUT - 1))
+    idle.heartbeat.heard = now
+    reaper.connections.update((fresh, quiet, dead, idle))
+
+    reaper.sweep(now)
+
+    assert fresh.writer.written == [] and fresh in reaper.connections
+    assert quiet.writer.written == [quiet.encode(PING)] and quiet.heartbeat.ping_sent == now
+    assert quiet in reaper.connections
+    assert dead.writer.transport.aborted and dead not in reaper.connections
+    # An idle client still reading is told why and closed cleanly
+    assert idle.writer.written == [idle.encode(IDLE_CLOSE)] and idle.writer.transport.closed
+    assert idle not in reaper.connections
+    assert metrics.pings_sent == 1 and metrics.bytes_sent == len(quiet.encode(PING))
+    assert metrics.reaped == {DEAD: 1, IDLE: 1}
+    assert metrics.latency["reap_sweep"].count == 1
+
+def test_idle_client_with_unread_replies_is_aborted():
+    reaper = Reaper()
+    connection = FakeConnection(Heartbeat(0.0), buffered=100)
+    connection.heartbeat.heard = IDLE_TIMEOUT
+    reaper.connections.add(connection)
+    reaper.sweep(IDLE_TIMEOUT + 1)
+    assert connection.writer.written == [] and connection.writer.transport.aborted
@@ -0,0 +1,78 @@
+import random
+
+from Metrics import (BUCKETS, EXPORT_BOUNDS, LINEAR_LIMIT, SUB_BITS, LatencyHistogram, Metrics, bucket_bounds,
+                     bucket_index, message_type)
+
+def test_bucket_bounds_are_contiguous_and_increasing():
+    low, high = bucket_bounds(0)
+    assert (low, high) == (0, 1)
+    for index in range(1, BUCKETS):
+        next_low, next_high = bucket_bounds(index)
+        assert next_low == high and next_high > next_low
+        high = next_high
+
+def test_values_land_in_their_bucket():
+    values = list(range(4 * LINEAR_LIMIT)) + [2 ** bits + offset for bits in range(6, 40) for offset in (-1, 0, 1)]
+    rng = random.Random(5)
+    values += [rng.randrange(1, 10 ** 11) for _ in range(2000)]
+    for value in values:
+        low, high = bucket_bounds(bucket_index(value))
+        assert low <= value < high
+        if value >= LINEAR_LIMIT:
+            assert (high - low) / low <= 1 / 2 ** SUB_BITS
+
+def test_cumulative_counts_each_bucket_below_its_bound():
+    histogram = LatencyHistogram()
+    values = [10, 1000, 49_000, 50_000, 99_000, 2_000_000, 10 ** 10]
+    for value in values:
+        histogram.record(value)
+    bounds_ns = [int(bound * 1e9) for bound in EXPORT_BOUNDS]
+    cumulative = histogram.cumulative(bounds_ns)
+    assert cumulative == sorted(cumulative)
+    for bound, count in zip(bounds_ns, cumulative):
+        # Buckets straddling a bound count at the next one, never early
+        assert count <= sum(value <= bound for value in values)
+        assert count == sum(bucket_bounds(bucket_index(value))[1] <= bound + 1 for value in values)
+    assert cumulative[-1] == len(values) - 1  # 10 s is past the last bound
+
+def test_quantiles_and_merge():
+    first, second = LatencyHistogram(), LatencyHistogram()
+    for value in range(1, 1001):
+        (first if value % 2 else second).record(value * 1000)
+    first.merge(second)
+    assert first.count == 1000 and first.maximum == 1_000_000
+    assert first.total == sum(value * 1000 for value in range(1, 1001))
+    assert abs(first.quantile(0.5) - 500_000) / 500_000 <= 1 / 2 ** SUB_BITS
+    assert first.quantile(1.0) == 1_000_000
+
+def test_message_types():
+    assert message_type({"action": "hit"}) == "hit"
+    assert message_type({"type": "bet"}, [{"type": "error"}]) == "error"
+    assert message_type({"type": "teleport"}) == "other"
+
+def test_render_is_prometheus_text():
+    metrics = Metrics()
+    metrics.observe("bet", 30_000)
+    metrics.observe("bet", 300_000)
+    metrics.error("decode")
+    metrics.reap("dead")
+    metrics.bytes_sent = 42
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE blackjack_message_latency_seconds histogram" in lines
+    assert 'blackjack_messages_total{type="bet"} 2' in lines
+    assert 'blackjack_errors_total{kind="decode"} 1' in lines
+    assert 'blackjack_connections_reaped_total{reason="dead"} 1' in lines
+    assert "blackjack_bytes_sent_total 42" in lines
+    assert 'blackjack_message_latency_seconds_bucket{type="bet",le="5e-05"} 1' in lines
+    assert 'blackjack_message_latency_seconds_bucket{type="bet",le="0.0005"} 2' in lines
+    assert 'blackjack_message_latency_seconds_bucket{type="bet",le="+Inf"} 2' in lines
+    assert 'blackjack_message_latency_seconds_count{type="bet"} 2' in lines
+    assert 'blackjack_message_latency_seconds_sum{type="bet"} 0.000330000' in lines
+
+    # Every sample follows its HELP and TYPE lines and has a numeric value
+    for line in lines:
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            assert name.startswith("blackjack_")
+            float(value)
@@ -0,0 +1,86 @@
+import asyncio
+
+import numpy as np
+
+import RoundHistory
+from AsyncServer import serve, stop_server
+from Hand import Hand
+from RoundHistory import FLUSH_SECONDS, HistoryWriter, load, read_meta, summarize
+
+def record(writer, table_id, player, result, change, bet=10):
+    dealer = None if result == "bust" else Hand([10, 7])
+    writer.record_hand(table_id, player, Hand([10, 9]), dealer, result, bet, change)
+
+def test_rows_are_hidden_until_flushed_then_read_back(tmp_path):
+    writer = HistoryWriter(str(tmp_path))
+    record(writer, 3, 1, "win", 10)
+    record(writer, 3, 2, "bust", -10)
+    assert read_meta(str(tmp_path))["count"] == 0  # Staged, not published
+    assert len(load(str(tmp_path))["table"]) == 0
+
+    writer.flush()
+    columns = load(str(tmp_path))
+    assert columns["table"].tolist() == [3, 3]
+    assert columns["player"].tolist() == [1, 2]
+    assert columns["change"].tolist() == [10, -10]
+    assert columns["player_cards"][0, :3].tolist() == [10, 9, 0]
+    assert columns["dealer_value"].tolist() == [17, 0]  # No dealer hand against a bust
+    writer.close()
+
+def test_staged_rows_flush_by_count_and_by_age(tmp_path, monkeypatch):
+    monkeypatch.setattr(RoundHistory, "FLUSH_EVERY", 5)
+    writer = HistoryWriter(str(tmp_path))
+    for _ in range(5):
+        record(writer, 1, 1, "win", 10)
+    assert read_meta(str(tmp_path))["count"] == 5
+
+    record(writer, 1, 1, "lose", -10)
+    writer.flush_due(writer.staged_since + FLUSH_SECONDS / 2)
+    assert read_meta(str(tmp_path))["count"] == 5
+    writer.flush_due(writer.staged_since + FLUSH_SECONDS)
+    assert read_meta(str(tmp_path))["count"] == 6
+    writer.close()
+
+def test_files_grow_by_doubling_and_reopen_where_they_left_off(tmp_path, monkeypatch):
+    monkeypatch.setattr(RoundHistory, "INITIAL_CAPACITY", 4)
+    writer = HistoryWriter(str(tmp_path))
+    writer.append_batch({"table": np.arange(1, 11, dtype=np.uint32), "bet": np.full(10, 5, dtype=np.int32)})
+    assert writer.capacity == 16
+    writer.close()
+
+    writer = HistoryWriter(str(tmp_path))
+    writer.append_batch({"table": np.array([11], dtype=np.uint32)})
+    writer.close()
+    assert load(str(tmp_path))["table"].tolist() == list(range(1, 12))
+
+def test_summaries_group_and_filter(tmp_path):
+    writer = HistoryWriter(str(tmp_path))
+    record(writer, 1, 1, "win", 10)
+    record(writer, 1, 2, "lose", -10)
+    record(writer, 2, 1, "bust", -10)
+    record(writer, 2, 1, "tie", 0)
+    writer.close()
+    columns = load(str(tmp_path))
+
+    by_player = summarize(columns, by="player")
+    assert [(row["group"], row["hands"], row["net"]) for row in by_player] == [("player 1", 3, 0),
+                                                                               ("player 2", 1, -10)]
+    assert by_player[0]["win"] == by_player[0]["bust"] == by_player[0]["tie"] == 1 / 3
+
+    table2 = summarize(columns, by="player", table=2)
+    assert [(row["group"], row["hands"]) for row in table2] == [("player 1", 2)]
+    assert summarize(columns, by="table", player=2) == [summarize(columns, by="table", table=1, player=2)[0]]
+    assert summarize(columns, table=9) == []
+
+def test_async_server_flushes_a_quiet_tables_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(RoundHistory, "FLUSH_SECONDS", 0.1)
+    writer = HistoryWriter(str(tmp_path))
+
+    async def main():
+        server = await serve("127.0.0.1", 0, history=writer)
+        record(writer, 1, 1, "win", 10)  # Then nothing more arrives
+        await asyncio.sleep(0.5)
+        await stop_server(server)
+    asyncio.run(main())
+    assert read_meta(str(tmp_path))["count"] == 1
+    writer.close()
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import BinaryProtocol
+import Framing
+import Serializer
+from Serializer import SERIALIZERS, StaticMessage, error_message, json_dumps
+
+MESSAGES = [
+    {"type": "game_state", "player_hand": [10, 6], "player_value": 16, "dealer_visible": [9], "bet": 100},
+    {"type": "result", "player1_hand": [10, 9], "player1_value": 19, "dealer_hand": [9, 8], "dealer_value": 17,
+     "player1_result": "win", "player1_money": 2100, "message": "Dealer: 17, Player 1 wins!"},
+    {"type": "welcome", "message": "Bienvenue à la table ♠", "encodings": ["json", "binary"], "ok": True,
+     "missing": None, "ratio": 0.5, "nested": {"a": [1, {"b": -2}]}},
+    {"type": "error", "message": "quote \" backslash \\ newline \n tab \t control \x01"},
+    {"big": 2 ** 70, "negative": -(2 ** 63)},  # Past 64 bits orjson refuses, and the stdlib takes over
+    {},
+]
+
+@pytest.fixture
+def restore():
+    yield
+    Serializer.use("orjson" if Serializer.orjson else "json")
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_backends_write_the_same_bytes(message):
+    pytest.importorskip("orjson")
+    encoded = {name: dumps(message) for name, (dumps, _) in SERIALIZERS.items()}
+    assert encoded["orjson"] == encoded["json"]
+    for _, loads in SERIALIZERS.values():
+        assert loads(encoded["json"]) == message
+        assert loads(encoded["json"].decode("utf-8")) == message
+
+def test_stdlib_output_is_compact_utf8():
+    assert json_dumps({"a": [1, 2], "b": "é"}) == '{"a":[1,2],"b":"é"}'.encode("utf-8")
+
+def test_backends_reject_the_same_bad_payloads():
+    pytest.importorskip("orjson")
+    for payload in (b"{", b"[1,]", b"nope"):
+        for _, loads in SERIALIZERS.values():
+            with pytest.raises(ValueError):  # json.JSONDecodeError and orjson.JSONDecodeError both are
+                loads(payload)
+    # orjson is stricter than the stdlib about NaN, and falls back to the stdlib's answer
+    assert json.dumps(SERIALIZERS["orjson"][1](b"[NaN]")) == "[NaN]"
+
+def test_use_switches_every_frame(restore):
+    message = MESSAGES[0]
+    frames = set()
+    for name in SERIALIZERS:
+        Serializer.use(name)
+        assert Serializer.SERIALIZER == name and Serializer.dumps is SERIALIZERS[name][0]
+        frames.add(Framing.encode_message(message))
+    assert len(frames) == 1
+
+def test_static_message_encodes_once_per_encoder():
+    calls = []
+
+    def encode(message):
+        calls.append(message)
+        return json_dumps(message)
+
+    message = StaticMessage(type="ping")
+    assert message.frame(encode) is message.frame(encode)
+    assert calls == [{"type": "ping"}] and type(calls[0]) is dict
+    message.frame(lambda plain: b"other")
+    assert len(message.frames) == 2
+
+def test_static_message_frames_match_plain_ones():
+    message = error_message("Not your turn")
+    assert message == {"type": "error", "message": "Not your turn"}
+    for encode in (Framing.encode_message, BinaryProtocol.encode_message):
+        frame = encode(message)
+        assert encode(message) is frame  # Cached
+        assert frame == encode(dict(message))
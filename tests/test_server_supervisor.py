@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import pytest
+
+from AsyncServer import MAX_TABLE_ID, NO_TABLE_IDS, ServerStats, serve, stop_server
+from Framing import HEADER, decode_message
+from ServerSupervisor import HOST, TABLES_PER_START, Supervisor, free_port, table_ids
+
+def test_worker_starts_never_share_table_ids():
+    workers = 3
+    for index in range(workers):
+        for generation in range(3):
+            first, last = table_ids(index, workers, generation)
+            assert first % workers == (index + 1) % workers  # Each worker keeps its own ids
+            assert last == first + (TABLES_PER_START - 1) * workers
+            assert last < table_ids(index, workers, generation + 1)[0]
+    assert table_ids(0, workers, 0)[0] == 1
+
+def test_table_ids_stop_at_32_bits():
+    workers = 4
+    generations = (MAX_TABLE_ID + 1) // (TABLES_PER_START * workers)
+    first, last = table_ids(workers - 1, workers, generations - 1)
+    assert last <= MAX_TABLE_ID
+    with pytest.raises(RuntimeError):
+        table_ids(0, workers, generations)
+
+async def connect(port):
+    """Connect to a server and read its first message"""
+    reader, writer = await asyncio.open_connection(HOST, port)
+    length, = HEADER.unpack(await reader.readexactly(HEADER.size))
+    message = decode_message(await reader.readexactly(length))
+    writer.close()
+    return message
+
+async def connect_after(stats, last_table_id):
+    """What a client gets from a server allowed to open tables up to last_table_id"""
+    stats.last_table_id = last_table_id
+    server = await serve(HOST, 0, stats)
+    message = await connect(server.sockets[0].getsockname()[1])
+    await stop_server(server)
+    return message
+
+def test_server_turns_clients_away_once_its_table_ids_are_used_up():
+    stats = ServerStats()
+    assert asyncio.run(connect_after(stats, 1))["type"] == "welcome"  # Table 1, the last one
+    assert not stats.out_of_table_ids
+    assert asyncio.run(connect_after(stats, 1)) == NO_TABLE_IDS
+    assert stats.out_of_table_ids and stats.next_table_id == 2
+
+def test_restarted_worker_numbers_tables_after_its_last_start():
+    supervisor = Supervisor(2, HOST, free_port())
+    supervisor.start()
+    try:
+        supervisor.processes[0].kill()
+        deadline = time.monotonic() + 10
+        while supervisor.generations[0] == 0 or 0 not in supervisor.snapshots:
+            assert time.monotonic() < deadline, "worker 0 was not restarted"
+            supervisor.collect(0.1)
+            supervisor.restart_due()
+        assert supervisor.generations == {0: 1, 1: 0}
+        assert supervisor.snapshots[0].next_table_id == table_ids(0, 2, 1)[0]
+    finally:
+        supervisor.stop()
+
+def test_worker_out_of_table_ids_is_restarted_with_the_next_block(monkeypatch):
+    import ServerSupervisor
+    monkeypatch.setattr(ServerSupervisor, "TABLES_PER_START", 1)  # Forked workers inherit it
+    supervisor = Supervisor(1, HOST, free_port())
+    supervisor.start()
+    try:
+        for expected in (1, 2):
+            # Each start opens one table, turns the next client away and exits
+            for _ in range(2):
+                asyncio.run(connect(supervisor.port))
+            deadline = time.monotonic() + 10
+            while supervisor.generations[0] < expected or 0 not in supervisor.snapshots:
+                assert time.monotonic() < deadline, "worker 0 was not restarted"
+                supervisor.collect(0.1)
+                supervisor.restart_due()
+        assert supervisor.snapshots[0].next_table_id == 3
+    finally:
+        supervisor.stop()
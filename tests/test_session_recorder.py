@@ -0,0 +1,105 @@
+import asyncio
+import zlib
+
+from AsyncServer import ServerStats, serve, stop_server
+from BankrollLog import BankrollLog, recover
+from BlackjackClient import AsyncBlackjackClient
+from SessionRecorder import CLOSED, Replay, SessionRecorder, read_sessions, replay, replay_session
+
+HOST = "127.0.0.1"
+
+async def record(path, clients, log=None, decks=0, seed=None, leave_open=False, replies=False):
+    """Play clients sessions against an in-process server recording them; returns the server's stats"""
+    stats = ServerStats()
+    recorder = SessionRecorder(path, replies)
+    server = await serve(HOST, 0, stats, decks, log, seed=seed, recorder=recorder)
+    port = server.sockets[0].getsockname()[1]
+    players = []
+    for encoding, updates in clients:
+        client = AsyncBlackjackClient(HOST, port, encoding=encoding, updates=updates)
+        await client.connect()
+        players.append(client)
+        await client.bet(25, 1)
+        await client.stand(1)
+        await client.play_round((25, 50))
+        await client.bet(10, 1)
+    if not leave_open:
+        for client in players:
+            client.close()
+        while stats.active_tables:
+            await asyncio.sleep(0.01)
+    await stop_server(server)
+    recorder.close()
+    if log:
+        log.close()
+    for client in players:
+        client.close()
+    return stats
+
+def test_replay_matches_every_reply(tmp_path):
+    path = str(tmp_path / "sessions.rec")
+    clients = [("json", "full"), ("binary", "full"), ("json", "delta"), ("binary", "delta")]
+    asyncio.run(record(path, clients, decks=2, seed=11))
+
+    sessions = read_sessions(path)
+    assert len(sessions) == 4
+    assert all(session.end == CLOSED for session in sessions)
+    result = replay(path)
+    assert result.messages > 0
+    assert result.mismatches == []
+
+def test_replay_detects_a_different_seed(tmp_path):
+    path = str(tmp_path / "sessions.rec")
+    asyncio.run(record(path, [("json", "full")], seed=11))
+
+    session = read_sessions(path)[0]
+    session.seed += 1
+    result = Replay()
+    replay_session(session, ServerStats(), result)
+    assert result.mismatches
+    assert all(difference is None for *_, difference in result.mismatches)  # Only checksums to go on
+
+def test_shutdown_keeps_open_sessions_and_tables(tmp_path):
+    path = str(tmp_path / "sessions.rec")
+    log_path = str(tmp_path / "bankroll.log")
+    asyncio.run(record(path, [("json", "full")], log=BankrollLog(log_path), leave_open=True))
+
+    # The session's last step was written before the recorder closed
+    session = read_sessions(path)[0]
+    assert session.end == CLOSED
+    assert len(session.steps) == 4
+    assert replay(path).mismatches == []
+    # ... and shutting down is not the client leaving: the table is still recoverable
+    assert recover(log_path).tables[session.table_id].in_turn()
+
+def test_recorded_replies_show_the_first_differing_bytes(tmp_path):
+    path = str(tmp_path / "sessions.rec")
+    asyncio.run(record(path, [("json", "full"), ("binary", "delta")], seed=11, replies=True))
+
+    sessions = read_sessions(path)
+    for session in sessions:
+        assert zlib.crc32(session.welcome_bytes) == session.welcome[0]
+        for _, crc, length, replies in session.steps:
+            assert (zlib.crc32(replies), len(replies)) == (crc, length)
+    assert replay(path).mismatches == []
+
+    # One byte changed in a recorded reply is found where it is
+    session = sessions[0]
+    payload, crc, length, replies = session.steps[2]
+    changed = replies[:9] + bytes([replies[9] ^ 1]) + replies[10:]
+    session.steps[2] = (payload, crc, length, changed)
+    result = Replay()
+    replay_session(session, ServerStats(), result)
+    [(table_id, step, _, _, _, (offset, recorded, replayed))] = result.mismatches
+    assert (table_id, step, offset) == (session.table_id, 3, 9)
+    assert recorded[0] == replies[9] ^ 1 and replayed == replies[9:9 + len(replayed)]
+
+    # A different seed deals other cards, and the replies part where the first card shows
+    session = read_sessions(path)[1]
+    session.seed += 1
+    result = Replay()
+    replay_session(session, ServerStats(), result)
+    assert result.mismatches
+    _, step, _, _, _, (offset, recorded, replayed) = result.mismatches[0]
+    replies = session.steps[step - 1][3]
+    assert recorded != replayed and recorded == replies[offset:offset + len(recorded)]
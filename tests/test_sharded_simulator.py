@@ -0,0 +1,34 @@
+from ShardedSimulator import (run_round_shard, shard_seeds, shard_sizes, simulate_ruin_sharded,
+                              simulate_sharded)
+from Simulator import SimulationStats
+
+def totals(stats):
+    return stats.rounds, stats.outcomes, stats.dealer_busts, stats.net, stats.net_squares
+
+def test_shard_sizes_cover_the_total():
+    assert shard_sizes(25, 10) == [10, 10, 5]
+    assert shard_sizes(20, 10) == [10, 10]
+    assert shard_sizes(3, 10) == [3]
+
+def test_seeded_totals_do_not_depend_on_the_worker_count():
+    runs = [simulate_sharded(50_000, seed=3, workers=workers, shard_rounds=12_000) for workers in (1, 2, 3)]
+    assert totals(runs[0]) == totals(runs[1]) == totals(runs[2])
+    assert runs[0].rounds == 50_000
+    assert totals(simulate_sharded(50_000, seed=4, workers=2, shard_rounds=12_000)) != totals(runs[0])
+
+    # The same as running each shard in turn in this process
+    merged = SimulationStats()
+    for size, seed in zip(shard_sizes(50_000, 12_000), shard_seeds(3, 5)):
+        merged.merge(run_round_shard(size, seed, 100, 17))
+    assert totals(merged) == totals(runs[0])
+
+def test_seeded_shoe_totals_do_not_depend_on_the_worker_count():
+    first = simulate_sharded(30_000, seed=5, workers=1, shard_rounds=10_000, decks=1)
+    second = simulate_sharded(30_000, seed=5, workers=3, shard_rounds=10_000, decks=1)
+    assert totals(first) == totals(second)
+
+def test_seeded_ruin_does_not_depend_on_the_worker_count():
+    first = simulate_ruin_sharded(300, 30, seed=6, workers=1, shard_players=100)
+    second = simulate_ruin_sharded(300, 30, seed=6, workers=2, shard_players=100)
+    assert (first.players, first.ruined, first.total) == (second.players, second.ruined, second.total)
+    assert first.players == 300
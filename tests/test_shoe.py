@@ -0,0 +1,73 @@
+import random
+from collections import Counter
+
+import numpy as np
+
+from Shoe import SUITS, Shoe, ShoeRack
+from SmartServer import CARDS
+
+def test_shoe_holds_every_card_of_its_decks():
+    for decks in (1, 6):
+        shoe = Shoe(decks, rng=random.Random(1))
+        assert len(shoe.cards) == 52 * decks and shoe.remaining() == 52 * decks
+        dealt = Counter(shoe.deal() for _ in range(52 * decks))
+        assert dealt == Counter(CARDS * SUITS * decks)
+        assert shoe.remaining() == 0 and shoe.shuffles == 1
+
+def test_shoe_reshuffles_at_the_cut_card_between_rounds():
+    shoe = Shoe(1, 0.5, rng=random.Random(2))
+    assert shoe.cut == 26
+    for _ in range(25):
+        shoe.deal()
+    shoe.start_round()
+    assert shoe.shuffles == 1 and shoe.position == 25
+    shoe.deal()
+    shoe.start_round()
+    assert shoe.shuffles == 2 and shoe.position == 0
+
+def test_shoe_reshuffles_when_empty_mid_round():
+    shoe = Shoe(1, 1.0, rng=random.Random(3))
+    for _ in range(52):
+        shoe.deal()
+    shoe.deal()
+    assert shoe.shuffles == 2 and shoe.position == 1
+
+def test_seeded_shoes_repeat():
+    first, second = Shoe(2, rng=random.Random(4)), Shoe(2, rng=random.Random(4))
+    assert [first.deal() for _ in range(300)] == [second.deal() for _ in range(300)]
+    assert list(first.cards) != list(Shoe(2, rng=random.Random(5)).cards)
+
+def test_rack_shoes_hold_every_rank():
+    rack = ShoeRack(20, 2, seed=1)
+    assert rack.cards.shape == (20, 52 * 2)
+    counts = np.apply_along_axis(np.bincount, 1, rack.cards, minlength=len(CARDS))
+    assert (counts == SUITS * 2).all()
+    # Each table's shoe is shuffled on its own
+    assert len({row.tobytes() for row in rack.cards}) == 20
+
+def test_rack_draws_and_reshuffles_per_table():
+    rack = ShoeRack(4, 1, 0.5, seed=2)
+    rows = np.arange(4)
+    shoes = rack.cards.copy()
+    dealt = np.stack([rack.draw(rows) for _ in range(25)], axis=1)
+    assert (dealt == shoes[:, :25]).all()
+
+    # Only the tables past the cut card reshuffle
+    rack.draw(rows[:2])
+    rack.start_round(rows)
+    assert rack.shuffles == 4 + 2
+    assert (rack.position == [0, 0, 25, 25]).all()
+
+    # An empty shoe reshuffles before dealing mid-round
+    rack.position[:] = 52
+    rack.draw(rows[:1])
+    assert rack.shuffles == 4 + 3 and (rack.position == [1, 52, 52, 52]).all()
+
+def test_seeded_racks_repeat():
+    rows = np.arange(10)
+    first, second = ShoeRack(10, 1, seed=7), ShoeRack(10, 1, seed=7)
+    for _ in range(200):
+        first.start_round(rows)
+        second.start_round(rows)
+        assert (first.draw(rows) == second.draw(rows)).all()
+    assert first.shuffles == second.shuffles > 10
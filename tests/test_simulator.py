@@ -0,0 +1,25 @@
+import numpy as np
+
+from Shoe import ShoeRack
+from Simulator import (CARDS, OUTCOMES, InfiniteDeck, money_changes, play_round_scalar, play_rounds,
+                       simulate)
+
+def check_against_scalar(source, rounds, stand_on=17):
+    outcomes, player, dealer = play_rounds(source, np.arange(rounds), stand_on, record=True)
+    changes = money_changes(outcomes, 10)
+    for i in range(rounds):
+        player_cards = [CARDS[rank] for rank in player.cards[i, :player.count[i]]]
+        dealer_cards = [CARDS[rank] for rank in dealer.cards[i, :dealer.count[i]]]
+        assert play_round_scalar(player_cards, dealer_cards, 10, stand_on) == (OUTCOMES[outcomes[i]], changes[i])
+
+def test_infinite_deck_outcomes_match_the_scalar_functions():
+    for stand_on in (4, 11, 12, 17, 21):
+        check_against_scalar(InfiniteDeck(3), 5000, stand_on)
+
+def test_shoe_outcomes_match_the_scalar_functions():
+    check_against_scalar(ShoeRack(2000, 1, seed=3), 2000)
+
+def test_seeded_simulation_repeats():
+    first, second = simulate(50_000, seed=9), simulate(50_000, seed=9)
+    assert first.outcomes == second.outcomes and first.net == second.net
+    assert sum(first.outcomes) == 50_000
@@ -0,0 +1,48 @@
+import pytest
+
+import StrategyTable
+from StrategyTable import HEADER, StrategyTable as Table, get_table, rules_hash
+
+@pytest.fixture(scope="module")
+def built():
+    return Table.build()
+
+@pytest.fixture
+def fresh(monkeypatch):
+    monkeypatch.setattr(StrategyTable, "_table", None)  # get_table() keeps one table per process
+
+def test_saved_table_loads_the_same(built, tmp_path):
+    path = tmp_path / "strategy_table.bin"
+    built.save(path)
+    loaded = Table.load(path)
+    assert loaded is not None
+    assert (loaded.stand_evs, loaded.hit_evs, loaded.dealer) == (built.stand_evs, built.hit_evs, built.dealer)
+    assert loaded.dealer_distribution(10) == built.dealer_distribution(10)
+    assert loaded.advise([10, 6], 10) == built.advise([10, 6], 10)
+
+def test_changed_rules_invalidate_the_cache(built, tmp_path, monkeypatch, fresh):
+    path = tmp_path / "strategy_table.bin"
+    built.save(path)
+    monkeypatch.setattr(StrategyTable, "rules_hash", lambda: b"newrules")
+    assert Table.load(path) is None
+
+    # get_table() rebuilds and saves over the stale file, which then loads again
+    monkeypatch.setattr(StrategyTable, "compute", lambda: (built.stand_evs, built.hit_evs, built.dealer))
+    assert get_table(path).stand_evs == built.stand_evs
+    assert Table.load(path) is not None
+    with open(path, "rb") as f:
+        assert HEADER.unpack(f.read(HEADER.size))[2] == b"newrules"
+
+def test_missing_or_truncated_files_are_rebuilt(built, tmp_path, fresh):
+    path = tmp_path / "strategy_table.bin"
+    assert Table.load(path) is None
+    built.save(path)
+    path.write_bytes(path.read_bytes()[:HEADER.size + 100])
+    assert Table.load(path) is None
+    assert get_table(path).hit_evs == built.hit_evs
+    assert Table.load(path).hit_evs == built.hit_evs
+
+def test_rules_hash_follows_the_rules():
+    assert rules_hash() == rules_hash()
+    assert rules_hash(dealer_stands_on=16) != rules_hash()
+    assert rules_hash(cards=[2, 3, 4, 5, 6, 7, 8, 9, 10, 11]) != rules_hash()
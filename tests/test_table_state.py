@@ -0,0 +1,87 @@
+from BinaryProtocol import decode_message, encode_payload
+from BlackjackClient import TableState
+from SmartServer import BlackjackTable
+
+def wire(message):
+    """A message as the client receives it; replies share lists the table goes on changing"""
+    return decode_message(encode_payload(message))
+
+def test_state_follows_a_table_through_many_rounds():
+    table = BlackjackTable(3, seed=6)
+    state = TableState()
+    assert state.apply(wire(table.welcome_message())) == "welcome"
+    assert (state.table, state.current_player, state.in_hand) == (3, 1, False)
+
+    rounds = 0
+    while not table.is_finished() and rounds < 60:
+        for player in (1, 2):
+            assert state.current_player == player and not state.in_hand
+            for reply in table.handle_message({"type": "bet", "amount": 100, "player": player}):
+                state.apply(wire(reply))
+            while table.in_turn():
+                assert state.in_hand and state.hand(player) == table.player_hand.to_list()
+                action = "hit" if table.player_hand.value < 16 else "stand"
+                for reply in table.handle_message({"action": action, "player": player}):
+                    state.apply(wire(reply))
+        rounds += 1
+        assert (state.player1_money, state.player2_money) == (table.player1_money, table.player2_money)
+        assert state.last_result["type"] == "result"
+        if "dealer_hand" in state.last_result:  # Not when player 2 busted
+            assert state.dealer_hand == state.last_result["dealer_hand"] and state.dealer_visible == []
+    assert state.is_finished() == table.is_finished()
+
+def test_welcome_resumes_a_hand_in_play():
+    state = TableState()
+    state.apply({"type": "welcome", "table": 9, "player1_money": 800, "player2_money": 1300,
+                 "in_play": {"player": 2, "player_hand": [10, 4], "dealer_visible": [7], "bet": 50}})
+    assert (state.player1_money, state.player2_money) == (800, 1300)
+    assert state.current_player == 2 and state.in_hand and state.bet == 50
+    assert state.hand() == [10, 4] and state.hand(1) == [] and state.dealer_visible == [7]
+    assert state.money() == 1300 and state.money(1) == 800
+
+def test_player1_stand_then_settlement():
+    state = TableState()
+    state.apply({"type": "welcome", "money": 1000})
+    state.apply({"type": "game_state", "player_hand": [10, 8], "dealer_visible": [6], "bet": 100})
+    assert state.in_hand and state.hand(1) == [10, 8] and state.bet == 100
+    state.apply({"type": "player1_done"})
+    assert state.current_player == 2 and not state.in_hand
+    state.apply({"type": "game_state", "player_hand": [9, 2], "dealer_visible": [6], "bet": 70})
+    state.apply({"type": "hit_result", "card": 9, "player_hand": [9, 2, 9]})
+    assert state.hand(2) == [9, 2, 9] and state.hand(1) == [10, 8]
+    state.apply({"type": "result", "player1_hand": [10, 8], "player2_hand": [9, 2, 9], "dealer_hand": [6, 10, 5],
+                 "player1_money": 900, "player2_money": 930})
+    assert state.current_player == 1 and not state.in_hand
+    assert (state.player1_money, state.player2_money) == (900, 930)
+    assert state.dealer_hand == [6, 10, 5] and state.dealer_visible == []
+
+def test_bust_passes_the_turn():
+    state = TableState()
+    state.apply({"type": "welcome", "money": 1000})
+    state.apply({"type": "game_state", "player_hand": [10, 6], "dealer_visible": [9], "bet": 100})
+    state.apply({"type": "result", "player_hand": [10, 6, 8], "money": 900, "result": "bust"})
+    assert state.current_player == 2 and not state.in_hand
+    assert state.hand(1) == [10, 6, 8] and state.player1_money == 900 and state.player2_money == 1000
+
+def test_game_over_and_broke_players_finish():
+    state = TableState()
+    state.apply({"type": "welcome", "money": 1000})
+    assert not state.is_finished()
+    state.player2_money = 0
+    assert state.is_finished()
+    state = TableState()
+    state.apply({"type": "welcome", "money": 1000})
+    state.apply({"type": "game_over"})
+    assert state.is_finished()
+
+def test_snapshot_replaces_the_state():
+    state = TableState()
+    state.apply({"type": "welcome", "money": 1000})
+    state.apply({"type": "game_state", "player_hand": [5, 5], "dealer_visible": [2], "bet": 10})
+    state.apply({"type": "snapshot", "seq": 12, "player1_money": 400, "player2_money": 1600, "player": 2,
+                 "player1_hand": [10, 7], "in_play": {"player_hand": [3, 4], "dealer_visible": [8], "bet": 25}})
+    assert state.seq == 12 and state.current_player == 2 and state.in_hand
+    assert state.hand(1) == [10, 7] and state.hand(2) == [3, 4] and state.bet == 25
+    state.apply({"type": "snapshot", "seq": 13, "player": 1})
+    assert state.seq == 13 and state.current_player == 1 and not state.in_hand
+    assert (state.player1_money, state.player2_money) == (400, 1600)